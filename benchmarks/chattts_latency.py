@@ -0,0 +1,68 @@
+"""
+ChatTTS 启动与单分段延迟对比：默认加载 vs compile + 预热。
+
+每种模式在独立子进程中运行（torch.compile 的状态无法在同一进程内重置），
+输出模型加载、预热、首个分段以及后续分段的耗时。
+
+    python -m benchmarks.chattts_latency --rounds 5
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+TEXTS = [
+    "你好，我是阿雅，很高兴为你服务。",
+    "大额存单的利率一般比普通定期存款高一些。",
+    "如果你想稳健理财，可以考虑国债或者货币基金。",
+]
+
+
+def run_case(compile_mode, warmup, rounds, speaker_file):
+    from src.tts import CHATTTS
+
+    start = time.perf_counter()
+    engine = CHATTTS({"output_file": "tmp/", "compile": compile_mode, "warmup": warmup,
+                      "speaker_file": speaker_file})
+    boot_s = time.perf_counter() - start
+
+    latencies = []
+    for i in range(rounds):
+        text = TEXTS[i % len(TEXTS)]
+        start = time.perf_counter()
+        engine.to_tts(text)
+        latencies.append(time.perf_counter() - start)
+    return {
+        "compile": compile_mode,
+        "warmup": warmup,
+        "boot_s": round(boot_s, 2),
+        "first_segment_s": round(latencies[0], 2),
+        "steady_p50_s": round(statistics.median(latencies[1:] or latencies), 2),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ChatTTS compile/预热 延迟对比")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--speaker_file", type=str, default="tmp/chattts_speaker.json")
+    parser.add_argument("--case", type=str, default=None, help="内部使用：compile,warmup")
+    args = parser.parse_args()
+
+    if args.case:
+        compile_mode, warmup = (v == "1" for v in args.case.split(","))
+        print(json.dumps(run_case(compile_mode, warmup, args.rounds, args.speaker_file)))
+        sys.exit(0)
+
+    results = []
+    for case in ("0,0", "1,1"):
+        out = subprocess.run([sys.executable, "-m", "benchmarks.chattts_latency", "--case", case,
+                              "--rounds", str(args.rounds), "--speaker_file", args.speaker_file],
+                             capture_output=True, text=True, check=True)
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    print(f"{'compile':>8} {'warmup':>7} {'boot_s':>8} {'first_s':>8} {'steady_p50_s':>13}")
+    for r in results:
+        print(f"{str(r['compile']):>8} {str(r['warmup']):>7} {r['boot_s']:>8} "
+              f"{r['first_segment_s']:>8} {r['steady_p50_s']:>13}")
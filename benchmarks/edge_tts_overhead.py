@@ -0,0 +1,114 @@
+"""
+EdgeTTS 单分段开销压测。
+
+启动一个本地 mock websocket 服务（模拟 edge-tts 协议：turn.start -> 音频帧 -> turn.end），
+对比旧实现（每个分段 asyncio.run 新建事件循环）与常驻事件循环实现的单分段耗时和并发吞吐。
+
+    python -m benchmarks.edge_tts_overhead --segments 50
+
+两种实现都把收到的音频写入 output_file 下的 mp3 文件，输出开销相同，差别只在事件循环的使用方式。
+依赖 requirements.txt 中的 edge_tts 和 websockets（mock 服务使用 websockets>=13 的 asyncio 接口），没有安装时提示后退出。
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import edge_tts
+    from websockets.asyncio.server import serve
+except ImportError as e:
+    print(f"缺少依赖，跳过 EdgeTTS 压测: {e}（pip install -r requirements.txt，需要 edge_tts 和 websockets>=13）")
+    sys.exit(0)
+
+from src.tts import EdgeTTS
+
+MOCK_PORT = 8765
+
+
+def _audio_frame(data):
+    headers = b"X-RequestId:mock\r\nContent-Type:audio/mpeg\r\nX-StreamId:mock\r\nPath:audio\r\n"
+    return len(headers).to_bytes(2, "big") + headers + data
+
+
+async def _mock_handler(websocket, audio_frames=4, frame_size=4096):
+    async for message in websocket:
+        if isinstance(message, str) and "Path:ssml" in message:
+            await websocket.send("X-RequestId:mock\r\nContent-Type:application/json; charset=utf-8\r\n"
+                                 "Path:turn.start\r\n\r\n{}")
+            for _ in range(audio_frames):
+                await websocket.send(_audio_frame(b"\xff" * frame_size))
+            await websocket.send("X-RequestId:mock\r\nContent-Type:application/json; charset=utf-8\r\n"
+                                 "Path:turn.end\r\n\r\n{}")
+
+
+def start_mock_server(port=MOCK_PORT):
+    ready = threading.Event()
+
+    async def main():
+        async with serve(_mock_handler, "127.0.0.1", port):
+            ready.set()
+            await asyncio.Future()
+
+    threading.Thread(target=lambda: asyncio.run(main()), daemon=True).start()
+    ready.wait()
+    return f"ws://127.0.0.1:{port}/edge/v1?TrustedClientToken=mock"
+
+
+def legacy_to_tts(engine, text):
+    """旧实现：每个分段 asyncio.run，新建并销毁事件循环；与 EdgeTTS.to_tts 一样把音频写入文件"""
+    tmpfile = engine._generate_filename(".mp3")
+
+    async def run():
+        communicate = edge_tts.Communicate(text, voice=engine.voice)
+        with open(tmpfile, "wb") as f:
+            async for chunk in communicate.stream():
+                if chunk["type"] == "audio":
+                    f.write(chunk["data"])
+    asyncio.run(run())
+    return tmpfile
+
+
+def measure(fn, texts, workers):
+    latencies = []
+
+    def timed(text):
+        start = time.perf_counter()
+        fn(text)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(timed, texts))
+    total = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "p50_ms": round(statistics.median(latencies), 2),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 2),
+        "segments_per_s": round(len(texts) / total, 2),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="EdgeTTS 单分段开销压测")
+    parser.add_argument("--segments", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--output_file", type=str, default="tmp/")
+    args = parser.parse_args()
+
+    os.makedirs(args.output_file, exist_ok=True)
+    url = start_mock_server()
+    engine = EdgeTTS({"voice": "zh-CN-XiaoxiaoNeural", "output_file": args.output_file, "wss_url": url,
+                      "max_concurrency": args.workers})
+    texts = [f"这是第{i}个测试分段。" for i in range(args.segments)]
+    # 预热
+    engine.to_tts(texts[0])
+
+    for workers in (1, args.workers):
+        print(f"workers={workers}")
+        print("  asyncio.run / 分段:", measure(lambda t: legacy_to_tts(engine, t), texts, workers))
+        print("  常驻事件循环:      ", measure(engine.to_tts, texts, workers))
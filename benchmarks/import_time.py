@@ -0,0 +1,113 @@
+"""
+启动导入耗时和内存报告。
+
+在独立子进程中用 `python -X importtime` 分别测量三种情况的导入耗时和 RSS：
+- startup：只导入 src.robot（各模块只定义类，后端依赖在创建实例时才导入）；
+- selected：再导入配置中选中的各实现依赖的第三方包（类属性 requires），即实际启动需要的部分；
+- eager：导入所有实现的依赖，相当于各模块在顶层导入全部后端时每次启动的开销。
+
+    python -m benchmarks.import_time --config config/config.yaml --top 10
+"""
+import argparse
+import importlib
+import json
+import subprocess
+import sys
+
+from src.utils import read_config
+
+# selected_module 中的类别 -> 实现所在模块
+MODULES = {
+    "Recorder": "src.recorder",
+    "ASR": "src.asr",
+    "VAD": "src.vad",
+    "LLM": "src.llm",
+    "TTS": "src.tts",
+    "THG": "src.thg",
+    "Player": "src.player",
+}
+
+# 子进程中执行：依次导入，缺少的包记录下来，最后输出峰值 RSS
+_PROBE = """
+import json, resource, sys
+missing = []
+for name in {modules!r}:
+    try:
+        __import__(name)
+    except Exception:
+        missing.append(name)
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{"missing": missing, "rss_mb": rss / 1024 / 1024 if sys.platform == "darwin" else rss / 1024}}))
+"""
+
+
+def requirements(selected=None):
+    """选中实现（为空时为全部实现）依赖的第三方包"""
+    packages = []
+    for category, module_name in MODULES.items():
+        module = importlib.import_module(module_name)
+        for name, cls in vars(module).items():
+            if not isinstance(cls, type) or cls.__module__ != module_name:
+                continue
+            if selected is not None and selected.get(category) != name:
+                continue
+            for package in getattr(cls, "requires", ()):
+                if package not in packages:
+                    packages.append(package)
+    return packages
+
+
+def parse_importtime(stderr):
+    """解析 -X importtime 输出，返回 {顶层包: 累计耗时(毫秒)}"""
+    packages = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        # 没有缩进的是顶层导入，其累计耗时已包含子模块
+        if name.startswith(" ") and not name.startswith("  "):
+            package = name.strip().split(".")[0]
+            packages[package] = packages.get(package, 0) + int(cumulative_us) / 1000
+    return packages
+
+
+def measure(modules):
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", _PROBE.format(modules=modules)],
+                            capture_output=True, text=True, check=True)
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    packages = parse_importtime(result.stderr)
+    report["import_ms"] = round(sum(packages.values()), 1)
+    report["top"] = sorted(packages.items(), key=lambda item: item[1], reverse=True)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="启动导入耗时和内存报告")
+    parser.add_argument("--config", type=str, default="config/config.yaml")
+    parser.add_argument("--top", type=int, default=10, help="列出导入最慢的包的个数")
+    parser.add_argument("--output", type=str, default=None, help="JSON 报告输出路径")
+    args = parser.parse_args()
+
+    selected = read_config(args.config)["selected_module"]
+    cases = {
+        "startup": ["src.robot"],
+        "selected": ["src.robot"] + requirements(selected),
+        "eager": ["src.robot"] + requirements(),
+    }
+    reports = {name: measure(modules) for name, modules in cases.items()}
+
+    print(f"{'case':<10} {'import_ms':>10} {'rss_mb':>8}  missing")
+    for name, report in reports.items():
+        print(f"{name:<10} {report['import_ms']:>10.0f} {report['rss_mb']:>8.0f}  {','.join(report['missing']) or '-'}")
+    saved_ms = reports["eager"]["import_ms"] - reports["selected"]["import_ms"]
+    saved_mb = reports["eager"]["rss_mb"] - reports["selected"]["rss_mb"]
+    print(f"按配置按需导入，比全部导入节省 {saved_ms:.0f}ms、{saved_mb:.0f}MB")
+    for name in ("selected", "eager"):
+        print(f"\n[{name}] 导入最慢的 {args.top} 个包")
+        for package, ms in reports[name]["top"][:args.top]:
+            print(f"  {package:<24} {ms:>8.1f}ms")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"selected_module": selected, "cases": cases, "reports": reports}, f,
+                      ensure_ascii=False, indent=2)
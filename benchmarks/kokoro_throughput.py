@@ -0,0 +1,65 @@
+"""
+Kokoro TTS 长回复吞吐压测。
+
+对比整段合成（to_tts，拼接所有分块后写一次文件）与流式合成（to_tts_stream），
+输出首块可播放时间、总合成时间、音频时长和实时率（音频秒数 / 合成秒数）。
+
+    python -m benchmarks.kokoro_throughput --repeat 3
+"""
+import argparse
+import statistics
+import time
+
+import soundfile as sf
+
+from src.tts import KOKOROTTS
+
+LONG_ANSWER = (
+    "理财的第一步是弄清楚自己的收支情况，建议先记录三个月的日常开销。\n"
+    "在此基础上预留三到六个月的生活费作为应急资金，可以放在货币基金或者活期理财里，随用随取。\n"
+    "如果你的风险承受能力比较低，可以把大部分资金配置在国债、大额存单和稳健型银行理财上，收益虽然不高，但波动很小。\n"
+    "如果能接受一定波动，可以拿出一部分资金定投指数基金，坚持三到五年，用时间平滑市场的起伏。\n"
+    "最后提醒一下，任何理财产品都要看清楚风险等级和赎回规则，不要只看宣传的预期收益率。"
+)
+
+
+def bench_file(engine, text):
+    start = time.perf_counter()
+    tmpfile = engine.to_tts(text)
+    elapsed = time.perf_counter() - start
+    info = sf.info(tmpfile)
+    return {"first_chunk_s": elapsed, "total_s": elapsed, "audio_s": info.duration}
+
+
+def bench_stream(engine, text):
+    start = time.perf_counter()
+    first_chunk = None
+    samples = 0
+    for chunk in engine.to_tts_stream(text):
+        if first_chunk is None:
+            first_chunk = time.perf_counter() - start
+        samples += len(chunk) // 2
+    return {"first_chunk_s": first_chunk, "total_s": time.perf_counter() - start,
+            "audio_s": samples / engine.sample_rate}
+
+
+def summarize(name, runs):
+    first = statistics.median(r["first_chunk_s"] for r in runs)
+    total = statistics.median(r["total_s"] for r in runs)
+    audio = runs[0]["audio_s"]
+    print(f"{name:<10} first_chunk={first:.2f}s total={total:.2f}s audio={audio:.2f}s rtf={audio / total:.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Kokoro TTS 长回复吞吐压测")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--voice", type=str, default="zm_yunyang")
+    parser.add_argument("--output_file", type=str, default="tmp/")
+    args = parser.parse_args()
+
+    engine = KOKOROTTS({"output_file": args.output_file, "lang": "z", "voice": args.voice})
+    # 预热
+    engine.to_tts("你好。")
+
+    summarize("to_tts", [bench_file(engine, LONG_ANSWER) for _ in range(args.repeat)])
+    summarize("stream", [bench_stream(engine, LONG_ANSWER) for _ in range(args.repeat)])
@@ -0,0 +1,128 @@
+"""
+生成流水线压测（benchmarks.pipeline）使用的 wav 语料，每句一个 16kHz 16bit 单声道文件。
+
+默认生成合成的类语音信号（按音节的浊音脉冲串经过元音共振峰滤波，随机数种子固定，结果可复现），
+不依赖任何模型，用于测 VAD、TTS、播放各阶段和端到端时延。ASR 识别不出文字，
+压测时改用同目录 transcripts.json 中每个文件对应的问句作为 LLM 的输入。
+仓库中的 benchmarks/corpus 即由默认参数生成：
+
+    python -m benchmarks.make_corpus --output benchmarks/corpus
+
+需要测 ASR 和真实问句时，用配置中的 TTS 引擎朗读内置问句（本地引擎如 MacTTS、KOKOROTTS 不需要网络）：
+
+    python -m benchmarks.make_corpus --output tmp/bench/corpus --tts MacTTS
+"""
+import argparse
+import json
+import os
+import wave
+
+import numpy as np
+
+from src.pcm import load_pcm, resample_linear
+
+SAMPLE_RATE = 16000
+# 语料中每个文件对应的问句，ASR 识别不出文字时压测用它作为输入
+TRANSCRIPTS_FILE = "transcripts.json"
+
+QUESTIONS = [
+    "你好，阿雅",
+    "大额存单起存金额是多少",
+    "货币基金和银行活期哪个收益高",
+    "我每个月能存三千块钱，应该怎么理财",
+    "指数基金定投需要坚持多久",
+    "国债可以提前赎回吗",
+]
+
+# 元音的前三个共振峰（Hz）
+VOWEL_FORMANTS = [
+    (800, 1200, 2500),   # a
+    (400, 2000, 2550),   # i
+    (350, 800, 2200),    # u
+    (500, 1700, 2500),   # e
+    (500, 900, 2400),    # o
+]
+
+
+def _resonator(signal, frequency, bandwidth):
+    """二阶共振滤波器"""
+    r = np.exp(-np.pi * bandwidth / SAMPLE_RATE)
+    a1 = 2 * r * np.cos(2 * np.pi * frequency / SAMPLE_RATE)
+    a2 = -r * r
+    gain = 1 - r
+    output = np.zeros_like(signal)
+    y1 = y2 = 0.0
+    for i, x in enumerate(signal):
+        y = gain * x + a1 * y1 + a2 * y2
+        output[i] = y
+        y1, y2 = y, y1
+    return output
+
+
+def _syllable(rng, duration):
+    n = int(SAMPLE_RATE * duration)
+    t = np.arange(n) / SAMPLE_RATE
+    # 基频带声调起伏和微小抖动
+    f0 = rng.uniform(140, 220) * (1 + rng.uniform(-0.15, 0.15) * t / duration) * (1 + 0.01 * rng.standard_normal(n))
+    phase = np.cumsum(f0 / SAMPLE_RATE)
+    pulses = np.diff(np.floor(phase), prepend=0.0) * 1.0
+    excitation = pulses + 0.02 * rng.standard_normal(n)
+    formants = VOWEL_FORMANTS[rng.integers(len(VOWEL_FORMANTS))]
+    voiced = sum(_resonator(excitation, f, 80 + 40 * k) / (k + 1) for k, f in enumerate(formants))
+    envelope = np.sin(np.pi * np.minimum(t / duration, 1)) ** 0.5
+    return voiced * envelope
+
+
+def synthesize(text, seed):
+    """按字数生成音节，前后各留一段静音"""
+    rng = np.random.default_rng(seed)
+    parts = [np.zeros(int(SAMPLE_RATE * 0.3))]
+    for char in text:
+        if char in "，。？！,":
+            parts.append(np.zeros(int(SAMPLE_RATE * rng.uniform(0.15, 0.25))))
+            continue
+        parts.append(_syllable(rng, rng.uniform(0.18, 0.26)))
+        parts.append(np.zeros(int(SAMPLE_RATE * rng.uniform(0.01, 0.04))))
+    parts.append(np.zeros(int(SAMPLE_RATE * 0.3)))
+    signal = np.concatenate(parts)
+    signal = signal / (np.max(np.abs(signal)) or 1) * 0.5
+    return (signal * 32767).astype(np.int16)
+
+
+def render(engine, text):
+    """用 TTS 引擎朗读，重采样到 16kHz"""
+    pcm, sample_rate = load_pcm(engine.to_tts(text))
+    return resample_linear(np.frombuffer(pcm, dtype=np.int16), sample_rate, SAMPLE_RATE)
+
+
+def write_wav(file_path, samples):
+    with wave.open(file_path, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(SAMPLE_RATE)
+        wf.writeframes(samples.tobytes())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="生成流水线压测语料")
+    parser.add_argument("--output", type=str, default="benchmarks/corpus")
+    parser.add_argument("--tts", type=str, default=None, help="用该 TTS 引擎朗读问句，默认生成合成的类语音信号")
+    parser.add_argument("--config", type=str, default="config/config.yaml")
+    args = parser.parse_args()
+
+    engine = None
+    if args.tts:
+        from src import tts
+        from src.utils import read_config
+        engine = tts.create_instance(args.tts, read_config(args.config)["TTS"][args.tts])
+
+    os.makedirs(args.output, exist_ok=True)
+    transcripts = {}
+    for i, text in enumerate(QUESTIONS):
+        samples = render(engine, text) if engine is not None else synthesize(text, seed=i)
+        file_name = f"{i:02d}.wav"
+        write_wav(os.path.join(args.output, file_name), samples)
+        transcripts[file_name] = text
+        print(f"{os.path.join(args.output, file_name)}: {len(samples) / SAMPLE_RATE:.2f} 秒 {text}")
+    with open(os.path.join(args.output, TRANSCRIPTS_FILE), "w", encoding="utf-8") as f:
+        json.dump(transcripts, f, ensure_ascii=False, indent=2)
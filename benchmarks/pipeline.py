@@ -0,0 +1,310 @@
+"""
+语音流水线端到端压测：回放 WAV 语音语料，依次经过真实的 VAD、ASR，桩LLM（或配置的LLM），
+TTS 和不出声的 NullPlayer，输出各阶段及端到端时延的 p50/p95、CPU 时间和峰值 RSS 到 JSON 文件。
+默认使用 StubLLM 和 NullTTS，不需要声卡和网络，Linux/macOS/Windows 上都能直接运行；
+要测真实引擎时用 --tts 指定（本地引擎如 KOKOROTTS、CHATTTS 不需要网络，MacTTS 只能在 macOS 上用）。
+
+语料目录下放 16bit 的 wav 文件（任意采样率，会重采样到 16kHz），每个文件一句话；
+同目录的 transcripts.json（文件名 -> 问句）给出每句的文本，ASR 识别结果为空时用它作为 LLM 的输入。
+仓库自带的 benchmarks/corpus 是 benchmarks.make_corpus 生成的合成语音，也可以用它朗读真实问句：
+
+    python -m benchmarks.pipeline --corpus benchmarks/corpus --output tmp/bench/base.json
+    python -m benchmarks.pipeline --corpus benchmarks/corpus --output tmp/bench/new.json --tts KOKOROTTS
+
+对比两次结果，时延/CPU/RSS 超过阈值的指标标记为退化，有退化时退出码为 1：
+
+    python -m benchmarks.pipeline --compare tmp/bench/base.json tmp/bench/new.json --threshold 0.1
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+
+from benchmarks.make_corpus import TRANSCRIPTS_FILE
+from src import asr, llm, player, tts, vad
+from src.pcm import PCMStream, load_pcm, resample_linear
+from src.tracing import Tracer, end_to_end_ms, percentile, summarize
+from src.tts_scheduler import TTSScheduler, scheduler_config
+from src.utils import Segmenter, read_config
+
+SAMPLE_RATE = 16000
+FRAME_SAMPLES = 512
+SYSTEM_PROMPT = "你是阿雅，专业理财顾问，回复简短、口语化。"
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return rss / 1024 / 1024 if sys.platform == "darwin" else rss / 1024
+
+
+def load_utterance(wav_file, pad_ms):
+    """读取语音并重采样到 16kHz，末尾补静音保证 VAD 能检测到说话结束，按 VAD 帧长切分"""
+    pcm, sample_rate = load_pcm(wav_file)
+    samples = resample_linear(np.frombuffer(pcm, dtype=np.int16), sample_rate, SAMPLE_RATE)
+    samples = np.concatenate([samples, np.zeros(SAMPLE_RATE * pad_ms // 1000, dtype=np.int16)])
+    return [samples[i:i + FRAME_SAMPLES].tobytes() for i in range(0, len(samples) - FRAME_SAMPLES + 1, FRAME_SAMPLES)]
+
+
+def load_transcripts(corpus):
+    """读取语料目录中的 transcripts.json（文件名 -> 问句），没有时返回空字典"""
+    file_path = os.path.join(corpus, TRANSCRIPTS_FILE)
+    if not os.path.isfile(file_path):
+        return {}
+    with open(file_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _stats(values):
+    values = [v for v in values if v is not None]
+    if not values:
+        return {"count": 0, "p50": None, "p95": None}
+    return {"count": len(values), "p50": percentile(values, 50), "p95": percentile(values, 95)}
+
+
+class PipelineBench:
+    def __init__(self, config, llm_name, tts_name, trace_file, stream):
+        selected = config["selected_module"]
+        self.vad = vad.create_instance(selected["VAD"], config["VAD"][selected["VAD"]])
+        self.asr = asr.create_instance(selected["ASR"], config["ASR"][selected["ASR"]])
+        self.llm = llm.create_instance(llm_name, config["LLM"].get(llm_name) or {})
+        self.tts = tts.create_instance(tts_name, config["TTS"][tts_name])
+        self.tts_name = tts_name
+        self.stream = stream and self.tts.supports_stream
+        self.player = player.create_instance("NullPlayer")
+        self.tracer = Tracer({"enabled": True, "trace_file": trace_file})
+        self.scheduler = TTSScheduler(scheduler_config(config.get("TTSScheduler"), tts_name, self.tts.batch_size),
+                                      self._on_ready, self._on_done)
+        self.player.on_audio_start = lambda turn_id, ts: self.tracer.mark(turn_id, "first_audio", at=ts, once=True)
+        self.vad_frame_ms = []
+        self.turn_id = 0
+
+    def _on_ready(self, job, result):
+        if isinstance(result, PCMStream):
+            self.player.play_stream(result, job.turn_id)
+        else:
+            self.player.play(result, job.turn_id)
+
+    def _on_done(self, job):
+        self.tracer.mark(job.turn_id, "tts_done", seq=job.seq,
+                         queue_ms=round(job.queue_ms, 1), synth_ms=round(job.synth_ms, 1))
+
+    def _synthesize(self, text, job):
+        if not self.stream:
+            return self.tts.to_tts(text)
+        stream = PCMStream(self.tts.sample_rate, text)
+        job.publish(stream)
+        try:
+            for chunk in self.tts.to_tts_stream(text):
+                stream.write(chunk)
+        finally:
+            stream.close()
+        return stream
+
+    def _submit(self, text, turn_id):
+        self.tracer.mark(turn_id, "first_segment", once=True)
+        self.scheduler.submit(turn_id, self.tts_name, self._synthesize, text)
+
+    def _respond(self, turn_id, query):
+        """与 Robot.chat 相同的按句切分逻辑"""
+        segmenter = Segmenter()
+        for content in self.llm.response([{"role": "system", "content": SYSTEM_PROMPT},
+                                          {"role": "user", "content": query}]):
+            self.tracer.mark(turn_id, "llm_first_token", once=True)
+            segment_text = segmenter.feed(content)
+            if segment_text is not None:
+                self._submit(segment_text, turn_id)
+        segment_text = segmenter.flush()
+        if segment_text is not None:
+            self._submit(segment_text, turn_id)
+        self.tracer.mark(turn_id, "turn_end")
+        return "".join(segmenter.tokens)
+
+    def _wait_idle(self, timeout):
+        # 调度器取出分段到交给播放器之间有一个很短的间隙，连续两次空闲才算结束
+        deadline = time.time() + timeout
+        idle = 0
+        while time.time() < deadline:
+            if self.scheduler.stats()["pending"] == 0 and not self.player.get_playing_status():
+                idle += 1
+                if idle >= 2:
+                    return True
+            else:
+                idle = 0
+            time.sleep(0.005)
+        return False
+
+    def replay(self, wav_file, pad_ms, timeout, transcript=None):
+        frames = load_utterance(wav_file, pad_ms)
+        self.vad.reset_states()
+        cpu_start = time.process_time()
+        speech = []
+        in_speech = False
+        turn_id = None
+        for frame in frames:
+            start_time = time.perf_counter()
+            vad_status = self.vad.is_vad(frame)
+            self.vad_frame_ms.append((time.perf_counter() - start_time) * 1000)
+            if in_speech:
+                speech.append(frame)
+            if vad_status is None:
+                continue
+            if "start" in vad_status and not in_speech:
+                self.turn_id += 1
+                turn_id = self.turn_id
+                self.scheduler.begin_turn(turn_id)
+                self.tracer.start_turn(turn_id)
+                in_speech = True
+                speech = [frame]
+            elif "end" in vad_status and in_speech:
+                break
+        if turn_id is None:
+            return {"file": wav_file, "error": "VAD 没有检测到语音"}
+        self.tracer.mark(turn_id, "vad_end")
+
+        text, _ = self.asr.recognizer(speech)
+        self.tracer.mark(turn_id, "asr_done")
+        # 合成语料 ASR 识别不出文字，改用语料自带的问句，保证 LLM 和 TTS 按真实问句工作
+        query = text or transcript or ""
+        reply = self._respond(turn_id, query)
+        if not self._wait_idle(timeout):
+            return {"file": wav_file, "turn_id": turn_id, "error": "等待TTS和播放超时"}
+        return {"file": wav_file, "turn_id": turn_id, "text": text, "query": query, "reply": reply,
+                "cpu_s": round(time.process_time() - cpu_start, 3)}
+
+    def shutdown(self):
+        self.scheduler.shutdown()
+        self.player.shutdown()
+
+
+def run(args):
+    config = read_config(args.config)
+    files = sorted(glob.glob(os.path.join(args.corpus, "*.wav")))
+    if not files:
+        raise SystemExit(f"语料目录中没有 wav 文件: {args.corpus}，可以用 python -m benchmarks.make_corpus 生成")
+    tts_name = config["selected_module"]["TTS"] if args.tts == "config" else args.tts
+    transcripts = load_transcripts(args.corpus)
+    trace_file = os.path.splitext(args.output)[0] + ".traces.jsonl"
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    if os.path.exists(trace_file):
+        os.remove(trace_file)
+
+    rss_before = peak_rss_mb()
+    cpu_start, wall_start = time.process_time(), time.time()
+    bench = PipelineBench(config, args.llm, tts_name, trace_file, args.stream)
+    boot_s = time.time() - wall_start
+
+    utterances = []
+    for _ in range(args.repeat):
+        for wav_file in files:
+            result = bench.replay(wav_file, args.pad_ms, args.timeout, transcripts.get(os.path.basename(wav_file)))
+            utterances.append(result)
+            print(json.dumps(result, ensure_ascii=False))
+    bench.tracer.flush()
+    bench.shutdown()
+
+    turns = {}
+    with open(trace_file, "r", encoding="utf-8") as f:
+        for line in f:
+            turn = json.loads(line)
+            turns[turn["turn_id"]] = turn
+    for result in utterances:
+        turn = turns.get(result.get("turn_id"))
+        result["e2e_ms"] = end_to_end_ms(turn) if turn else None
+
+    report = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "corpus": args.corpus,
+            "files": len(files),
+            "repeat": args.repeat,
+            "modules": {"VAD": config["selected_module"]["VAD"], "ASR": config["selected_module"]["ASR"],
+                        "LLM": args.llm, "TTS": tts_name, "Player": "NullPlayer", "stream": bench.stream},
+        },
+        "stages": summarize(trace_file),
+        "vad_frame_ms": _stats(bench.vad_frame_ms),
+        "cpu_per_utterance_s": _stats([r.get("cpu_s") for r in utterances]),
+        "boot_s": round(boot_s, 2),
+        "wall_s": round(time.time() - wall_start, 2),
+        "cpu_s": round(time.process_time() - cpu_start, 2),
+        "rss_mb": {"before_models": rss_before, "peak": peak_rss_mb()},
+        "errors": sum(1 for r in utterances if "error" in r),
+        "utterances": utterances,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print(f"{'阶段(相对vad_end)':<20} {'count':>6} {'p50_ms':>10} {'p95_ms':>10}")
+    for stage, s in report["stages"].items():
+        p50 = f"{s['p50_ms']:.0f}" if s["p50_ms"] is not None else "-"
+        p95 = f"{s['p95_ms']:.0f}" if s["p95_ms"] is not None else "-"
+        print(f"{stage:<20} {s['count']:>6} {p50:>10} {p95:>10}")
+    print(f"CPU {report['cpu_s']}s, 峰值RSS {report['rss_mb']['peak']}MB, 报告: {args.output}")
+
+
+def _metrics(report):
+    """参与对比的指标：(名称, 数值, 最小变化量)，变化量小于最小值时不算退化"""
+    metrics = []
+    for stage, s in report["stages"].items():
+        metrics.append((f"{stage}.p50_ms", s["p50_ms"], 5))
+        metrics.append((f"{stage}.p95_ms", s["p95_ms"], 5))
+    metrics.append(("vad_frame_ms.p50", report["vad_frame_ms"]["p50"], 0.05))
+    metrics.append(("cpu_per_utterance_s.p50", report["cpu_per_utterance_s"]["p50"], 0.01))
+    metrics.append(("rss_mb.peak", report["rss_mb"]["peak"], 5))
+    return metrics
+
+
+def compare(base_file, new_file, threshold):
+    with open(base_file, "r", encoding="utf-8") as f:
+        base = dict((name, (value, min_delta)) for name, value, min_delta in _metrics(json.load(f)))
+    with open(new_file, "r", encoding="utf-8") as f:
+        new = _metrics(json.load(f))
+
+    regressions = []
+    print(f"{'指标':<28} {'base':>10} {'new':>10} {'变化':>8}")
+    for name, value, min_delta in new:
+        base_value = base.get(name, (None, None))[0]
+        if value is None or base_value is None:
+            continue
+        change = (value - base_value) / base_value if base_value else 0.0
+        regressed = value > base_value * (1 + threshold) and value - base_value > min_delta
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<28} {base_value:>10.2f} {value:>10.2f} {change * 100:>7.1f}% {'退化' if regressed else ''}")
+    if regressions:
+        print(f"退化指标 {len(regressions)} 个（阈值 {threshold * 100:.0f}%）: {', '.join(regressions)}")
+    else:
+        print(f"没有超过阈值 {threshold * 100:.0f}% 的退化")
+    return not regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="语音流水线端到端压测")
+    parser.add_argument("--config", type=str, default="config/config.yaml")
+    parser.add_argument("--corpus", type=str, default="benchmarks/corpus")
+    parser.add_argument("--output", type=str, default="tmp/bench/pipeline.json")
+    parser.add_argument("--llm", type=str, default="StubLLM", help="LLM 实现，默认不访问网络的 StubLLM")
+    parser.add_argument("--tts", type=str, default="NullTTS",
+                        help="TTS 实现，默认不依赖模型和系统语音的 NullTTS；config 表示使用配置中选择的")
+    parser.add_argument("--stream", action="store_true", help="使用流式TTS（引擎支持时）")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--pad_ms", type=int, default=1000, help="每句末尾补的静音长度")
+    parser.add_argument("--timeout", type=float, default=60, help="每句等待TTS和播放结束的超时秒数")
+    parser.add_argument("--compare", type=str, nargs=2, metavar=("BASE", "NEW"), help="对比两次压测结果")
+    parser.add_argument("--threshold", type=float, default=0.1, help="对比时判定退化的相对阈值")
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(0 if compare(args.compare[0], args.compare[1], args.threshold) else 1)
+    run(args)
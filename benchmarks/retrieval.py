@@ -0,0 +1,134 @@
+"""
+RAG 检索压测：在样例语料上对比 BM25、向量检索和混合检索（BM25 + 向量，倒数排名融合）的召回率和时延。
+
+语料目录下放 markdown 文档（按段落分块），queries.jsonl 每行一个查询和它应该命中的文档：
+
+    {"query": "大额存单起存金额是多少", "source": "deposit.md"}
+
+    python -m benchmarks.retrieval --corpus benchmarks/retrieval_corpus --output tmp/bench/retrieval.json
+
+召回率为前 top_k 个分块中包含来源文档的查询比例，MRR 为第一个命中分块名次的倒数的平均值。
+向量检索使用配置中的嵌入服务；没有安装 sentence_transformers 或缺少模型时只测 BM25。
+混合检索同时统计 BM25 足够确定、跳过向量检索的查询比例。
+"""
+import argparse
+import glob
+import json
+import os
+import re
+import time
+
+import numpy as np
+
+from src import embedding
+from src.bm25 import BM25Index, hybrid_search
+from src.tracing import percentile
+from src.utils import read_config
+
+
+def load_corpus(corpus_dir):
+    """按段落（二级标题）分块，返回 {分块id: (来源文档, 文本)}"""
+    chunks = {}
+    for file_path in sorted(glob.glob(os.path.join(corpus_dir, "*.md"))):
+        source = os.path.basename(file_path)
+        with open(file_path, "r", encoding="utf-8") as f:
+            sections = [s.strip() for s in re.split(r'\n(?=## )', f.read()) if s.strip()]
+        for i, section in enumerate(sections):
+            chunks[f"{source}:{i}"] = (source, section)
+    return chunks
+
+
+def load_queries(corpus_dir):
+    with open(os.path.join(corpus_dir, "queries.jsonl"), "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class DenseIndex:
+    """内存中的向量检索，归一化向量内积即余弦相似度"""
+
+    def __init__(self, service, chunks):
+        self.service = service
+        self.ids = list(chunks)
+        self.chunks = chunks
+        self.vectors = service.encode([chunks[i][1] for i in self.ids])
+
+    def search(self, query, k):
+        scores = self.vectors @ np.asarray(self.service.embed_query(query), dtype=np.float32)
+        return [(self.ids[i], self.chunks[self.ids[i]]) for i in np.argsort(-scores)[:k]]
+
+
+def evaluate(name, search, queries, chunks, top_k):
+    latencies, hits, reciprocal_ranks, paths = [], 0, [], {}
+    for item in queries:
+        start_time = time.perf_counter()
+        results, path = search(item["query"])
+        latencies.append((time.perf_counter() - start_time) * 1000)
+        paths[path] = paths.get(path, 0) + 1
+        sources = [chunks[doc_id][0] for doc_id, _ in results[:top_k]]
+        if item["source"] in sources:
+            hits += 1
+            reciprocal_ranks.append(1 / (sources.index(item["source"]) + 1))
+        else:
+            reciprocal_ranks.append(0)
+    return {
+        "mode": name,
+        "recall": round(hits / len(queries), 3),
+        "mrr": round(sum(reciprocal_ranks) / len(queries), 3),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "paths": paths,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="RAG 检索召回率和时延")
+    parser.add_argument("--config", type=str, default="config/config.yaml")
+    parser.add_argument("--corpus", type=str, default="benchmarks/retrieval_corpus")
+    parser.add_argument("--top_k", type=int, default=None, help="默认取配置中的 Rag.top_k")
+    parser.add_argument("--output", type=str, default=None, help="JSON 报告输出路径")
+    args = parser.parse_args()
+
+    config = read_config(args.config)
+    rag_config = config["Rag"]
+    top_k = args.top_k or rag_config.get("top_k", 4)
+    rrf_k = rag_config.get("rrf_k", 60)
+    min_score = rag_config.get("lexical_min_score", 8.0)
+    margin = rag_config.get("lexical_margin", 2.0)
+
+    chunks = load_corpus(args.corpus)
+    queries = load_queries(args.corpus)
+
+    start_time = time.perf_counter()
+    bm25 = BM25Index()
+    for doc_id, (_, text) in chunks.items():
+        bm25.add(doc_id, text, chunks[doc_id])
+    bm25_build_ms = (time.perf_counter() - start_time) * 1000
+    # 预热分词器，不计入查询时延
+    bm25.search(queries[0]["query"])
+
+    reports = [evaluate("bm25", lambda q: ([(i, chunks[i]) for i, _ in bm25.search(q, top_k)], "lexical"),
+                        queries, chunks, top_k)]
+    try:
+        service = embedding.get_service(config.get("Embedding") or {"emb_model": rag_config["emb_model"]})
+        dense = DenseIndex(service, chunks)
+    except Exception as e:
+        dense = None
+        print(f"跳过向量检索: {e}")
+    if dense is not None:
+        dense.search(queries[0]["query"], top_k)
+        reports.append(evaluate("dense", lambda q: (dense.search(q, top_k), "dense"), queries, chunks, top_k))
+        reports.append(evaluate(
+            "hybrid", lambda q: hybrid_search(q, bm25, dense.search, top_k, rrf_k, min_score, margin),
+            queries, chunks, top_k))
+
+    print(f"语料 {len(chunks)} 个分块，查询 {len(queries)} 条，top_k={top_k}，BM25 建索引 {bm25_build_ms:.1f}ms")
+    print(f"{'mode':<8} {'recall':>7} {'mrr':>6} {'p50_ms':>8} {'p95_ms':>8}  paths")
+    for report in reports:
+        print(f"{report['mode']:<8} {report['recall']:>7.3f} {report['mrr']:>6.3f} "
+              f"{report['p50_ms']:>8.3f} {report['p95_ms']:>8.3f}  {report['paths']}")
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"chunks": len(chunks), "queries": len(queries), "top_k": top_k,
+                       "bm25_build_ms": round(bm25_build_ms, 1), "reports": reports}, f, ensure_ascii=False, indent=2)
@@ -2,11 +2,13 @@ from plugins.registry import register_function, ToolType
 from plugins.registry import ActionResponse, Action
 from src.rag import Rag
 
-@register_function('search_local_documents', action=ToolType.TIME_CONSUMING)
+@register_function('search_local_documents', action=ToolType.STREAM)
 def search_local_documents(keyword: str):
-    rsp = Rag().query(keyword)
-    return ActionResponse(Action.RESPONSE, None, rsp)
+    # 先检索，回答由机器人边生成边播放
+    docs, tokens = Rag().stream(keyword)
+    return ActionResponse(Action.STREAM, docs, tokens)
 
 if __name__ == "__main__":
     rsp = search_local_documents("大模型")
-    print(rsp.response, rsp.action, rsp.result)
\ No newline at end of file
+    print([doc.metadata.get("source") for doc in rsp.result], rsp.action)
+    print("".join(rsp.response))
\ No newline at end of file
@@ -24,6 +24,7 @@ class ToolType(Enum):
     SCHEDULER= (3, "定时任务，时间到了之后，直接回复")
     TIME_CONSUMING = (4, "耗时任务，需要一定时间，后台运行有结果后再回复")
     ADD_SYS_PROMPT = (5, "增加系统指定到对话历史中去")
+    STREAM = (6, "流式工具，立即返回，结果边生成边回复")
 
     def __init__(self, code, message):
         self.code = code
@@ -37,6 +38,7 @@ class Action(Enum):
     REQLLM = (3, "调用函数后再请求llm生成回复")
     ADDSYSTEM = (4, "添加系统prompt到对话中去")
     ADDSYSTEMSPEAK = (5, "添加系统prompt到对话中去&主动说话")
+    STREAM = (6, "流式回复，response 为回复文本片段的生成器")
 
     def __init__(self, code, message):
         self.code = code
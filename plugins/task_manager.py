@@ -39,15 +39,17 @@ auto_import_modules('plugins.functions')
 
 
 class TaskManager:
-    def __init__(self, config, result_queue: queue.Queue):
+    def __init__(self, config, result_queue: queue.Queue, executor=None):
         self.functions = read_json_file(config.get("functions_call_name"))
         aigc_manus_enabled = config.get("aigc_manus_enabled", "false")
         if not aigc_manus_enabled:
             self.functions = [item for item in self.functions if item["function"]["name"] != 'aigc_manus']
         self.task_queue = queue.Queue()
-        # 初始化线程池
-        self.task_executor = ThreadPoolExecutor(max_workers=10)
+        # 多会话时共用线程池，为空时自己创建
+        self.task_executor = executor or ThreadPoolExecutor(max_workers=10)
         self.result_queue = result_queue
+        # 因轮次取消而没有执行的后台任务数
+        self.cancelled_tasks = 0
 
     def get_functions(self):
         return self.functions
@@ -59,6 +61,8 @@ class TaskManager:
                     # 从队列中取出已完成的任务
                     while not self.task_queue.empty():
                         future = self.task_queue.get()
+                        if future.cancelled():
+                            continue
                         if future.done():  # 检查任务是否完成
                             result = future.result()  # 获取任务结果
                             self.result_queue.put(result)
@@ -93,12 +97,24 @@ class TaskManager:
         except Exception as e:
             return f"调用函数 '{func_name}' 时出错：{str(e)}"
 
-    def tool_call(self, func_name, func_args) -> ActionResponse:
+    def _cancel_with(self, future, cancel_token):
+        """轮次取消时，取消还没开始执行的后台任务"""
+        if cancel_token is None:
+            return
+
+        def cancel():
+            if future.cancel():
+                self.cancelled_tasks += 1
+                logger.info(f"第{cancel_token.turn_id}轮已取消，后台任务未执行")
+        cancel_token.on_cancel(cancel)
+
+    def tool_call(self, func_name, func_args, cancel_token=None) -> ActionResponse:
         if func_name not in function_registry:
             return ActionResponse(action=Action.NOTFOUND, result="没有找到相应函数", response=None)
         func = function_registry[func_name]
         if func.action == ToolType.NONE: #  = (1, "调用完工具后，啥也不用管")
             future = self.task_executor.submit(self.call_function, func_name, **func_args)
+            self._cancel_with(future, cancel_token)
             self.task_queue.put(future)
             return ActionResponse(action=Action.NONE, result=None, response=None)
         elif func.action == ToolType.WAIT: # = (2, "调用工具，等待函数返回")
@@ -109,8 +125,12 @@ class TaskManager:
             return result
         elif func.action == ToolType.TIME_CONSUMING: #  = (4, "耗时任务，需要一定时间，后台运行有结果后再回复")
             future = self.task_executor.submit(self.call_function, func_name, **func_args)
+            self._cancel_with(future, cancel_token)
             self.task_queue.put(future)
             return ActionResponse(action=Action.RESPONSE, result=None, response="您好，正在查询信息中，一会查询完我会告诉你哟")
+        elif func.action == ToolType.STREAM: # = (6, "流式工具，立即返回，结果边生成边回复")
+            result = self.call_function(func_name, **func_args)
+            return result
         elif func.action == ToolType.ADD_SYS_PROMPT: #  = (5, "增加系统指定到对话历史中去")
             result = self.call_function(func_name, **func_args)
             return result
@@ -5,9 +5,6 @@ from abc import ABC, abstractmethod
 import logging
 from datetime import datetime
 
-from funasr import AutoModel
-from funasr.utils.postprocess_utils import rich_transcription_postprocess
-
 
 logger = logging.getLogger(__name__)
 
@@ -34,10 +31,13 @@ class ASR(ABC):
 
 
 class FunASR(ASR):
+    requires = ("funasr",)
+
     def __init__(self, config):
         self.model_dir = config.get("model_dir")
         self.output_dir = config.get("output_file")
 
+        from funasr import AutoModel
         self.model = AutoModel(
             model=self.model_dir,
             vad_kwargs={"max_single_segment_time": 30000},
@@ -59,6 +59,7 @@ class FunASR(ASR):
                 batch_size_s=60,
             )
 
+            from funasr.utils.postprocess_utils import rich_transcription_postprocess
             text = rich_transcription_postprocess(res[0]["text"])
             logger.info(f"识别文本: {text}")
             return text, tmpfile
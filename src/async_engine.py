@@ -0,0 +1,261 @@
+import asyncio
+import functools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.dialogue import Message
+from src.utils import Segmenter
+
+logger = logging.getLogger(__name__)
+
+_END = object()
+
+
+class _ThreadsafeChannel:
+    """给录音线程用的 put 接口，把数据转交到事件循环里的有界队列，队列满时丢弃最旧的数据"""
+
+    def __init__(self, loop, channel):
+        self.loop = loop
+        self.channel = channel
+        self.dropped = 0
+
+    def put(self, item):
+        try:
+            self.loop.call_soon_threadsafe(self._offer, item)
+        except RuntimeError:
+            # 事件循环已经关闭
+            pass
+
+    def _offer(self, item):
+        if self.channel.full():
+            self.channel.get_nowait()
+            self.dropped += 1
+        self.channel.put_nowait(item)
+
+
+class AsyncEngine:
+    """
+    asyncio 分阶段流水线引擎：录音 -> VAD -> 分句 -> ASR -> LLM -> TTS -> 播放。
+    每个阶段是一个异步任务，阶段之间用有界队列连接；阻塞的模型调用放到各阶段独立的线程池中执行。
+    每轮回复是一个任务，打断时取消该任务，取消会传递到 LLM 生成线程和 TTS 调度器。
+    TTS 合成和播放仍由 Robot 的 TTSScheduler 和播放器完成。
+    """
+
+    def __init__(self, robot, config=None):
+        config = config or {}
+        self.robot = robot
+        self.channel_size = config.get("channel_size", 64)
+        self.idle_poll_s = config.get("idle_poll_ms", 200) / 1000
+        stage_workers = config.get("stage_workers") or {}
+        self.executors = {
+            stage: ThreadPoolExecutor(max_workers=stage_workers.get(stage, 1), thread_name_prefix=f"async-{stage}")
+            for stage in ("vad", "asr", "llm")
+        }
+        self.loop = None
+        self.turn_id = None
+        self.turn_task = None
+        self.in_speech = False
+
+    def run(self):
+        asyncio.run(self._main())
+
+    async def _main(self):
+        self.loop = asyncio.get_running_loop()
+        audio = asyncio.Queue(self.channel_size)
+        vad_events = asyncio.Queue(self.channel_size)
+        utterances = asyncio.Queue(4)
+
+        recorder_channel = _ThreadsafeChannel(self.loop, audio)
+        if self.robot.recorder is not None:
+            self.robot.recorder.start_recording(recorder_channel)
+            logger.info("Started recording.")
+        else:
+            # 多会话时音频由 feed_audio 送入
+            self.robot.audio_queue = recorder_channel
+        stages = [
+            asyncio.create_task(self._vad_stage(audio, vad_events)),
+            asyncio.create_task(self._segment_stage(vad_events, utterances)),
+            asyncio.create_task(self._asr_stage(utterances)),
+            asyncio.create_task(self._idle_stage()),
+        ]
+        try:
+            while not self.robot.stop_event.is_set():
+                await asyncio.sleep(self.idle_poll_s)
+                for task in stages:
+                    if task.done() and not task.cancelled() and task.exception() is not None:
+                        raise task.exception()
+        finally:
+            if self.turn_task is not None:
+                stages.append(self.turn_task)
+            for task in stages:
+                task.cancel()
+            await asyncio.gather(*stages, return_exceptions=True)
+            for executor in self.executors.values():
+                executor.shutdown(wait=False)
+            if recorder_channel.dropped:
+                logger.warning(f"音频队列已满，丢弃音频帧 {recorder_channel.dropped} 个")
+
+    async def _call(self, stage, fn, *args):
+        """在阶段的线程池中执行阻塞调用"""
+        return await self.loop.run_in_executor(self.executors[stage], functools.partial(fn, *args))
+
+    def _busy(self):
+        turn_running = self.turn_task is not None and not self.turn_task.done()
+        return turn_running or self.robot.player.get_playing_status()
+
+    async def _vad_stage(self, audio, vad_events):
+        while True:
+            data = await audio.get()
+            if data is None:
+                continue
+            try:
+                vad_statue = await self._call("vad", self.robot.vad.is_vad, data)
+            except Exception as e:
+                logger.error(f"VAD 处理出错: {e}")
+                continue
+            await vad_events.put({"voice": data, "vad_statue": vad_statue})
+
+    async def _segment_stage(self, vad_events, utterances):
+        """按 VAD 结果切分用户语音，说话开始时处理打断并分配轮次id，识别出文本后才开始新一轮回复"""
+        robot = self.robot
+        speech = []
+        while True:
+            data = await vad_events.get()
+            if self.in_speech:
+                speech.append(data)
+            vad_status = data.get("vad_statue")
+            if vad_status is None:
+                continue
+            if "start" in vad_status:
+                if self._busy():  # 正在回复，打断场景
+                    if not robot.INTERRUPT:
+                        continue
+                    await self._interrupt()
+                self.turn_id = robot._next_turn_id()
+                self.in_speech = True
+                speech = [data]
+            elif "end" in vad_status and speech:
+                robot.tracer.mark(self.turn_id, "vad_end")
+                logger.debug(f"语音包的长度：{len(speech)}")
+                self.in_speech = False
+                voice_data = [d["voice"] for d in speech]
+                speech = []
+                await utterances.put((self.turn_id, voice_data))
+
+    async def _asr_stage(self, utterances):
+        robot = self.robot
+        while True:
+            turn_id, voice_data = await utterances.get()
+            try:
+                text, tmpfile = await self._call("asr", robot.asr.recognizer, voice_data)
+            except Exception as e:
+                logger.error(f"ASR识别出错: {e}")
+                continue
+            if turn_id != self.turn_id:
+                logger.debug(f"第{turn_id}轮已被新一轮取代，丢弃识别结果")
+                continue
+            robot.tracer.mark(turn_id, "asr_done")
+            if not text.strip():
+                logger.debug("识别结果为空，跳过处理。")
+                continue
+            logger.debug(f"ASR识别结果: {text}")
+            if robot.callback:
+                robot.callback({"role": "user", "content": str(text)})
+            robot._begin_turn(turn_id)
+            self.turn_task = asyncio.create_task(self._respond(turn_id, text))
+
+    async def _idle_stage(self):
+        """空闲的时候，取出耗时任务的结果进行播放"""
+        robot = self.robot
+        while True:
+            await asyncio.sleep(self.idle_poll_s)
+            if robot.task_queue.empty() or self.in_speech or self._busy():
+                continue
+            result = robot.task_queue.get_nowait()
+            robot._submit_tts(result.response)
+
+    async def _interrupt(self):
+        """取消正在进行的回复任务，并停止TTS和播放"""
+        task = self.turn_task
+        if task is not None and not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        self.robot.chat_lock = False
+        await self.loop.run_in_executor(None, self.robot.interrupt_playback)
+
+    async def _stream_llm(self, dialogue):
+        """
+        在 llm 线程池中迭代 LLM 的流式输出，逐个 token 交给事件循环。
+        消费方被取消时通知生成线程在下一个 token 处停止并关闭生成器。
+        """
+        tokens = asyncio.Queue()
+        cancelled = threading.Event()
+        loop = self.loop
+
+        def produce():
+            responses = self.robot.llm.response(dialogue)
+            try:
+                for content in responses:
+                    if cancelled.is_set():
+                        break
+                    loop.call_soon_threadsafe(tokens.put_nowait, content)
+            finally:
+                close = getattr(responses, "close", None)
+                if close is not None:
+                    close()
+                loop.call_soon_threadsafe(tokens.put_nowait, _END)
+
+        future = loop.run_in_executor(self.executors["llm"], produce)
+        try:
+            while True:
+                content = await tokens.get()
+                if content is _END:
+                    break
+                yield content
+            await future
+        finally:
+            cancelled.set()
+
+    async def _respond(self, turn_id, query):
+        """一轮回复：流式生成文本，按句提交TTS。任务被取消时保存已经生成的部分"""
+        robot = self.robot
+        robot.chat_lock = True
+        try:
+            if robot.start_task_mode:
+                # 工具调用流程是同步的，整体放到 llm 线程池中执行，打断时由TTS调度器丢弃输出
+                await self._call("llm", robot.chat, query, turn_id)
+                return
+            robot.dialogue.put(Message(role="user", content=query))
+            segmenter = Segmenter()
+            response_message = segmenter.tokens
+            start_time = time.time()
+            try:
+                # 检索长期记忆需要计算向量，不在事件循环中执行
+                dialogue = await self.loop.run_in_executor(None, robot._llm_dialogue, query)
+                async for content in self._stream_llm(dialogue):
+                    robot.tracer.mark(turn_id, "llm_first_token", once=True)
+                    logger.debug(f"大模型返回时间时间: {time.time() - start_time} 秒, 生成token={content}")
+                    segment_text = segmenter.feed(content)
+                    if segment_text is not None:
+                        robot._submit_tts(segment_text, turn_id)
+                # 处理剩余的响应
+                segment_text = segmenter.flush()
+                if segment_text is not None:
+                    robot._submit_tts(segment_text, turn_id)
+            except asyncio.CancelledError:
+                robot.cancel_metrics.add("llm_streams_stopped")
+                logger.info(f"第{turn_id}轮回复被打断，已生成 {len(response_message)} 个token")
+                raise
+            except Exception as e:
+                logger.error(f"LLM 处理出错 {query}: {e}")
+            finally:
+                robot.tracer.mark(turn_id, "turn_end")
+                reply = "".join(response_message)
+                if robot.callback:
+                    robot.callback({"role": "assistant", "content": reply})
+                robot.dialogue.put(Message(role="assistant", content=reply))
+                robot.dialogue.dump_dialogue()
+        finally:
+            robot.chat_lock = False
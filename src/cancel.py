@@ -0,0 +1,65 @@
+import collections
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class CancelToken:
+    """
+    一轮对话的取消标记。轮次开始时创建，打断或新一轮开始时取消；
+    LLM 流、工具调用、分段提交、TTS 和 THG 在各自的检查点查看 cancelled 提前结束，
+    on_cancel 注册的回调（如取消后台任务的 future）在取消时执行。
+    """
+
+    def __init__(self, turn_id):
+        self.turn_id = turn_id
+        self.reason = None
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self, reason="interrupt"):
+        """取消本轮，返回是否是第一次取消"""
+        with self._lock:
+            if self._event.is_set():
+                return False
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"取消回调出错: {e}")
+        return True
+
+    def on_cancel(self, callback):
+        """注册取消时的回调，已经取消时立即执行"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+
+class CancelMetrics:
+    """统计取消避免的工作量，如提前停止的LLM流、跳过的工具调用和TTS分段"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = collections.Counter()
+
+    def add(self, name, count=1):
+        if count <= 0:
+            return
+        with self.lock:
+            self.counts[name] += count
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counts)
@@ -6,6 +6,10 @@ from src.utils import write_json_file
 
 
 class Message:
+    # 长会话中消息数量多，使用 __slots__ 减少每条消息的内存占用
+    __slots__ = ("uniq_id", "role", "content", "start_time", "end_time", "audio_file", "tts_file", "vad_status",
+                 "tool_calls", "tool_call_id")
+
     def __init__(self, role: str, content: str = None, uniq_id: str = None, start_time: datetime = None, end_time: datetime = None,
                  audio_file: str = None, tts_file: str = None, vad_status: list = None, tool_calls = None, tool_call_id=None):
         self.uniq_id = uniq_id if uniq_id is not None else str(uuid.uuid4())
@@ -19,29 +23,67 @@ class Message:
         self.tool_calls = tool_calls
         self.tool_call_id = tool_call_id
 
+    def to_llm(self) -> Dict[str, str]:
+        """转换为发送给LLM的消息格式"""
+        if self.tool_calls is not None:
+            return {"role": self.role, "tool_calls": self.tool_calls}
+        elif self.role == "tool":
+            return {"role": self.role, "tool_call_id": self.tool_call_id, "content": self.content}
+        else:
+            return {"role": self.role, "content": self.content}
+
 
 class Dialogue:
-    def __init__(self, dialogue_history_path):
+    def __init__(self, dialogue_history_path, store=None, user_id=""):
+        """
+        :param dialogue_history_path: 对话历史json文件目录，没有配置对话存储时使用
+        :param store: ConversationStore，配置后每轮只追加新增的消息
+        :param user_id: 多会话时的会话id
+        """
         self.dialogue_history_path = dialogue_history_path
         self.dialogue: List[Message] = []
+        # 发送给LLM的消息列表，随 put 增量维护，不再每次请求时全部重建
+        self.llm_dialogue: List[Dict[str, str]] = []
         # 获取当前时间
         self.current_time  = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self.store = store
+        self.user_id = user_id
+        self.session = f"dialogue-{self.current_time}"
+        # 已经写入存储的消息数
+        self.stored_count = 0
 
     def put(self, message: Message):
         self.dialogue.append(message)
+        self.llm_dialogue.append(message.to_llm())
+
+    def update_system(self, content):
+        """替换开头的系统提示词（如 memory 更新后），没有系统消息时插入到开头"""
+        if self.dialogue and self.dialogue[0].role == "system":
+            self.dialogue[0].content = content
+            # 已经发出的请求还引用着旧的 dict，这里换成新的而不是原地修改
+            self.llm_dialogue[0] = self.dialogue[0].to_llm()
+        else:
+            message = Message(role="system", content=content)
+            self.dialogue.insert(0, message)
+            self.llm_dialogue.insert(0, message.to_llm())
+            self.stored_count += 1
 
     def get_llm_dialogue(self) -> List[Dict[str, str]]:
-        dialogue = []
-        for m in self.dialogue:
-            if m.tool_calls is not None:
-                dialogue.append({"role": m.role, "tool_calls": m.tool_calls})
-            elif m.role == "tool":
-                dialogue.append({"role": m.role, "tool_call_id": m.tool_call_id, "content": m.content})
-            else:
-                dialogue.append({"role": m.role, "content": m.content})
-        return dialogue
+        """
+        返回发送给LLM的消息列表。返回的是缓存列表的浅拷贝，之后 put 的消息不会影响已经发出的请求，
+        其中的消息 dict 与缓存共享，不要修改
+        """
+        return list(self.llm_dialogue)
 
     def dump_dialogue(self):
+        if self.store is not None:
+            messages = self.dialogue[self.stored_count:]
+            self.stored_count += len(messages)
+            self.store.append_many(self.session, [
+                {"role": m.role, "content": m.content, "tool_calls": m.tool_calls, "uniq_id": m.uniq_id}
+                for m in messages if m.role in ("user", "assistant")
+            ], self.user_id)
+            return
         dialogue = []
         for d in self.get_llm_dialogue():
             if d["role"] not in ("user", "assistant"):
@@ -0,0 +1,187 @@
+import collections
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from src.tracing import percentile
+
+logger = logging.getLogger(__name__)
+
+# bge 中文模型检索时给查询加的指令
+BGE_QUERY_INSTRUCTION = "为这个句子生成表示以用于检索相关文章："
+
+# 同一模型只加载一份，RAG、长期记忆和各会话共用
+_services = {}
+_services_lock = threading.Lock()
+
+
+# 同一模型共享一份服务时必须一致的配置项，只写了 emb_model 的调用方沿用已有服务的设置
+_SHARED_OPTIONS = ("cache_file", "batch_size", "num_threads", "query_instruction")
+
+# 查询向量只缓存在内存中的条数，不写入 cache_file，避免持久缓存随查询无限增长
+QUERY_CACHE_SIZE = 1024
+
+
+def get_service(config):
+    """按模型和量化方式取共享的嵌入服务，没有时创建；已有服务的 cache_file 等设置与 config 中写明的不一致时报错"""
+    config = config or {}
+    key = (config.get("emb_model", "models/bge-small-zh"), bool(config.get("quantize_int8", False)))
+    with _services_lock:
+        if key not in _services:
+            _services[key] = EmbeddingService(config)
+            return _services[key]
+        service = _services[key]
+        conflicts = [name for name in _SHARED_OPTIONS if name in config and config[name] != service.config.get(name)]
+        if conflicts:
+            raise ValueError(f"嵌入模型 {service.model_id} 已按不同的 {', '.join(conflicts)} 创建，"
+                             f"共享同一模型的调用方需使用相同的设置")
+        return service
+
+
+class EmbeddingService:
+    """
+    bge 嵌入服务：按 batch_size 分批计算，num_threads 限制 CPU 线程数，quantize_int8 时对线性层做 int8 动态量化。
+    文档向量按（模型, 文本）的哈希缓存在 cache_file（SQLite）中，内容没变的文档重新建索引时不再计算；
+    查询向量只在内存中保留最近 QUERY_CACHE_SIZE 条。
+    提供 embed_documents / embed_query，可以直接作为 Chroma 的 embedding_function；
+    encode 返回 numpy 数组给长期记忆使用。模型在第一次需要计算时才加载。
+    """
+
+    requires = ("sentence_transformers", "torch")
+
+    def __init__(self, config):
+        self.config = dict(config)
+        self.emb_model = config.get("emb_model", "models/bge-small-zh")
+        self.batch_size = config.get("batch_size", 32)
+        self.num_threads = config.get("num_threads")
+        self.quantize_int8 = bool(config.get("quantize_int8", False))
+        self.query_instruction = config.get("query_instruction", BGE_QUERY_INSTRUCTION)
+        # 区分不同模型和量化方式的向量，用于缓存键和向量库的一致性检查
+        self.model_id = f"{self.emb_model}{'#int8' if self.quantize_int8 else ''}"
+
+        self.model = None
+        self.model_lock = threading.Lock()
+        self.cache = None
+        self.cache_lock = threading.Lock()
+        self.query_cache = collections.OrderedDict()
+        cache_file = config.get("cache_file")
+        if cache_file:
+            os.makedirs(os.path.dirname(cache_file) or ".", exist_ok=True)
+            self.cache = sqlite3.connect(cache_file, check_same_thread=False, timeout=5)
+            self.cache.execute("PRAGMA journal_mode=WAL")
+            self.cache.execute("CREATE TABLE IF NOT EXISTS vectors (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+            self.cache.commit()
+
+        self.stats_lock = threading.Lock()
+        self.query_latencies = collections.deque(maxlen=1000)
+        self.counts = collections.Counter()
+
+    def _load_model(self):
+        with self.model_lock:
+            if self.model is not None:
+                return self.model
+            start_time = time.time()
+            import torch
+            from sentence_transformers import SentenceTransformer
+            if self.num_threads:
+                torch.set_num_threads(self.num_threads)
+            model = SentenceTransformer(self.emb_model, device="cpu")
+            if self.quantize_int8:
+                # 只量化线性层，CPU 上计算更快、内存更小，向量略有误差
+                model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+            self.model = model
+            logger.info(f"嵌入模型 {self.model_id} 加载完成，耗时 {time.time() - start_time:.2f} 秒")
+            return self.model
+
+    def _key(self, text):
+        return hashlib.sha1(f"{self.model_id}\n{text}".encode("utf-8")).hexdigest()
+
+    def _cache_get(self, keys, query=False):
+        if query:
+            with self.cache_lock:
+                found = {key: self.query_cache[key] for key in keys if key in self.query_cache}
+                for key in found:
+                    self.query_cache.move_to_end(key)
+            return found
+        if self.cache is None or not keys:
+            return {}
+        found = {}
+        with self.cache_lock:
+            # SQLite 参数个数有限制，分批查询
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                rows = self.cache.execute(
+                    f"SELECT key, vector FROM vectors WHERE key IN ({', '.join('?' * len(chunk))})", chunk).fetchall()
+                found.update((key, np.frombuffer(vector, dtype=np.float32)) for key, vector in rows)
+        return found
+
+    def _cache_put(self, items, query=False):
+        if query:
+            with self.cache_lock:
+                for key, vector in items:
+                    self.query_cache[key] = vector
+                    self.query_cache.move_to_end(key)
+                while len(self.query_cache) > QUERY_CACHE_SIZE:
+                    self.query_cache.popitem(last=False)
+            return
+        if self.cache is None or not items:
+            return
+        with self.cache_lock, self.cache:
+            self.cache.executemany("INSERT OR REPLACE INTO vectors VALUES (?, ?)",
+                                   [(key, vector.astype(np.float32).tobytes()) for key, vector in items])
+
+    def encode(self, texts, query=False):
+        """计算归一化的向量，返回 (len(texts), dim) 的 float32 数组，命中缓存的文本不再计算（查询向量不写入 cache_file）"""
+        if query and self.query_instruction:
+            texts = [self.query_instruction + text for text in texts]
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        keys = [self._key(text) for text in texts]
+        vectors = self._cache_get(list(set(keys)), query)
+        missing = list(dict.fromkeys(text for text, key in zip(texts, keys) if key not in vectors))
+        if missing:
+            computed = self._load_model().encode(missing, batch_size=self.batch_size, normalize_embeddings=True,
+                                                 convert_to_numpy=True, show_progress_bar=False)
+            computed = np.asarray(computed, dtype=np.float32)
+            new_items = [(self._key(text), vector) for text, vector in zip(missing, computed)]
+            vectors.update(new_items)
+            self._cache_put(new_items, query)
+        with self.stats_lock:
+            self.counts["cache_hits"] += len(texts) - len(missing)
+            self.counts["computed"] += len(missing)
+        return np.stack([vectors[key] for key in keys])
+
+    def embed_documents(self, texts):
+        return self.encode(list(texts)).tolist()
+
+    def embed_query(self, text):
+        start_time = time.time()
+        vector = self.encode([text], query=True)[0]
+        latency_ms = (time.time() - start_time) * 1000
+        with self.stats_lock:
+            self.query_latencies.append(latency_ms)
+        logger.debug(f"查询向量耗时 {latency_ms:.1f}ms")
+        return vector.tolist()
+
+    def stats(self):
+        """查询向量时延（最近1000次）的 p50/p95 和缓存命中情况"""
+        with self.stats_lock:
+            latencies = list(self.query_latencies)
+            counts = dict(self.counts)
+        return {
+            "queries": len(latencies),
+            "query_p50_ms": round(percentile(latencies, 50), 1) if latencies else None,
+            "query_p95_ms": round(percentile(latencies, 95), 1) if latencies else None,
+            **counts,
+        }
+
+    def close(self):
+        if self.cache is not None:
+            with self.cache_lock:
+                self.cache.close()
+                self.cache = None
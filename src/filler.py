@@ -0,0 +1,92 @@
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+from src.pcm import PCMStream, load_pcm, pcm_to_wav_bytes
+
+logger = logging.getLogger(__name__)
+
+
+class FillerLibrary:
+    """
+    预渲染的应答/填充语音库。
+    启动时在后台用当前TTS音色把配置的短句合成好，以 16bit 单声道 PCM 常驻内存，
+    并按音色缓存到磁盘，重启后直接加载。耗时操作开始时可以立即播放，不再等待一次新的TTS合成。
+    """
+
+    def __init__(self, config, tts, voice_key, gate=None):
+        """
+        :param config: Filler 配置，phrases 为 {类别: [短句, ...]}
+        :param tts: 用于预渲染的TTS实例
+        :param voice_key: 音色标识（引擎名+配置），用于区分磁盘缓存
+        :param gate: TTS调度器中该引擎的并发限制（EngineGate），预渲染以低优先级与对话的分段共用
+        """
+        config = config or {}
+        self.enabled = config.get("enabled", False)
+        self.phrases = config.get("phrases") or {}
+        self.tts = tts
+        self.gate = gate
+        digest = hashlib.md5(voice_key.encode("utf-8")).hexdigest()[:12]
+        self.cache_dir = os.path.join(config.get("cache_dir", "tmp/filler/"), digest)
+        # 文本 -> (pcm_bytes, sample_rate)
+        self.clips = {}
+        self.ready = threading.Event()
+        if self.enabled:
+            threading.Thread(target=self.render_all, daemon=True).start()
+
+    @staticmethod
+    def voice_key(engine, tts_config):
+        return f"{engine}:{json.dumps(tts_config, sort_keys=True, ensure_ascii=False)}"
+
+    def _cache_file(self, text):
+        return os.path.join(self.cache_dir, hashlib.md5(text.encode("utf-8")).hexdigest() + ".wav")
+
+    def _render(self, text):
+        cache_file = self._cache_file(text)
+        if not os.path.isfile(cache_file):
+            # 低优先级：引擎没有对话的分段在合成或排队时才占用名额
+            with self.gate.idle_slot() if self.gate is not None else contextlib.nullcontext():
+                tts_file = self.tts.to_tts(text)
+            if tts_file is None:
+                raise RuntimeError("TTS合成失败")
+            pcm, sample_rate = load_pcm(tts_file)
+            with open(cache_file, "wb") as f:
+                f.write(pcm_to_wav_bytes(pcm, sample_rate))
+        return load_pcm(cache_file)
+
+    def render_all(self):
+        start_time = time.time()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        for category, texts in self.phrases.items():
+            for text in texts:
+                if text in self.clips:
+                    continue
+                try:
+                    self.clips[text] = self._render(text)
+                except Exception as e:
+                    logger.error(f"预渲染填充语音失败 [{category}] {text}: {e}")
+        self.ready.set()
+        size = sum(len(pcm) for pcm, _ in self.clips.values())
+        logger.info(f"填充语音预渲染完成: {len(self.clips)} 条, {size / 1024:.0f} KB, "
+                    f"耗时 {time.time() - start_time:.2f} 秒")
+
+    def get(self, text):
+        """按文本取预渲染好的语音，没有时返回 None"""
+        if not self.enabled or text not in self.clips:
+            return None
+        pcm, sample_rate = self.clips[text]
+        return PCMStream.from_pcm(pcm, sample_rate, text)
+
+    def pick(self, category):
+        """随机取一条某类别已渲染好的语音，没有时返回 None"""
+        if not self.enabled:
+            return None
+        texts = [text for text in self.phrases.get(category, []) if text in self.clips]
+        if not texts:
+            return None
+        return self.get(random.choice(texts))
@@ -1,6 +1,7 @@
 from abc import ABC, abstractmethod
 import json
 import re
+import time
 import requests
 import logging
 # from langchain_experimental.llms.ollama_functions import OllamaFunctions
@@ -112,6 +113,29 @@ class OllamaLLM(LLM):
         except Exception as e:
             logger.error(f"Error in response generation: {e}")
 
+class StubLLM(LLM):
+    """
+    不访问网络的桩LLM：按固定回复逐段输出，可模拟首token和每个token的延迟，用于压测和离线调试
+    """
+
+    def __init__(self, config):
+        self.reply = config.get("reply", "你好，我是阿雅。很高兴为你服务，有什么理财问题都可以问我。")
+        self.first_token_ms = config.get("first_token_ms", 0)
+        self.token_ms = config.get("token_ms", 0)
+        self.token_size = max(1, config.get("token_size", 2))
+
+    def response(self, dialogue):
+        time.sleep(self.first_token_ms / 1000)
+        for i in range(0, len(self.reply), self.token_size):
+            if i > 0:
+                time.sleep(self.token_ms / 1000)
+            yield self.reply[i:i + self.token_size]
+
+    def response_call(self, dialogue, functions_call):
+        for content in self.response(dialogue):
+            yield content, None
+
+
 def create_instance(class_name, *args, **kwargs):
     # 获取类对象
     cls = globals().get(class_name)
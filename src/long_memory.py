@@ -0,0 +1,114 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+from src import embedding
+
+logger = logging.getLogger(__name__)
+
+def estimate_tokens(text):
+    """粗略估计 token 数：中文每个字约一个 token，其余按单词计"""
+    cjk = len(re.findall(r'[\u4e00-\u9fff]', text))
+    words = len(re.findall(r'[A-Za-z0-9_]+', text))
+    return cjk + words + 1
+
+
+class LongTermMemory:
+    """
+    长期记忆索引：从每次对话中提取的事实/事件，用共享的 bge 嵌入服务计算向量后保存在 index_dir 下
+    （facts.jsonl 保存文本和来源会话，embeddings.npy 保存向量，两者按行对应）。哪些会话已经提取过由 MemoryIndex 记录。
+    每轮用户输入时检索最相关的 top_k 条，在 token_budget 内加入提示词，代替整段摘要。
+    """
+
+    def __init__(self, config, embeddings=None):
+        """
+        :param embeddings: 共享的嵌入服务（EmbeddingService），为空时按 emb_model 取共享服务
+        """
+        self.index_dir = config.get("index_dir", "tmp/long_memory")
+        self.service = embeddings or embedding.get_service({"emb_model": config.get("emb_model", "models/bge-small-zh")})
+        self.top_k = config.get("top_k", 5)
+        self.token_budget = config.get("token_budget", 300)
+        self.min_score = config.get("min_score", 0.5)
+        self.facts_file = os.path.join(self.index_dir, "facts.jsonl")
+        self.embeddings_file = os.path.join(self.index_dir, "embeddings.npy")
+
+        self.lock = threading.Lock()
+        self.facts = []
+        # 事实的向量矩阵，与 facts 按行对应
+        self.vectors = None
+        self._load()
+
+    def _load(self):
+        if not os.path.isfile(self.facts_file):
+            return
+        with open(self.facts_file, "r", encoding="utf-8") as f:
+            self.facts = [json.loads(line) for line in f if line.strip()]
+        if os.path.isfile(self.embeddings_file):
+            self.vectors = np.load(self.embeddings_file)
+        if self.facts and (self.vectors is None or len(self.vectors) != len(self.facts)):
+            logger.warning("长期记忆向量与事实条数不一致，重新计算向量")
+            self.vectors = self._embed([fact["text"] for fact in self.facts])
+            self._save(self.facts, self.vectors)
+        logger.info(f"加载长期记忆 {len(self.facts)} 条")
+
+    def _embed(self, texts):
+        return self.service.encode(texts)
+
+    def _save(self, facts, embeddings):
+        """先写临时文件再替换，中途退出不会留下不完整的文件"""
+        os.makedirs(self.index_dir, exist_ok=True)
+        with open(f"{self.facts_file}.tmp", "w", encoding="utf-8") as f:
+            for fact in facts:
+                f.write(json.dumps(fact, ensure_ascii=False) + "\n")
+        with open(f"{self.embeddings_file}.tmp", "wb") as f:
+            np.save(f, embeddings)
+        os.replace(f"{self.embeddings_file}.tmp", self.embeddings_file)
+        os.replace(f"{self.facts_file}.tmp", self.facts_file)
+
+    def add(self, session, texts):
+        """
+        写入一次对话提取的事实，返回写入的条数。
+        该会话之前的事实会被替换，对话内容变化后重新提取、或写入后没来得及记录处理状态时不会重复
+        """
+        texts = [text.strip() for text in texts if text and text.strip()]
+        now = time.time()
+        new_facts = [{"text": text, "session": session, "created_at": now} for text in texts]
+        new_embeddings = self._embed(texts) if texts else None
+        with self.lock:
+            keep = [i for i, fact in enumerate(self.facts) if fact["session"] != session]
+            if len(keep) == len(self.facts) and not new_facts:
+                return 0
+            facts = [self.facts[i] for i in keep] + new_facts
+            parts = [self.vectors[keep]] if keep else []
+            if new_embeddings is not None:
+                parts.append(new_embeddings)
+            embeddings = np.vstack(parts) if parts else np.zeros((0, 0), dtype=np.float32)
+            self._save(facts, embeddings)
+            self.facts, self.vectors = facts, embeddings
+        return len(new_facts)
+
+    def search(self, query):
+        """检索与 query 最相关的事实，按相似度从高到低，总长度不超过 token_budget"""
+        with self.lock:
+            facts, vectors = self.facts, self.vectors
+        if not facts or vectors is None or not query.strip():
+            return []
+        query_embedding = np.asarray(self.service.embed_query(query), dtype=np.float32)
+        scores = vectors @ query_embedding
+        results = []
+        budget = self.token_budget
+        for i in np.argsort(-scores)[:self.top_k]:
+            if scores[i] < self.min_score:
+                break
+            text = facts[i]["text"]
+            tokens = estimate_tokens(text)
+            if tokens > budget:
+                continue
+            budget -= tokens
+            results.append(text)
+        return results
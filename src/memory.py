@@ -3,19 +3,22 @@ import os
 import glob
 import logging
 import re
+import threading
 import requests
 
-from src.utils import read_json_file, write_json_file
+from src.utils import read_json_file
+from src.long_memory import LongTermMemory, estimate_tokens
+from src.memory_index import DialogueSource, MemoryIndex
 
 logger = logging.getLogger(__name__)
 
 memory_prompt_template = """
-你是一个对话记录员，负责提取和记录用户与助手之间的对话信息。请根据以下内容生成最新、最完整的对话摘要，突出与用户相关的有用信息，并确保摘要不超过800个字。历史对话摘要包含了之前记录的对话摘要，涉及用户的需求、偏好和关键问题。最近一次对话历史是最近的对话记录，包含用户和助手之间的具体交流内容。
+你是一个对话记录员，负责提取和记录用户与助手之间的对话信息。请根据以下内容生成最新、最完整的对话摘要，突出与用户相关的有用信息，并确保摘要不超过800个字。历史对话摘要包含了之前记录的对话摘要，涉及用户的需求、偏好和关键问题。最近的对话历史是最近的一次或几次对话记录，包含用户和助手之间的具体交流内容。
 
 # 历史对话摘要
 ${dialogue_abstract}
 
-# 最近一次对话历史
+# 最近的对话历史
 ${dialogue_history}
 
 # 输出要求
@@ -25,45 +28,210 @@ ${dialogue_history}
 - 输出对话摘要，用户对话偏好，用户对话风格，以及下次应该采取的对话策略
 """
 
+facts_prompt_template = """
+你是一个记忆整理员，负责从用户与助手的一次对话中提取值得长期记住的信息。
+
+# 对话
+${dialogue_history}
+
+# 输出要求
+- 提取关于用户的事实（身份、偏好、习惯、计划、关心的问题）和对话中发生的重要事件。
+- 每条是一句独立、完整的陈述，不依赖上下文也能看懂，不超过50个字。
+- 寒暄和没有信息量的内容不要提取，没有值得记住的信息时输出空列表。
+- 只输出 JSON 字符串数组，例如：["用户在准备雅思口语考试", "用户偏好低风险的理财产品"]
+"""
+
 class Memory:
-    def __init__(self, config):
-        file_path = config.get("dialogue_history_path")
+    def __init__(self, config, store=None, user_id="", embeddings=None):
+        """
+        :param store: ConversationStore，配置后从对话存储按会话顺序读取，否则读取json对话文件
+        :param user_id: 多会话时的会话id
+        :param embeddings: 共享的嵌入服务，长期记忆使用
+
+        启动时只读取上次保存的摘要，新对话的摘要默认在后台线程中生成（见 start）：多次对话在 token 预算内合并为一次
+        LLM 请求，每批完成后摘要和处理记录在同一个事务中写入 MemoryIndex（index_file），version 加一；
+        配置 background: false 时在这里同步生成。旧的 memory_file（json）在第一次启动时迁移到 index_file。
+
+        mode 为 summary 时把整段摘要放进系统提示词；retrieval 时从每次对话提取事实放入长期记忆索引，
+        每轮只检索相关的几条（见 recall），不再生成摘要；both 两者都用。
+        """
+        self.file_path = config.get("dialogue_history_path")
         self.memory_file = config.get("memory_file")
-        if os.path.isfile(self.memory_file):
-            self.memory = read_json_file(self.memory_file)
-        else:
-            self.memory = {"history_memory_file": [], "memory": ""}
+        self.index = MemoryIndex(config.get("index_file") or os.path.splitext(self.memory_file)[0] + ".db")
+        if os.path.isfile(self.memory_file) and self.index.get_state("memory") is None:
+            self.migrate(self.memory_file)
+        self.summary = self.index.get_state("memory", "")
 
         self.model_name = config.get("model_name")
         self.base_url = config.get("url")
+        self.store = store
+        self.user_id = user_id
+        # 一次LLM调用合并处理的对话个数上限和 token 预算（估算），单个超过预算的对话单独处理
+        self.batch_size = max(1, int(config.get("batch_size", 8)))
+        self.batch_tokens = int(config.get("batch_tokens", 6000))
+        self.background = config.get("background", True)
+        self.mode = config.get("mode", "summary")
+        self.summary_enabled = self.mode in ("summary", "both")
+        self.long_term = None
+        if self.mode in ("retrieval", "both"):
+            self.long_term = LongTermMemory(config.get("LongTerm") or {}, embeddings)
+
+        self.lock = threading.Lock()
+        self.version = 0
+        self.stop_event = threading.Event()
+        self.thread = None
+        # 不参与摘要的会话（当前正在进行的对话），会话名不带扩展名
+        self.exclude = set()
+
+        if not self.background:
+            self.refresh()
 
-        self.read_dialogues_in_order(file_path)
+    def start(self, exclude=()):
+        """
+        后台生成新对话的摘要和长期记忆，不阻塞启动；调用方通过 version 判断摘要是否有更新
+        :param exclude: 不参与摘要的会话名，如当前正在进行的对话
+        """
+        self.exclude.update(exclude)
+        if not self.background or self.thread is not None:
+            return
+        self.thread = threading.Thread(target=self.refresh, daemon=True, name="memory-summarizer")
+        self.thread.start()
 
-        write_json_file(self.memory_file, self.memory)
+    def stop(self, timeout=None):
+        """请求后台线程在当前批次结束后退出"""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def migrate(self, memory_file):
+        """把旧的 memory.json（摘要和已处理文件列表）导入 MemoryIndex"""
+        data = read_json_file(memory_file) or {}
+        names = [self.session_name(name) for name in data.get("history_memory_file", [])]
+        self.index.migrate("summary", names, {"memory": data.get("memory", "")})
+        logger.info(f"从 {memory_file} 迁移摘要和 {len(names)} 条处理记录")
+
+    def refresh(self):
+        """按时间顺序处理还没有形成 memory 的对话：摘要每批完成后写检查点，事实每次对话完成后写入索引"""
+        if self.store is not None:
+            dialogues = self.list_store_sessions(self.store, self.user_id)
+        else:
+            dialogues = self.list_dialogue_files(self.file_path)
+        if self.summary_enabled:
+            self.refresh_summary([d for d in dialogues if not self.index.is_processed("summary", d)])
+        if self.long_term is not None:
+            self.refresh_facts([d for d in dialogues if not self.index.is_processed("facts", d)])
 
+    def refresh_summary(self, pending):
+        if not pending:
+            return
+        logger.info(f"待生成摘要的对话 {len(pending)} 个，每批不超过 {self.batch_tokens} tokens")
+        batch, tokens = [], 0
+        for source in pending:
+            source_tokens = estimate_tokens(source.text)
+            if batch and (tokens + source_tokens > self.batch_tokens or len(batch) >= self.batch_size):
+                if not self.summarize_batch(batch):
+                    return
+                batch, tokens = [], 0
+            batch.append(source)
+            tokens += source_tokens
+        if batch:
+            self.summarize_batch(batch)
+
+    def summarize_batch(self, batch):
+        """一批对话合并为一次摘要请求，成功后写检查点，返回是否继续处理下一批"""
+        if self.stop_event.is_set():
+            logger.info("摘要生成已停止，剩余对话下次启动时继续处理")
+            return False
+        logger.info(f"正在处理: {[source.name for source in batch]}")
+        dialogue_history = "\n\n".join(source.text for source in batch)
+        new_memory = self.update_memory(dialogue_history)
+        if new_memory is None:
+            # 失败的批次不写检查点，下次启动时重试
+            return False
+        self.index.mark("summary", batch, {"memory": new_memory})
+        with self.lock:
+            self.summary = new_memory
+            self.version += 1
+        return True
+
+    def refresh_facts(self, pending):
+        if not pending:
+            return
+        logger.info(f"待提取长期记忆的对话 {len(pending)} 个")
+        for source in pending:
+            if self.stop_event.is_set():
+                logger.info("长期记忆提取已停止，剩余对话下次启动时继续处理")
+                return
+            facts = self.extract_facts(source.text) if source.text else []
+            if facts is None:
+                # 提取失败的对话不标记为已处理，下次启动时重试
+                continue
+            count = self.long_term.add(source.name, facts)
+            self.index.mark("facts", [source])
+            logger.info(f"{source.name} 提取长期记忆 {count} 条")
+
+    def extract_facts(self, dialogue_history):
+        """用 LLM 从一次对话中提取事实，失败时返回 None"""
+        prompt = facts_prompt_template.replace("${dialogue_history}", dialogue_history).strip()
+        content = self.ollama_chat(prompt)
+        if content is None:
+            return None
+        match = re.search(r'\[.*\]', content, flags=re.DOTALL)
+        try:
+            facts = json.loads(match.group(0)) if match else []
+        except json.JSONDecodeError as e:
+            logger.error(f"解析长期记忆出错: {e}, {content}")
+            return None
+        return [str(fact) for fact in facts if fact]
+
+    def recall(self, query):
+        """检索与本轮用户输入相关的长期记忆，返回加入提示词的文本，没有时返回空字符串"""
+        if self.long_term is None:
+            return ""
+        try:
+            facts = self.long_term.search(query)
+        except Exception as e:
+            logger.error(f"检索长期记忆出错: {e}")
+            return ""
+        if not facts:
+            return ""
+        return "# 与用户当前问题相关的历史记忆\n" + "\n".join(f"- {fact}" for fact in facts)
+
+    @staticmethod
+    def session_name(name):
+        """对话文件路径或会话名统一为不带扩展名的会话名"""
+        return os.path.splitext(os.path.basename(name))[0]
 
     def get_memory(self):
-        return self.memory["memory"]
+        """系统提示词中的历史对话摘要，retrieval 模式下为空"""
+        if not self.summary_enabled:
+            return ""
+        with self.lock:
+            return self.summary
 
-    def update_memory(self, file_name, dialogue_history):
-        memory_prompt = memory_prompt_template.replace("${dialogue_abstract}", self.memory["memory"]) \
+    def update_memory(self, dialogue_history):
+        """把一批对话合并进摘要，返回新的摘要，失败时返回 None"""
+        memory_prompt = memory_prompt_template.replace("${dialogue_abstract}", self.get_memory()) \
             .replace("${dialogue_history}", dialogue_history).strip()
-        new_memory = None
+        return self.ollama_chat(memory_prompt)
+
+    def ollama_chat(self, prompt):
+        """调用本地 ollama 服务，返回去掉思考过程和特殊字符的回答，出错时返回 None"""
         try:
             url = f"{self.base_url}/api/chat"
             data = {
                 "model": self.model_name,
-                "messages": [{"role": "user", "content": memory_prompt}],
+                "messages": [{"role": "user", "content": prompt}],
                 "stream": False
             }
             response = requests.post(url, json=data, stream=False)
             response.raise_for_status()
             response_data = response.json()
             # 使用正则表达式过滤掉<think>和</think>之间的内容
-            new_memory = re.sub(r'<think>.*?</think>', '', response_data["message"]["content"], flags=re.DOTALL)
+            content = re.sub(r'<think>.*?</think>', '', response_data["message"]["content"], flags=re.DOTALL)
 
             # 去除多余的换行符
-            new_memory = new_memory.strip()
+            content = content.strip()
             # 定义需要替换的特殊字符
             special_chars = {
                 "*": "",  # 替换为空格
@@ -74,12 +242,11 @@ class Memory:
 
             # 逐个替换特殊字符
             for char, replacement in special_chars.items():
-                new_memory = new_memory.replace(char, replacement)
+                content = content.replace(char, replacement)
+            return content
         except Exception as e:
             logger.error(f"Error in response generation: {e}")
-        if new_memory is not None:
-            self.memory["history_memory_file"].append(file_name)
-            self.memory["memory"] = new_memory
+            return None
 
     @staticmethod
     def extract_time_from_filename(filename):
@@ -111,8 +278,18 @@ class Memory:
             dialogues_str.append(role + ": " + content)
         return "\n".join(dialogues_str)
 
-    def read_dialogues_in_order(self, directory):
-        """读取指定目录下的所有对话文件，按时间顺序排列"""
+    def list_store_sessions(self, store, user_id=""):
+        """对话存储中的会话，按开始时间排序，不含 exclude 中的会话；消息数作为大小、开始时间作为修改时间"""
+        dialogues = []
+        for session, start_time, count in store.sessions(user_id):
+            if session in self.exclude:
+                continue
+            dialogues.append(DialogueSource(session, count, start_time, lambda session=session: self.dialogues_history(
+                store.messages(session, user_id, roles=("user", "assistant")))))
+        return dialogues
+
+    def list_dialogue_files(self, directory):
+        """指定目录下的对话文件，按时间排序，不含 exclude 中的会话"""
         # 获取所有符合命名规则的文件路径
         pattern = os.path.join(directory, 'dialogue-*-*-*.json')
         files = glob.glob(pattern)
@@ -120,12 +297,12 @@ class Memory:
         # 按时间排序
         files.sort(key=lambda x: self.extract_time_from_filename(os.path.basename(x)))
 
-        # 读取并打印所有对话
+        dialogues = []
         for file_path in files:
-            if file_path in self.memory["history_memory_file"]:
-                logger.info(f"{file_path} 对话历史已经形成memory")
+            name = self.session_name(file_path)
+            if name in self.exclude:
                 continue
-            logger.info(f"正在处理: {file_path}")
-            dialogues = self.read_dialogue_file(file_path)
-            dialogue_history = self.dialogues_history(dialogues)
-            self.update_memory(file_path, dialogue_history)
\ No newline at end of file
+            stat = os.stat(file_path)
+            dialogues.append(DialogueSource(name, stat.st_size, stat.st_mtime, lambda file_path=file_path: (
+                self.dialogues_history(self.read_dialogue_file(file_path)))))
+        return dialogues
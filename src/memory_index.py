@@ -0,0 +1,109 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS processed (
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER,
+    mtime REAL,
+    hash TEXT,
+    processed_at REAL NOT NULL,
+    PRIMARY KEY (kind, name)
+);
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+class DialogueSource:
+    """一次对话（对话文件或存储中的会话）：size、mtime 用于不读取内容就判断是否变化，text 读取一次后缓存"""
+    __slots__ = ("name", "size", "mtime", "_load", "_text")
+
+    def __init__(self, name, size, mtime, load):
+        self.name = name
+        self.size = size
+        self.mtime = mtime
+        self._load = load
+        self._text = None
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = self._load()
+        return self._text
+
+    @property
+    def hash(self):
+        return hashlib.sha1(self.text.encode("utf-8")).hexdigest()
+
+
+class MemoryIndex:
+    """
+    记忆的处理记录（SQLite）：每种处理（summary 摘要、facts 长期记忆）已经处理过的对话，
+    记录大小、修改时间和内容哈希；以及当前的摘要。摘要和处理记录在同一个事务中写入，
+    重启后不会重复扫描内容或重复生成摘要。
+    """
+
+    def __init__(self, db_path):
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=5)
+        self.conn.executescript(_SCHEMA)
+        self.conn.commit()
+
+    def get_state(self, key, default=None):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row is not None else default
+
+    def is_processed(self, kind, source):
+        """
+        大小和修改时间没变时直接认为已处理，不读取内容；变化时比较内容哈希，
+        内容相同只更新记录，不同则需要重新处理
+        """
+        with self.lock:
+            row = self.conn.execute("SELECT size, mtime, hash FROM processed WHERE kind = ? AND name = ?",
+                                    (kind, source.name)).fetchone()
+        if row is None:
+            return False
+        size, mtime, content_hash = row
+        if content_hash is None:
+            # 从旧的 memory.json 迁移过来的记录没有哈希，视为已处理
+            return True
+        if (size, mtime) == (source.size, source.mtime):
+            return True
+        if source.hash != content_hash:
+            return False
+        self.mark(kind, [source])
+        return True
+
+    def mark(self, kind, sources, state=None):
+        """在一个事务中记录一批已处理的对话，并更新状态（如新的摘要）"""
+        now = time.time()
+        rows = [(kind, s.name, s.size, s.mtime, s.hash, now) for s in sources]
+        with self.lock, self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO processed VALUES (?, ?, ?, ?, ?, ?)", rows)
+            for key, value in (state or {}).items():
+                self.conn.execute("INSERT OR REPLACE INTO state VALUES (?, ?)", (key, value))
+
+    def migrate(self, kind, names, state=None):
+        """导入旧的处理记录（只有名字），不会覆盖已有记录"""
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.executemany("INSERT OR IGNORE INTO processed (kind, name, processed_at) VALUES (?, ?, ?)",
+                                  [(kind, name, now) for name in names])
+            for key, value in (state or {}).items():
+                self.conn.execute("INSERT OR IGNORE INTO state VALUES (?, ?)", (key, value))
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,208 @@
+import io
+import logging
+import os
+import queue
+import struct
+import threading
+import wave
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def float_to_pcm16(audio):
+    """float32 [-1, 1] 音频转换为 16bit PCM 字节"""
+    if hasattr(audio, "detach"):  # torch.Tensor
+        audio = audio.detach().cpu().numpy()
+    audio = np.asarray(audio, dtype=np.float32).reshape(-1)
+    return (np.clip(audio, -1.0, 1.0) * 32767).astype(np.int16).tobytes()
+
+
+def pcm_to_wav_bytes(pcm_bytes, sample_rate, channels=1, sample_width=2):
+    """PCM字节加上WAV头，返回内存中的WAV文件内容"""
+    buf = io.BytesIO()
+    with wave.open(buf, 'wb') as wf:
+        wf.setnchannels(channels)
+        wf.setsampwidth(sample_width)
+        wf.setframerate(sample_rate)
+        wf.writeframes(pcm_bytes)
+    return buf.getvalue()
+
+
+def resample_linear(samples, src_rate, dst_rate):
+    """int16 单声道线性插值重采样，采样率相同时原样返回"""
+    if src_rate == dst_rate or len(samples) == 0:
+        return samples
+    n = int(round(len(samples) * dst_rate / src_rate))
+    positions = np.arange(n) * (src_rate / dst_rate)
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.int16)
+
+
+def _read_extended(data):
+    """AIFF COMM 块中的采样率：80 位 IEEE 扩展精度浮点数（大端序）"""
+    exponent, mantissa = struct.unpack(">HQ", data)
+    sign = -1 if exponent & 0x8000 else 1
+    exponent &= 0x7FFF
+    if exponent == 0 and mantissa == 0:
+        return 0.0
+    return sign * mantissa * 2.0 ** (exponent - 16383 - 63)
+
+
+def _load_aiff(audio_file):
+    """
+    macOS say 生成的 16bit 单声道 aiff，直接解析 COMM 和 SSND 块并转成小端序，避免调用 ffmpeg
+    （标准库 aifc 已弃用，Python 3.13 移除）。其他格式返回 None，由 pydub 解码
+    """
+    with open(audio_file, "rb") as f:
+        data = f.read()
+    if len(data) < 12 or data[:4] != b"FORM" or data[8:12] not in (b"AIFF", b"AIFC"):
+        raise ValueError("不是 AIFF 文件")
+    is_aifc = data[8:12] == b"AIFC"
+    comm = ssnd = None
+    pos = 12
+    while pos + 8 <= len(data):
+        chunk_id, size = struct.unpack(">4sI", data[pos:pos + 8])
+        body = data[pos + 8:pos + 8 + size]
+        if chunk_id == b"COMM":
+            comm = body
+        elif chunk_id == b"SSND":
+            ssnd = body
+        pos += 8 + size + (size & 1)  # 块长度为奇数时补一个字节
+    if comm is None or ssnd is None or len(comm) < 18 or len(ssnd) < 8:
+        raise ValueError("AIFF 文件缺少 COMM 或 SSND 块")
+    channels, frames, sample_size = struct.unpack(">hIh", comm[:8])
+    comptype = comm[18:22] if is_aifc else b"NONE"
+    if sample_size != 16 or channels != 1 or comptype not in (b"NONE", b"sowt"):
+        return None
+    offset = struct.unpack(">I", ssnd[:4])[0]
+    pcm = ssnd[8 + offset:8 + offset + frames * 2]
+    if comptype == b"NONE":  # 大端序
+        pcm = np.frombuffer(pcm, dtype=">i2").astype("<i2").tobytes()
+    return pcm, int(_read_extended(comm[8:18]))
+
+
+def load_pcm(audio_file):
+    """
+    读取音频文件为 16bit 单声道 PCM，返回 (pcm_bytes, sample_rate)。
+    已经是 16bit 单声道的 wav/aiff 直接读取，其他格式用 pydub 解码一次，结果只保存在内存中。
+    """
+    ext = os.path.splitext(audio_file)[1].lower()
+    try:
+        if ext in (".aiff", ".aif"):
+            result = _load_aiff(audio_file)
+            if result is not None:
+                return result
+        else:
+            with wave.open(audio_file, 'rb') as wf:
+                if wf.getsampwidth() == 2 and wf.getnchannels() == 1:
+                    return wf.readframes(wf.getnframes()), wf.getframerate()
+    except Exception as e:  # wave.Error、ValueError、struct.error 等
+        logger.debug(f"快速读取失败，使用pydub解码 {audio_file}: {e}")
+    from pydub import AudioSegment
+    segment = AudioSegment.from_file(audio_file).set_channels(1).set_sample_width(2)
+    return segment.raw_data, segment.frame_rate
+
+
+class PCMStream:
+    """
+    流式TTS的输出：TTS线程边合成边写入PCM块，播放线程边读边播放。
+    音频格式固定为 16bit 单声道，采样率由TTS引擎决定。
+    """
+    _END = object()
+
+    def __init__(self, sample_rate, text=None):
+        self.sample_rate = sample_rate
+        self.channels = 1
+        self.sample_width = 2
+        self.text = text
+        # 所属对话轮次，由播放方设置，用于统计每轮首次出声时间
+        self.turn_id = None
+        # 播放器开始播放该流时的回调 on_start(timestamp)，如统计填充语音的时延
+        self.on_start = None
+        self._queue = queue.Queue()
+        self._closed = threading.Event()
+
+    @classmethod
+    def from_pcm(cls, pcm_bytes, sample_rate, text=None):
+        """已经合成好的完整PCM（如预渲染的填充语音）"""
+        stream = cls(sample_rate, text)
+        stream.write(pcm_bytes)
+        stream.close()
+        return stream
+
+    def write(self, pcm_bytes):
+        if self._closed.is_set() or not pcm_bytes:
+            return
+        self._queue.put(pcm_bytes)
+
+    def close(self):
+        """合成结束（或失败）时调用，播放线程读到结束标记后退出"""
+        if not self._closed.is_set():
+            self._closed.set()
+            self._queue.put(self._END)
+
+    @property
+    def closed(self):
+        return self._closed.is_set()
+
+    def to_wav_bytes(self):
+        """读完整个流并返回WAV内容，用于不支持流式播放的播放器"""
+        return pcm_to_wav_bytes(b"".join(self), self.sample_rate, self.channels, self.sample_width)
+
+    def __iter__(self):
+        while True:
+            chunk = self._queue.get()
+            if chunk is self._END:
+                return
+            yield chunk
+
+
+class PCMRingBuffer:
+    """
+    int16 单生产者/单消费者环形缓冲区。
+    读写位置单调递增，生产者只修改 write_pos，消费者（声卡回调）只修改 read_pos，不需要加锁。
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.buffer = np.zeros(capacity, dtype=np.int16)
+        self.write_pos = 0
+        self.read_pos = 0
+
+    def available(self):
+        return self.write_pos - self.read_pos
+
+    def free(self):
+        return self.capacity - self.available()
+
+    def write(self, samples):
+        """写入尽可能多的采样点，返回实际写入的数量（生产者调用）"""
+        n = min(len(samples), self.free())
+        if n <= 0:
+            return 0
+        start = self.write_pos % self.capacity
+        first = min(n, self.capacity - start)
+        self.buffer[start:start + first] = samples[:first]
+        if n > first:
+            self.buffer[:n - first] = samples[first:n]
+        # 数据拷贝完成后再移动写位置，消费者才能看到
+        self.write_pos += n
+        return n
+
+    def read_into(self, out):
+        """读出最多 len(out) 个采样点到 out，返回实际读出的数量（消费者调用）"""
+        n = min(len(out), self.available())
+        if n <= 0:
+            return 0
+        start = self.read_pos % self.capacity
+        first = min(n, self.capacity - start)
+        out[:first] = self.buffer[start:start + first]
+        if n > first:
+            out[first:n] = self.buffer[:n - first]
+        self.read_pos += n
+        return n
+
+    def discard(self):
+        """丢弃所有未读数据（消费者调用）"""
+        self.read_pos = self.write_pos
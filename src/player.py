@@ -1,59 +1,189 @@
+import collections
+import io
 import logging
+import os
 import platform
 import queue
+import statistics
 import subprocess
+import tempfile
 import threading
+import time
 import wave
-import pyaudio
-from pydub import  AudioSegment
-import pygame
-import sounddevice as sd
 import numpy as np
-from playsound import playsound
+
+from src.pcm import PCMStream, PCMRingBuffer, load_pcm, pcm_to_wav_bytes, resample_linear
 
 
 logger = logging.getLogger(__name__)
 
+# 按轮次记录的状态只保留最近的轮次（轮次id递增）
+_KEEP_TURNS = 16
+
+
+def _prune_turns(turns, turn_id):
+    """删除早于 turn_id 超过 _KEEP_TURNS 轮的记录，turns 为集合或字典"""
+    for old in [t for t in list(turns) if t <= turn_id - _KEEP_TURNS]:
+        if isinstance(turns, dict):
+            turns.pop(old, None)
+        else:
+            turns.discard(old)
+
 
 class AbstractPlayer(object):
+    # 实现依赖的第三方包，只在创建实例时导入
+    requires = ()
+
     def __init__(self, *args, **kwargs):
         super(AbstractPlayer, self).__init__()
         self.is_playing = False
         self.play_queue = queue.Queue()
+        # 每个分段的解码耗时（毫秒）
+        self.decode_ms = collections.deque(maxlen=200)
         self._stop_event = threading.Event()
+        # 打断标记：播放循环每写一个缓冲块检查一次，保证在一个缓冲块内停止输出。
+        # 只由播放线程在开始播放新的分段时清除，入队的一方不会清除
+        self._interrupted = threading.Event()
+        # 每次打断加一，打断前入队的分段一律丢弃
+        self._generation = 0
+        # 被打断的轮次，之后才到达的该轮分段（包括已经缓冲在流中的块）不再播放
+        self._cancelled_turns = set()
+        self._current = None
+        self._stop_requested_at = None
+        self.last_stop_latency_ms = None
+        # 每轮对话开始出声时的回调 on_audio_start(turn_id, timestamp)
+        self.on_audio_start = None
+        self._started_turns = set()
         self.consumer_thread = threading.Thread(target=self._playing)
         self.consumer_thread.start()
 
-    @staticmethod
-    def to_wav(audio_file):
-        tmp_file = audio_file + ".wav"
-        wav_file = AudioSegment.from_file(audio_file)
-        wav_file.export(tmp_file, format="wav")
-        return tmp_file
-
     def _playing(self):
         while not self._stop_event.is_set():
-            data = self.play_queue.get()
+            data, turn_id, generation = self.play_queue.get()
+            if data is None:
+                # shutdown 唤醒
+                self.play_queue.task_done()
+                continue
+            # 先清除打断标记再检查是否过期：检查之后才到的打断会重新设置标记
+            self._interrupted.clear()
+            if generation != self._generation or self._is_cancelled(turn_id):
+                logger.debug(f"丢弃被打断的分段：第{turn_id}轮")
+                self.play_queue.task_done()
+                continue
             self.is_playing = True
+            self._current = data
+            self._notify_audio_start(turn_id)
+            on_start = getattr(data, "on_start", None)
+            if on_start is not None:
+                try:
+                    on_start(time.time())
+                except Exception as e:
+                    logger.error(f"on_start 回调出错: {e}")
             try:
-                self.do_playing(data)
+                if isinstance(data, PCMStream):
+                    self.do_playing_stream(data)
+                else:
+                    self.do_playing(data)
             except Exception as e:
                 logger.error(f"播放音频失败: {e}")
             finally:
+                self._current = None
                 self.play_queue.task_done()
                 self.is_playing = False
 
-    def play(self, data):
-        logger.info(f"play file {data}")
-        audio_file = self.to_wav(data)
-        self.play_queue.put(audio_file)
+    def prepare(self, audio_file):
+        """
+        播放前的准备，在调用 play 的线程中执行。默认在内存中解码一次得到PCM，
+        兼容的 wav/aiff 直接读取，不再经过 pydub 转码和写第二个 wav 文件。
+        """
+        pcm, sample_rate = load_pcm(audio_file)
+        return PCMStream.from_pcm(pcm, sample_rate, audio_file)
 
-    def stop(self):
+    def play(self, data, turn_id=None):
+        logger.info(f"play file {data}")
+        start_time = time.perf_counter()
+        item = self.prepare(data)
+        if isinstance(item, PCMStream):
+            item.turn_id = turn_id
+        decode_ms = (time.perf_counter() - start_time) * 1000
+        self.decode_ms.append(decode_ms)
+        logger.debug(f"音频解码耗时 {decode_ms:.1f}ms：{data}")
+        self._enqueue(item, turn_id)
+
+    def get_decode_stats(self):
+        """最近分段的解码耗时统计（毫秒）"""
+        if not self.decode_ms:
+            return {"count": 0, "last_ms": None, "p50_ms": None}
+        return {"count": len(self.decode_ms), "last_ms": self.decode_ms[-1],
+                "p50_ms": statistics.median(self.decode_ms)}
+
+    def play_stream(self, stream: PCMStream, turn_id=None):
+        """播放流式TTS输出，收到第一个PCM块即可开始播放"""
+        logger.info(f"play stream {stream.text}")
+        if turn_id is not None:
+            stream.turn_id = turn_id
+        self._enqueue(stream, stream.turn_id)
+
+    def _enqueue(self, item, turn_id=None):
+        self.play_queue.put((item, turn_id, self._generation))
+
+    def _is_cancelled(self, turn_id):
+        return turn_id is not None and turn_id in self._cancelled_turns
+
+    def _notify_audio_start(self, turn_id, timestamp=None):
+        """某轮对话第一次开始播放时回调，同一轮只回调一次"""
+        if turn_id is None or turn_id in self._started_turns:
+            return
+        self._started_turns.add(turn_id)
+        _prune_turns(self._started_turns, turn_id)
+        if self.on_audio_start is not None:
+            try:
+                self.on_audio_start(turn_id, timestamp if timestamp is not None else time.time())
+            except Exception as e:
+                logger.error(f"on_audio_start 回调出错: {e}")
+
+    def stop(self, turn_id=None):
+        """
+        打断：清空队列，正在播放的分段在一个缓冲块内停止。
+        :param turn_id: 被打断的轮次，该轮之后才到达的分段也不再播放
+        """
+        self._stop_requested_at = time.perf_counter()
+        if turn_id is not None:
+            self._cancelled_turns.add(turn_id)
+            _prune_turns(self._cancelled_turns, turn_id)
+        self._generation += 1
+        self._interrupted.set()
         self._clear_queue()
+        current = self._current
+        if isinstance(current, PCMStream):
+            # 结束正在读取的流，播放线程不再等待TTS的下一个块
+            current.close()
+
+    def wait_stopped(self, timeout=0.5):
+        """等待打断后输出真正停止，返回从 stop 到停止的耗时（毫秒），超时返回 None"""
+        if self._stop_requested_at is None:
+            return None
+        deadline = time.perf_counter() + timeout
+        while self.get_playing_status():
+            if time.perf_counter() > deadline:
+                return None
+            time.sleep(0.001)
+        self.last_stop_latency_ms = (time.perf_counter() - self._stop_requested_at) * 1000
+        return self.last_stop_latency_ms
+
+    def _iter_frames(self, stream: PCMStream, frames=1024):
+        """按缓冲块大小切分流中的PCM，被打断（或流所属的轮次被打断）时立即结束，流中已缓冲的块不再播放"""
+        block = frames * stream.channels * stream.sample_width
+        for data in stream:
+            for i in range(0, len(data), block):
+                if self._interrupted.is_set() or self._is_cancelled(stream.turn_id):
+                    return
+                yield data[i:i + block]
 
     def shutdown(self):
         self._clear_queue()
         self._stop_event.set()
+        self.play_queue.put((None, None, None))
         if self.consumer_thread.is_alive():
             self.consumer_thread.join()
 
@@ -69,18 +199,43 @@ class AbstractPlayer(object):
         """播放音频的具体实现，由子类实现"""
         raise NotImplementedError("Subclasses must implement do_playing")
 
+    def do_playing_stream(self, stream: PCMStream):
+        """
+        流式播放的默认实现：等流结束后写成临时wav再走 do_playing。
+        支持直接写声卡的子类应覆盖该方法，做到第一个块到达即播放。
+        """
+        fd, tmp_file = tempfile.mkstemp(suffix=".wav")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(stream.to_wav_bytes())
+            self.do_playing(tmp_file)
+        finally:
+            os.remove(tmp_file)
+
 
 class CmdPlayer(AbstractPlayer):
+    requires = ("pyaudio",)
+
     def __init__(self, *args, **kwargs):
+        import pyaudio
         super(CmdPlayer, self).__init__(*args, **kwargs)
         self.p = pyaudio.PyAudio()
 
+    def prepare(self, audio_file):
+        # afplay/play 可以直接播放 aiff/mp3/wav，无需解码
+        return audio_file
+
     def do_playing(self, audio_file):
         system = platform.system()
         cmd = ["afplay", audio_file] if system == "Darwin" else ["play", audio_file]
         logger.debug(f"Executing command: {' '.join(cmd)}")
         try:
-            subprocess.run(cmd, shell=False, universal_newlines=True)
+            process = subprocess.Popen(cmd, shell=False, universal_newlines=True)
+            while process.poll() is None:
+                if self._interrupted.is_set():
+                    process.terminate()
+                    break
+                time.sleep(0.01)
             logger.debug(f"播放完成：{audio_file}")
         except subprocess.CalledProcessError as e:
             logger.error(f"命令执行失败: {e}")
@@ -89,7 +244,10 @@ class CmdPlayer(AbstractPlayer):
 
 
 class PyaudioPlayer(AbstractPlayer):
+    requires = ("pyaudio",)
+
     def __init__(self, *args, **kwargs):
+        import pyaudio
         super(PyaudioPlayer, self).__init__(*args, **kwargs)
         self.p = pyaudio.PyAudio()
 
@@ -102,7 +260,7 @@ class PyaudioPlayer(AbstractPlayer):
                                      rate=wf.getframerate(),
                                      output=True)
                 data = wf.readframes(chunk)
-                while data:
+                while data and not self._interrupted.is_set():
                     stream.write(data)
                     data = wf.readframes(chunk)
                 stream.stop_stream()
@@ -111,40 +269,76 @@ class PyaudioPlayer(AbstractPlayer):
         except Exception as e:
             logger.error(f"播放音频失败: {e}")
 
-    def stop(self):
-        super().stop()
+    def do_playing_stream(self, stream: PCMStream):
+        output = None
+        try:
+            for data in self._iter_frames(stream):
+                if output is None:
+                    output = self.p.open(format=self.p.get_format_from_width(stream.sample_width),
+                                         channels=stream.channels,
+                                         rate=stream.sample_rate,
+                                         output=True)
+                output.write(data)
+            logger.debug(f"流式播放完成：{stream.text}")
+        except Exception as e:
+            logger.error(f"流式播放音频失败: {e}")
+        finally:
+            if output is not None:
+                output.stop_stream()
+                output.close()
+
+    def shutdown(self):
+        super().shutdown()
         if self.p:
             self.p.terminate()
 
 
 class PygamePlayer(AbstractPlayer):
+    requires = ("pygame",)
+
     def __init__(self, *args, **kwargs):
+        import pygame
+        self.pygame = pygame
         super(PygamePlayer, self).__init__(*args, **kwargs)
         pygame.mixer.init()
 
+    def prepare(self, audio_file):
+        pcm, sample_rate = load_pcm(audio_file)
+        return io.BytesIO(pcm_to_wav_bytes(pcm, sample_rate))
+
+    def do_playing_stream(self, stream: PCMStream):
+        self.do_playing(io.BytesIO(stream.to_wav_bytes()))
+
     def do_playing(self, audio_file):
         try:
-            while pygame.mixer.music.get_busy():
-                pygame.time.Clock().tick(100)
+            while self.pygame.mixer.music.get_busy():
+                self.pygame.time.Clock().tick(100)
             logger.debug("PygamePlayer 加载音频中")
-            pygame.mixer.music.load(audio_file)
+            if isinstance(audio_file, io.BytesIO):
+                self.pygame.mixer.music.load(audio_file, "wav")
+            else:
+                self.pygame.mixer.music.load(audio_file)
             logger.debug("PygamePlayer 加载音频结束，开始播放")
-            pygame.mixer.music.play()
+            self.pygame.mixer.music.play()
             logger.debug(f"播放完成：{audio_file}")
         except Exception as e:
             logger.error(f"播放音频失败: {e}")
 
     def get_playing_status(self):
         """正在播放和队列非空，为正在播放状态"""
-        return self.is_playing or (not self.play_queue.empty()) or pygame.mixer.music.get_busy()
+        return self.is_playing or (not self.play_queue.empty()) or self.pygame.mixer.music.get_busy()
 
-    def stop(self):
-        super().stop()
-        pygame.mixer.music.stop()
+    def stop(self, turn_id=None):
+        super().stop(turn_id)
+        self.pygame.mixer.music.stop()
 
 class PygameSoundPlayer(AbstractPlayer):
     """支持预加载"""
+    requires = ("pygame",)
+
     def __init__(self, *args, **kwargs):
+        import pygame
+        self.pygame = pygame
         super(PygameSoundPlayer, self).__init__(*args, **kwargs)
         pygame.mixer.init()
 
@@ -152,66 +346,237 @@ class PygameSoundPlayer(AbstractPlayer):
         try:
             logger.debug("PygameSoundPlayer 播放音频中")
             current_sound.play()  # 播放音频
-            while pygame.mixer.get_busy(): #current_sound.get_busy():  # 检查当前音频是否正在播放
-                pygame.time.Clock().tick(100)  # 每秒检查100次
+            while self.pygame.mixer.get_busy() and not self._interrupted.is_set():  # 检查当前音频是否正在播放
+                self.pygame.time.Clock().tick(100)  # 每秒检查100次
             del current_sound
             logger.debug(f"PygameSoundPlayer 播放完成")
         except Exception as e:
             logger.error(f"播放音频失败: {e}")
 
-    def play(self, data):
-        logger.info(f"play file {data}")
-        audio_file = self.to_wav(data)
-        sound = pygame.mixer.Sound(audio_file)
-        self.play_queue.put(sound)
+    def prepare(self, audio_file):
+        # 内存中的wav直接创建 Sound，pygame 负责重采样到 mixer 的格式
+        pcm, sample_rate = load_pcm(audio_file)
+        return self.pygame.mixer.Sound(file=io.BytesIO(pcm_to_wav_bytes(pcm, sample_rate)))
+
+    def do_playing_stream(self, stream: PCMStream):
+        # pygame.mixer.Sound 不支持追加数据，流结束后在内存中加载
+        sound = self.pygame.mixer.Sound(file=io.BytesIO(stream.to_wav_bytes()))
+        self.do_playing(sound)
+
+    def get_playing_status(self):
+        return self.is_playing or (not self.play_queue.empty()) or self.pygame.mixer.get_busy()
 
-    def stop(self):
-        super().stop()
+    def stop(self, turn_id=None):
+        super().stop(turn_id)
+        self.pygame.mixer.stop()
 
 
 class SoundDevicePlayer(AbstractPlayer):
+    requires = ("sounddevice",)
+
+    def __init__(self, *args, **kwargs):
+        import sounddevice as sd
+        self.sd = sd
+        super(SoundDevicePlayer, self).__init__(*args, **kwargs)
+
     def do_playing(self, audio_file):
         try:
             wf = wave.open(audio_file, 'rb')
             data = wf.readframes(wf.getnframes())
-            sd.play(np.frombuffer(data, dtype=np.int16), samplerate=wf.getframerate())
-            sd.wait()
+            self.sd.play(np.frombuffer(data, dtype=np.int16), samplerate=wf.getframerate())
+            self.sd.wait()
             logger.debug(f"播放完成：{audio_file}")
         except Exception as e:
             logger.error(f"播放音频失败: {e}")
 
-    def stop(self):
-        super().stop()
-        sd.stop()
+    def do_playing_stream(self, stream: PCMStream):
+        try:
+            with self.sd.RawOutputStream(samplerate=stream.sample_rate,
+                                         channels=stream.channels,
+                                         dtype='int16') as output:
+                for data in self._iter_frames(stream):
+                    output.write(data)
+            logger.debug(f"流式播放完成：{stream.text}")
+        except Exception as e:
+            logger.error(f"流式播放音频失败: {e}")
+
+    def stop(self, turn_id=None):
+        super().stop(turn_id)
+        self.sd.stop()
 
 
 class PydubPlayer(AbstractPlayer):
+    requires = ("pydub",)
+
+    def prepare(self, audio_file):
+        return audio_file
+
     def do_playing(self, audio_file):
         try:
+            from pydub import AudioSegment
             audio = AudioSegment.from_file(audio_file)
             audio.play()
             logger.debug(f"播放完成：{audio_file}")
         except Exception as e:
             logger.error(f"播放音频失败: {e}")
 
-    def stop(self):
-        super().stop()
+    def stop(self, turn_id=None):
+        super().stop(turn_id)
         # Pydub does not provide a stop method
 
 
 class PlaysoundPlayer(AbstractPlayer):
+    requires = ("playsound",)
+
+    def prepare(self, audio_file):
+        return audio_file
+
     def do_playing(self, audio_file):
         try:
+            from playsound import playsound
             playsound(audio_file)
             logger.debug(f"播放完成：{audio_file}")
         except Exception as e:
             logger.error(f"播放音频失败: {e}")
 
-    def stop(self):
-        super().stop()
+    def stop(self, turn_id=None):
+        super().stop(turn_id)
         # playsound does not provide a stop method
 
 
+class GaplessPlayer(AbstractPlayer):
+    """
+    无缝连续播放：整个生命周期只打开一个输出流，声卡回调从环形缓冲区取PCM。
+    各分段（统一重采样到输出采样率）按采样点首尾相接写入缓冲区，分段之间没有开关流和轮询带来的间隙。
+    统计欠载次数，并记录每轮对话第一个采样点真正送到声卡的时间。
+    """
+
+    requires = ("sounddevice",)
+
+    def __init__(self, config=None, *args, **kwargs):
+        config = config or {}
+        self.sample_rate = config.get("sample_rate", 24000)
+        self.blocksize = config.get("blocksize", 480)  # 每次回调的采样点数，24kHz 下为 20ms
+        self.ring = PCMRingBuffer(int(self.sample_rate * config.get("buffer_seconds", 10)))
+        self.underruns = 0
+        # 正在向缓冲区写入分段，此时缓冲区读空算欠载
+        self._feeding = False
+        # (缓冲区位置, 轮次id)，回调读过该位置时记录出声时间
+        self._turn_markers = collections.deque()
+        self._marked_turns = set()
+        self.turn_started = {}
+        # 一次性的丢弃标记：stop 设置，声卡回调清空缓冲区后清除，入队的一方不会清除
+        self._discard = threading.Event()
+        self._writing_turn = None
+        super(GaplessPlayer, self).__init__(*args, **kwargs)
+        self._out = np.zeros(self.blocksize, dtype=np.int16)
+        import sounddevice as sd
+        self.stream = sd.RawOutputStream(samplerate=self.sample_rate, blocksize=self.blocksize,
+                                         channels=1, dtype='int16', callback=self._callback)
+        self.stream.start()
+
+    def _callback(self, outdata, frames, time_info, status):
+        if self._discard.is_set():
+            # 被打断：丢弃缓冲区内未播放的数据，最多再输出当前这一个块
+            self.ring.discard()
+            self._turn_markers.clear()
+            self._discard.clear()
+        out = self._out if frames == len(self._out) else np.zeros(frames, dtype=np.int16)
+        start_pos = self.ring.read_pos
+        n = self.ring.read_into(out)
+        if n < frames:
+            out[n:] = 0
+            if self._feeding:
+                self.underruns += 1
+        # 该块在声卡上真正开始播放的时间
+        while self._turn_markers and self._turn_markers[0][0] < start_pos + n:
+            position, turn_id = self._turn_markers.popleft()
+            latency = time_info.outputBufferDacTime - time_info.currentTime
+            offset = max(position - start_pos, 0) / self.sample_rate
+            self.turn_started[turn_id] = time.time() + max(latency, 0) + offset
+            self._notify_audio_start(turn_id, self.turn_started[turn_id])
+        outdata[:] = out.tobytes()
+
+    def _write(self, samples):
+        """写入缓冲区，缓冲区满时等待声卡消费"""
+        written = 0
+        while written < len(samples):
+            if self._interrupted.is_set() or self._stop_event.is_set() or self._is_cancelled(self._writing_turn):
+                return False
+            n = self.ring.write(samples[written:])
+            written += n
+            if n == 0:
+                time.sleep(self.blocksize / self.sample_rate / 2)
+        return True
+
+    def _notify_audio_start(self, turn_id, timestamp=None):
+        # 出声时间由声卡回调根据 outputBufferDacTime 计算，写入缓冲区时不算开始播放
+        if timestamp is not None:
+            super()._notify_audio_start(turn_id, timestamp)
+
+    def do_playing_stream(self, stream: PCMStream):
+        # 等声卡回调处理完上一次打断的丢弃，新分段写入的数据不会被一起清掉
+        deadline = time.time() + 0.5
+        while self._discard.is_set() and time.time() < deadline and not self._stop_event.is_set():
+            time.sleep(self.blocksize / self.sample_rate / 2)
+        self._writing_turn = stream.turn_id
+        self._feeding = True
+        try:
+            for data in stream:
+                samples = resample_linear(np.frombuffer(data, dtype=np.int16), stream.sample_rate, self.sample_rate)
+                if stream.turn_id is not None and stream.turn_id not in self._marked_turns:
+                    self._marked_turns.add(stream.turn_id)
+                    self._turn_markers.append((self.ring.write_pos, stream.turn_id))
+                    _prune_turns(self._marked_turns, stream.turn_id)
+                    _prune_turns(self.turn_started, stream.turn_id)
+                if not self._write(samples):
+                    break
+            logger.debug(f"写入播放缓冲区完成：{stream.text}")
+        finally:
+            self._feeding = False
+
+    def do_playing(self, audio_file):
+        pcm, sample_rate = load_pcm(audio_file)
+        self.do_playing_stream(PCMStream.from_pcm(pcm, sample_rate, audio_file))
+
+    def get_playing_status(self):
+        """正在播放和队列非空，或者缓冲区还有未播放的数据，为正在播放状态"""
+        return self.is_playing or (not self.play_queue.empty()) or self.ring.available() > 0
+
+    def get_turn_start(self, turn_id):
+        """该轮对话第一个采样点送到声卡的时间（time.time()），还没出声时返回 None"""
+        return self.turn_started.get(turn_id)
+
+    def stop(self, turn_id=None):
+        # 由声卡回调清空缓冲区，保证只有消费者修改读位置
+        self._discard.set()
+        super().stop(turn_id)
+
+    def shutdown(self):
+        super().shutdown()
+        self.stream.stop()
+        self.stream.close()
+
+
+class NullPlayer(AbstractPlayer):
+    """
+    不输出声音的播放器，用于压测和没有声卡的环境：照常解码和按缓冲块消费PCM，
+    不占用实时时间，统计“播放”的音频时长
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(NullPlayer, self).__init__(*args, **kwargs)
+        self.played_seconds = 0.0
+
+    def do_playing(self, audio_file):
+        self.do_playing_stream(self.prepare(audio_file))
+
+    def do_playing_stream(self, stream: PCMStream):
+        bytes_per_second = stream.sample_rate * stream.channels * stream.sample_width
+        for data in self._iter_frames(stream):
+            self.played_seconds += len(data) / bytes_per_second
+
+
 def create_instance(class_name, *args, **kwargs):
     # 获取类对象
     cls = globals().get(class_name)
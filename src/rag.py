@@ -1,14 +1,17 @@
+import glob
+import hashlib
+import json
 import logging
-from langchain.embeddings import HuggingFaceBgeEmbeddings
-from langchain_chroma import Chroma
-from langchain.document_loaders import DirectoryLoader, TextLoader
-from langchain_core.prompts import PromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+import os
+import threading
+import time
+# langchain 和 chroma 导入很慢（还会加载 onnxruntime 等），只在创建 Rag 实例时在用到的方法中导入
 import requests
 import re
 
+from src import embedding
+from src.bm25 import BM25Index, hybrid_search
+
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -22,33 +25,60 @@ prompt_template = """请根据以下上下文回答最后的问题。如果你
 
 有帮助的答案："""
 
+# 清单格式版本，分块的元数据变化时加一，旧版本建立的向量库会重新建立
+# 2: 分块元数据增加 chunk_id，向量检索结果与 BM25 按分块id融合
+MANIFEST_FORMAT = 2
+
 class Rag:
     _instance = None
 
-    def __new__(cls, config: dict = None):
+    def __new__(cls, config: dict = None, embeddings=None):
         if cls._instance is None:
             cls._instance = super(Rag, cls).__new__(cls)
-            cls._instance.init(config)  # 初始化实例属性
+            cls._instance.init(config, embeddings)  # 初始化实例属性
         return cls._instance
 
-    def init(self, config: dict):
-        """初始化 RAG 实例"""
+    def init(self, config: dict, embeddings=None):
+        """
+        初始化 RAG 实例
+        :param embeddings: 共享的嵌入服务（EmbeddingService），为空时按 emb_model 取共享服务
+        """
         self._validate_config(config)
         self.doc_path = config["doc_path"]
         self.emb_model = config["emb_model"]
         self.ollama_url = config["url"]
         self.model_name = config["model_name"]
+        self.embeddings = embeddings or embedding.get_service({"emb_model": self.emb_model})
+        # 向量库和文件清单（每个文件的内容哈希和分块id）保存目录，启动时只处理新增、修改和删除的文件
+        self.persist_dir = config.get("persist_dir", "tmp/rag_index")
+        self.manifest_file = os.path.join(self.persist_dir, "manifest.json")
+        self.watch_interval = config.get("watch_interval", 5)
+        self.sync_lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.watch_thread = None
+        # 检索方式：hybrid 为 BM25 + 向量检索，倒数排名融合；vector 只用向量检索
+        self.retrieval = config.get("retrieval", "hybrid")
+        self.top_k = config.get("top_k", 4)
+        self.rrf_k = config.get("rrf_k", 60)
+        # BM25 结果足够确定时（最高分和领先倍数）直接返回，不再计算查询向量
+        self.lexical_min_score = config.get("lexical_min_score", 8.0)
+        self.lexical_margin = config.get("lexical_margin", 2.0)
+        self.bm25 = BM25Index()
 
         # 初始化提示词模板
+        from langchain_core.prompts import PromptTemplate
         self.custom_rag_prompt = PromptTemplate.from_template(prompt_template)
 
         # 加载文档并初始化向量存储
         self.vector_store = self._initialize_vector_store()
-        self.retriever = self.vector_store.as_retriever()
 
         # 初始化 RAG 链
         self.rag_chain = self._initialize_rag_chain()
 
+        # 监视模式：定时检查文档目录，修改后的文档直接更新到向量库
+        if config.get("watch", False):
+            self.start_watch()
+
     def _validate_config(self, config: dict):
         """验证配置参数"""
         required_keys = ["doc_path", "emb_model", "url", "model_name"]
@@ -57,42 +87,166 @@ class Rag:
                 raise ValueError(f"Missing required config key: {key}")
 
     def _initialize_vector_store(self):
-        """加载文档并初始化向量存储"""
+        """打开持久化的向量库，并同步文档目录的变化"""
         try:
-            # 定义加载器，支持不同文档类型
-            loader = DirectoryLoader(
-                self.doc_path,
-                glob="**/*.md",
-                loader_cls=TextLoader
-            )
-            documents = loader.load()
-
-            # 分割文档
-            text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-            splits = text_splitter.split_documents(documents)
-
-            # 初始化嵌入模型
-            model_kwargs = {'device': 'cpu'}
-            encode_kwargs = {'normalize_embeddings': True}
-            embedding_model = HuggingFaceBgeEmbeddings(
-                model_name=self.emb_model,
-                model_kwargs=model_kwargs,
-                encode_kwargs=encode_kwargs
-            )
-
-            # 创建向量存储
-            return Chroma.from_documents(documents=splits, embedding=embedding_model)
+            from langchain_text_splitters import RecursiveCharacterTextSplitter
+            self.text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+
+            self.vector_store = self._open_collection()
+            self.manifest = self._load_manifest()
+            self._load_bm25()
+            self.sync()
+            return self.vector_store
         except Exception as e:
             logger.error(f"Error initializing vector store: {e}")
             raise
 
+    def _open_collection(self):
+        from langchain_chroma import Chroma
+        return Chroma(
+            collection_name="documents",
+            embedding_function=self.embeddings,
+            persist_directory=self.persist_dir
+        )
+
+    def _load_manifest(self):
+        """读取文件清单 {相对路径: {hash, size, mtime, ids}}，嵌入模型或清单格式变了时清空向量库重新建立"""
+        if not os.path.isfile(self.manifest_file):
+            return {}
+        with open(self.manifest_file, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("emb_model") != self.embeddings.model_id or data.get("format", 1) != MANIFEST_FORMAT:
+            logger.info(f"嵌入模型（{self.embeddings.model_id}）或清单格式（{MANIFEST_FORMAT}）变化，重新建立向量库")
+            # 删除整个集合再重新创建：向量维度可能变化（如 512 -> 768），沿用旧集合写入会失败
+            self.vector_store.delete_collection()
+            self.vector_store = self._open_collection()
+            return {}
+        return data.get("files", {})
+
+    def _load_bm25(self):
+        """用向量库中已有的分块建立 BM25 索引，只分词不计算向量"""
+        from langchain_core.documents import Document
+        start_time = time.time()
+        data = self.vector_store.get(include=["documents", "metadatas"])
+        for chunk_id, text, metadata in zip(data["ids"], data["documents"], data["metadatas"]):
+            self.bm25.add(chunk_id, text, Document(page_content=text, metadata=metadata or {}))
+        logger.info(f"BM25 索引建立完成，{len(self.bm25)} 个分块，耗时 {time.time() - start_time:.2f} 秒")
+
+    def _save_manifest(self):
+        """先写临时文件再替换，中途退出不会留下不完整的清单"""
+        os.makedirs(self.persist_dir, exist_ok=True)
+        tmp_file = f"{self.manifest_file}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump({"format": MANIFEST_FORMAT, "emb_model": self.embeddings.model_id, "files": self.manifest},
+                      f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, self.manifest_file)
+
+    @staticmethod
+    def _file_hash(file_path):
+        with open(file_path, "rb") as f:
+            return hashlib.sha1(f.read()).hexdigest()
+
+    def sync(self):
+        """
+        对比文档目录和清单：大小和修改时间都没变的文件不读取；变化的文件比较内容哈希，
+        只有新增、修改的文件重新分块和计算向量，删除的文件从向量库中移除。返回 (新增/修改数, 删除数)
+        """
+        with self.sync_lock:
+            files = {}
+            for file_path in glob.glob(os.path.join(self.doc_path, "**", "*.md"), recursive=True):
+                stat = os.stat(file_path)
+                files[os.path.relpath(file_path, self.doc_path)] = (file_path, stat.st_size, stat.st_mtime)
+
+            changed = 0
+            for name, (file_path, size, mtime) in files.items():
+                entry = self.manifest.get(name)
+                if entry is not None and (entry["size"], entry["mtime"]) == (size, mtime):
+                    continue
+                content_hash = self._file_hash(file_path)
+                if entry is None or entry["hash"] != content_hash:
+                    entry = self._index_file(name, file_path, entry)
+                    changed += 1
+                entry.update(hash=content_hash, size=size, mtime=mtime)
+                self.manifest[name] = entry
+                self._save_manifest()
+
+            deleted = [name for name in self.manifest if name not in files]
+            for name in deleted:
+                ids = self.manifest.pop(name)["ids"]
+                if ids:
+                    self.vector_store.delete(ids=ids)
+                for chunk_id in ids:
+                    self.bm25.remove(chunk_id)
+                logger.info(f"从向量库移除文档: {name}")
+                self._save_manifest()
+            if changed or deleted:
+                logger.info(f"向量库已同步：新增/修改 {changed} 个文档，删除 {len(deleted)} 个文档，共 {len(self.manifest)} 个文档")
+            return changed, len(deleted)
+
+    def _index_file(self, name, file_path, entry):
+        """重新分块并写入向量库，分块id由文件名和序号组成，先删除旧的分块"""
+        if entry is not None and entry["ids"]:
+            self.vector_store.delete(ids=entry["ids"])
+            for chunk_id in entry["ids"]:
+                self.bm25.remove(chunk_id)
+        from langchain.document_loaders import TextLoader
+        documents = TextLoader(file_path, encoding="utf-8").load()
+        splits = self.text_splitter.split_documents(documents)
+        ids = [f"{name}:{i}" for i in range(len(splits))]
+        for chunk_id, split in zip(ids, splits):
+            split.metadata["source"] = name
+            split.metadata["chunk_id"] = chunk_id
+        if splits:
+            self.vector_store.add_documents(documents=splits, ids=ids)
+        for chunk_id, split in zip(ids, splits):
+            self.bm25.add(chunk_id, split.page_content, split)
+        logger.info(f"{'更新' if entry is not None else '新增'}文档: {name}，{len(splits)} 个分块")
+        return {"ids": ids}
+
+    def start_watch(self):
+        """后台定时同步文档目录"""
+        if self.watch_thread is not None:
+            return
+        self.watch_thread = threading.Thread(target=self._watch, daemon=True, name="rag-watch")
+        self.watch_thread.start()
+
+    def _watch(self):
+        while not self.stop_event.wait(self.watch_interval):
+            try:
+                self.sync()
+            except Exception as e:
+                logger.error(f"同步文档出错: {e}")
+
+    def stop(self):
+        self.stop_event.set()
+
+    def retrieve(self, query: str):
+        """
+        检索与问题相关的分块。hybrid 模式先查 BM25，结果足够确定时直接返回；
+        否则再做向量检索，两路结果按倒数排名融合
+        """
+        start_time = time.time()
+        results, path = hybrid_search(
+            query, self.bm25 if self.retrieval == "hybrid" else None, self._dense_search,
+            self.top_k, self.rrf_k, self.lexical_min_score, self.lexical_margin)
+        logger.debug(f"检索 {query}: {path}，{len(results)} 个分块，耗时 {(time.time() - start_time) * 1000:.1f}ms")
+        return [doc for _, doc in results]
+
+    def _dense_search(self, query, k):
+        """向量检索，按 Chroma 的文档id（即分块id，与 BM25 一致）标识结果，融合时同一分块不会出现两次"""
+        docs = self.vector_store.similarity_search(query, k=k)
+        return [(getattr(doc, "id", None) or doc.metadata["chunk_id"], doc) for doc in docs]
+
     def _initialize_rag_chain(self):
         """初始化 RAG 链"""
+        from langchain_core.output_parsers import StrOutputParser
+        from langchain_core.runnables import RunnableLambda, RunnablePassthrough
+
         def format_docs(docs):
             return "\n\n".join(doc.page_content for doc in docs)
 
         return (
-            {"context": self.retriever | format_docs, "question": RunnablePassthrough()}
+            {"context": RunnableLambda(self.retrieve) | format_docs, "question": RunnablePassthrough()}
             | self.custom_rag_prompt
             | self.ollama_llm
             | StrOutputParser()
@@ -131,6 +285,75 @@ class Rag:
             logger.error(f"Error in response generation: {e}")
             return f"Error in response generation: {e}"
 
+    def stream(self, query: str):
+        """
+        流式问答：先检索，返回 (检索到的分块, 回答token的生成器)。
+        调用方拿到分块后即可使用（如记录来源），回答边生成边消费；关闭生成器时停止 LLM 请求
+        """
+        docs = self.retrieve(query)
+        context = "\n\n".join(doc.page_content for doc in docs)
+        prompt = self.custom_rag_prompt.format(context=context, question=query)
+        return docs, self.ollama_stream(prompt)
+
+    def ollama_stream(self, prompt: str):
+        """流式调用本地 ollama 服务，逐个返回回答片段，过滤掉<think>和</think>之间的内容和特殊字符"""
+        url = f"{self.ollama_url}/api/chat"
+        data = {
+            "model": self.model_name,
+            "messages": [{"role": "user", "content": prompt}],
+            "stream": True
+        }
+        special_chars = {"*": "", "《": "", "》": "", "～": ""}
+        try:
+            response = requests.post(url, json=data, stream=True)
+            response.raise_for_status()
+        except Exception as e:
+            logger.error(f"Error in response generation: {e}")
+            return
+        thinking = False
+        buffer = ""
+        try:
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                buffer += chunk.get("message", {}).get("content", "")
+                # 思考过程可能跨多个片段，标签闭合前不输出
+                while True:
+                    if thinking:
+                        end = buffer.find("</think>")
+                        if end < 0:
+                            buffer = buffer[-len("</think>"):]
+                            break
+                        buffer = buffer[end + len("</think>"):].lstrip()
+                        thinking = False
+                    else:
+                        begin = buffer.find("<think>")
+                        if begin >= 0:
+                            text, buffer = buffer[:begin], buffer[begin + len("<think>"):]
+                            thinking = True
+                        else:
+                            # 结尾可能是不完整的标签，留到下一个片段再判断
+                            cut = buffer.find("<", max(len(buffer) - len("<think>") + 1, 0))
+                            cut = len(buffer) if cut < 0 else cut
+                            text, buffer = buffer[:cut], buffer[cut:]
+                        for char, replacement in special_chars.items():
+                            text = text.replace(char, replacement)
+                        if text:
+                            yield text
+                        if not thinking:
+                            break
+                if chunk.get("done"):
+                    break
+            if buffer and not thinking:
+                for char, replacement in special_chars.items():
+                    buffer = buffer.replace(char, replacement)
+                yield buffer
+        except Exception as e:
+            logger.error(f"Error in response generation: {e}")
+        finally:
+            response.close()
+
     def query(self, query: str):
         """执行查询并返回结果"""
         try:
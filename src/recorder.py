@@ -3,7 +3,6 @@ from abc import ABC, abstractmethod
 import threading
 import queue
 import logging
-import pyaudio
 
 logger = logging.getLogger(__name__)
 
@@ -19,7 +18,10 @@ class AbstractRecorder(ABC):
 
 
 class RecorderPyAudio(AbstractRecorder):
+    requires = ("pyaudio",)
+
     def __init__(self, config):
+        import pyaudio
         self.format = pyaudio.paInt16
         self.channels = 1
         self.rate = 16000
@@ -1,26 +1,27 @@
 import json
+import os
 import queue
 import threading
 import uuid
 from abc import ABC
 import logging
-from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from concurrent.futures import TimeoutError
 import argparse
 import time
 
 from src import (
     recorder,
     player,
-    asr,
-    llm,
-    tts,
-    thg,
-    vad,
-    memory,
-    rag
+    memory
 )
 from src.dialogue import Message, Dialogue
-from src.utils import is_interrupt, read_config, is_segment, extract_json_from_string
+from src.cancel import CancelToken, CancelMetrics
+from src.pcm import PCMStream
+from src.tts_scheduler import TTSScheduler
+from src.runtime import SharedRuntime
+from src.tracing import Tracer
+from src.async_engine import AsyncEngine
+from src.utils import is_interrupt, read_config, extract_json_from_string, Segmenter
 from plugins.registry import Action
 from plugins.task_manager import TaskManager
 
@@ -39,57 +40,86 @@ sys_prompt = """
 """
 
 class Robot(ABC):
-    def __init__(self, config_file):
+    def __init__(self, config_file, runtime=None, session_id=None, audio_player=None):
+        """
+        :param config_file: 配置文件
+        :param runtime: 共享的模型（SharedRuntime），为空时自己加载一份，单用户使用
+        :param session_id: 会话id，多会话时由 SessionManager 传入，会话不使用本地录音，音频通过 feed_audio 送入
+        :param audio_player: 会话的播放器，为空时按配置创建
+        """
         config = read_config(config_file)
+        self.own_runtime = runtime is None
+        self.runtime = runtime or SharedRuntime(config)
+        self.session_id = session_id
         self.audio_queue = queue.Queue()
 
-        self.recorder = recorder.create_instance(
-            config["selected_module"]["Recorder"],
-            config["Recorder"][config["selected_module"]["Recorder"]]
-        )
-
-        self.vad = vad.create_instance(
-            config["selected_module"]["VAD"],
-            config["VAD"][config["selected_module"]["VAD"]]
-        )
-
-        self.asr = asr.create_instance(
-            config["selected_module"]["ASR"],
-            config["ASR"][config["selected_module"]["ASR"]]
-        )
-
-        self.llm = llm.create_instance(
-            config["selected_module"]["LLM"],
-            config["LLM"][config["selected_module"]["LLM"]]
-        )
-
-        self.tts = tts.create_instance(
-            config["selected_module"]["TTS"],
-            config["TTS"][config["selected_module"]["TTS"]]
-        )
-
-        self.thg = thg.create_instance(
-            config["selected_module"]["THG"],
-            config["THG"][config["selected_module"]["THG"]]
-        )
-
-        self.player = player.create_instance(
+        self.recorder = None
+        if session_id is None:
+            self.recorder = recorder.create_instance(
+                config["selected_module"]["Recorder"],
+                config["Recorder"][config["selected_module"]["Recorder"]]
+            )
+
+        # VAD 状态每个会话独立，其余模型共享
+        self.vad = self.runtime.vad.new_session()
+        self.asr = self.runtime.asr
+        self.llm = self.runtime.llm
+        self.tts = self.runtime.tts
+        self.thg = self.runtime.thg
+
+        self.player = audio_player or player.create_instance(
             config["selected_module"]["Player"],
             config["Player"][config["selected_module"]["Player"]]
         )
 
-        self.memory = memory.Memory(config.get("Memory"))
-        self.prompt = sys_prompt.replace("{memory}", self.memory.get_memory()).strip()
+        # 多会话时对话历史和记忆按会话分目录保存
+        memory_config = dict(config["Memory"])
+        if session_id is not None:
+            session_dir = os.path.join(memory_config["dialogue_history_path"], "sessions", str(session_id))
+            os.makedirs(session_dir, exist_ok=True)
+            memory_config["dialogue_history_path"] = session_dir
+            memory_config["memory_file"] = os.path.join(session_dir, os.path.basename(memory_config["memory_file"]))
+            memory_config["index_file"] = os.path.join(session_dir, "memory.db")
+            long_term_config = dict(memory_config.get("LongTerm") or {})
+            long_term_config["index_dir"] = os.path.join(session_dir, "long_memory")
+            memory_config["LongTerm"] = long_term_config
+        store = self.runtime.conversation_store
+        user_id = str(session_id) if session_id is not None else ""
+        self.memory = memory.Memory(memory_config, store, user_id, self.runtime.embedding)
+        self.prompt = self._build_prompt()
+        self.memory_version = self.memory.version
 
         self.vad_queue = queue.Queue()
-        self.dialogue = Dialogue(config["Memory"]["dialogue_history_path"])
+        self.dialogue = Dialogue(memory_config["dialogue_history_path"], store, user_id)
         self.dialogue.put(Message(role="system", content=self.prompt))
+        # 新对话的摘要在后台生成，完成后在下一轮开始时替换系统提示词
+        self.memory.start(exclude=(self.dialogue.session,))
 
         self.vad_start = True
-        # 保证tts是顺序的
-        self.tts_queue = queue.Queue()
-        # 初始化线程池
-        self.executor = ThreadPoolExecutor(max_workers=10)
+        # 流式TTS：引擎支持时边合成边播放，首个音频块到达即开始播放
+        self.tts_stream = bool(config.get("TTSStream", False)) and self.tts.supports_stream
+        # TTS调度器：独立线程池，按引擎限制并发，按提交顺序交付播放
+        self.tts_engine = self.runtime.tts_engine
+        self.tts_scheduler = TTSScheduler(self.runtime.tts_scheduler_config, self._on_tts_ready, self._on_tts_done,
+                                          executor=self.runtime.tts_executor,
+                                          gates=self.runtime.tts_gates)
+        # 每轮对话各阶段时延追踪
+        self.tracer = Tracer(config.get("Tracing"), session_id)
+        self.player.on_audio_start = self._on_audio_start
+        # 对话轮次，新一轮开始时丢弃旧轮次未播放的分段
+        self.turn_id = 0
+        # 已分配的最大轮次id：VAD开始时先分配id用于追踪，ASR得到非空文本后才真正开始该轮回复
+        self.turn_seq = 0
+        self.speech_turn = None
+        self.turn_lock = threading.Lock()
+        # 每轮的取消标记，打断时通知LLM、工具、TTS、THG提前结束，并统计避免的工作量
+        self.cancel_tokens = {0: CancelToken(0)}
+        self.cancel_metrics = CancelMetrics()
+        # 预渲染的应答/填充语音，耗时操作开始时立即播放
+        self.filler = self.runtime.filler
+        self.filler_tools = set((config.get("Filler") or {}).get("slow_tools") or [])
+        # 线程池由所有会话共用
+        self.executor = self.runtime.chat_executor
 
         # 打断相关配置
         self.INTERRUPT = config["interrupt"]
@@ -105,44 +135,65 @@ class Robot(ABC):
 
         self.speech = []
 
-        # 初始化单例
-        rag.Rag(config["Rag"])  # 第一次初始化
-
         self.task_queue = queue.Queue()
-        self.task_manager = TaskManager(config.get("TaskManager"), self.task_queue)
+        self.task_manager = TaskManager(config.get("TaskManager"), self.task_queue, self.runtime.task_executor)
         self.start_task_mode = config.get("StartTaskMode")
 
+        # 运行引擎：threaded 线程版，asyncio 分阶段异步流水线
+        self.engine = config.get("Engine", "threaded")
+        self.async_engine_config = config.get("AsyncEngine")
+
     def listen_dialogue(self, callback):
         self.callback = callback
 
+    def stop(self):
+        """通知 run 退出，run 退出时会调用 shutdown 释放资源"""
+        self.stop_event.set()
+        # 唤醒阻塞在队列上的线程
+        self.audio_queue.put(None)
+        self.vad_queue.put({"voice": None, "vad_statue": None})
+
     def shutdown(self):
         """关闭所有资源，确保程序安全退出"""
         logger.info("Shutting down Robot...")
         self.stop_event.set()
-        self.executor.shutdown(wait=True)
-        self.recorder.stop_recording()
+        self.tts_scheduler.shutdown()
+        if self.recorder is not None:
+            self.recorder.stop_recording()
         self.player.shutdown()
+        self.memory.stop(timeout=1)
+        self.tracer.flush()
+        logger.info(f"打断避免的工作量: {self.get_cancel_stats()}")
+        if self.own_runtime:
+            self.executor.shutdown(wait=True)
+            self.runtime.shutdown()
         logger.info("Shutdown complete.")
 
-    def chat_tool(self, query):
-        # 打印逐步生成的响应内容
-        start = 0
+    def chat_tool(self, query, turn_id=None):
+        cancel_token = self._cancel_token(turn_id)
+        if cancel_token.cancelled:
+            self.cancel_metrics.add("llm_calls_skipped")
+            return []
         try:
             start_time = time.time()  # 记录开始时间
-            llm_responses = self.llm.response_call(self.dialogue.get_llm_dialogue(), functions_call=self.task_manager.get_functions())
+            llm_responses = self.llm.response_call(self._llm_dialogue(query), functions_call=self.task_manager.get_functions())
         except Exception as e:
             #self.chat_lock = False
             logger.error(f"LLM 处理出错 {query}: {e}")
             return []
 
         tool_call_flag = False
-        response_message = []
+        segmenter = Segmenter()
+        response_message = segmenter.tokens
         # tool call 参数
         function_name = None
         function_id = None
         function_arguments = ""
         content_arguments = ""
         for chunk in llm_responses:
+            if cancel_token.cancelled:
+                self._stop_llm_stream(llm_responses)
+                break
             content, tools_call = chunk
             if content is not None and len(content)>0:
                 if len(response_message)<=0 and content=="```":
@@ -156,27 +207,20 @@ class Robot(ABC):
                 if tools_call[0].function.arguments is not None:
                     function_arguments += tools_call[0].function.arguments
             if content is not None and len(content) > 0:
+                self.tracer.mark(turn_id, "llm_first_token", once=True)
                 if tool_call_flag:
                     content_arguments+=content
                 else:
-                    response_message.append(content)
                     end_time = time.time()  # 记录结束时间
                     logger.debug(f"大模型返回时间时间: {end_time - start_time} 秒, 生成token={content}")
-                    if is_segment(response_message):
-                        segment_text = "".join(response_message[start:])
-                        # 为了保证语音的连贯，至少2个字才转tts
-                        if len(segment_text) <= max(2, start):
-                            continue
-                        future = self.executor.submit(self.speak_and_play, segment_text)
-                        self.tts_queue.put(future)
-                        # futures.append(future)
-                        start = len(response_message)
+                    segment_text = segmenter.feed(content)
+                    if segment_text is not None:
+                        self._submit_tts(segment_text, turn_id)
 
         if not tool_call_flag:
-            if start < len(response_message):
-                segment_text = "".join(response_message[start:])
-                future = self.executor.submit(self.speak_and_play, segment_text)
-                self.tts_queue.put(future)
+            segment_text = segmenter.flush()
+            if segment_text is not None:
+                self._submit_tts(segment_text, turn_id)
         else:
             # 处理函数调用
             if function_id is None:
@@ -190,17 +234,24 @@ class Robot(ABC):
                     return []
                 function_arguments = json.loads(function_arguments)
             logger.info(f"function_name={function_name}, function_id={function_id}, function_arguments={function_arguments}")
+            if cancel_token.cancelled:
+                self.cancel_metrics.add("tool_calls_skipped")
+                return response_message
+            # 同步等待的慢工具，先播放一句应答，避免用户等待时没有声音
+            if function_name in self.filler_tools:
+                self._play_filler("ack", turn_id)
             # 调用工具
-            result = self.task_manager.tool_call(function_name, function_arguments)
+            result = self.task_manager.tool_call(function_name, function_arguments, cancel_token)
             if result.action == Action.NOTFOUND: # = (0, "没有找到函数")
                 logger.error(f"没有找到函数{function_name}")
                 return []
             elif result.action == Action.NONE: # = (1,  "啥也不干")
                 return []
             elif result.action == Action.RESPONSE: # = (2, "直接回复")
-                future = self.executor.submit(self.speak_and_play, result.response)
-                self.tts_queue.put(future)
+                self._submit_tts(result.response, turn_id)
                 return [result.response]
+            elif result.action == Action.STREAM: # = (6, "流式回复")
+                return self._speak_stream(function_name, result, turn_id, cancel_token)
             elif result.action == Action.REQLLM: # = (3, "调用函数后再请求llm生成回复")
                 # 添加工具内容
                 self.dialogue.put(Message(role='assistant',
@@ -209,7 +260,7 @@ class Robot(ABC):
                                                        "type": 'function', "index": 0}]))
 
                 self.dialogue.put(Message(role="tool", tool_call_id=function_id, content=result.result))
-                self.chat_tool(query)
+                self.chat_tool(query, turn_id)
             elif result.action == Action.ADDSYSTEM: # = (4, "添加系统prompt到对话中去")
                 self.dialogue.put(Message(**result.result))
                 return []
@@ -223,49 +274,31 @@ class Robot(ABC):
                 self.dialogue.put(Message(role="tool", tool_call_id=function_id, content=result.response))
                 self.dialogue.put(Message(**result.result))
                 self.dialogue.put(Message(role="user", content="ok"))
-                return self.chat_tool(query)
+                return self.chat_tool(query, turn_id)
             else:
                 logger.error(f"not found action type: {result.action}")
         return response_message
 
-    def chat(self, query):
+    def chat(self, query, turn_id=None):
+        if turn_id is None:
+            turn_id = self._new_turn(source="text")
         self.dialogue.put(Message(role="user", content=query))
         response_message = []
-        # futures = []
-        start = 0
         self.chat_lock = True
         if self.start_task_mode:
-            response_message = self.chat_tool(query)
+            response_message = self.chat_tool(query, turn_id)
         else:
             # 提交 LLM 任务
             try:
                 start_time = time.time()  # 记录开始时间
-                llm_responses = self.llm.response(self.dialogue.get_llm_dialogue())
+                llm_responses = self.llm.response(self._llm_dialogue(query))
             except Exception as e:
                 self.chat_lock = False
                 logger.error(f"LLM 处理出错 {query}: {e}")
                 return None
-            # 提交 TTS 任务到线程池
-            for content in llm_responses:
-                response_message.append(content)
-                end_time = time.time()  # 记录结束时间
-                logger.debug(f"大模型返回时间时间: {end_time - start_time} 秒, 生成token={content}")
-                if is_segment(response_message):
-                    segment_text = "".join(response_message[start:])
-                    # 为了保证语音的连贯，至少2个字才转tts
-                    if len(segment_text)<=max(2, start):
-                        continue
-                    future = self.executor.submit(self.speak_and_play, segment_text)
-                    self.tts_queue.put(future)
-                    #futures.append(future)
-                    start = len(response_message)
-
-            # 处理剩余的响应
-            if start < len(response_message):
-                segment_text = "".join(response_message[start:])
-                future = self.executor.submit(self.speak_and_play, segment_text)
-                self.tts_queue.put(future)
-                #futures.append(future)
+            # 按句提交 TTS 任务
+            response_message = self._segment_and_submit(llm_responses, turn_id, self._cancel_token(turn_id),
+                                                        start_time)
 
             # 等待所有 TTS 任务完成
             """
@@ -278,20 +311,227 @@ class Robot(ABC):
                     logger.error(f"TTS 任务出错: {e}")
             """
         self.chat_lock = False
+        self.tracer.mark(turn_id, "turn_end")
         # 更新对话
         if self.callback:
             self.callback({"role": "assistant", "content": "".join(response_message)})
         self.dialogue.put(Message(role="assistant", content="".join(response_message)))
         self.dialogue.dump_dialogue()
-        logger.debug(json.dumps(self.dialogue.get_llm_dialogue(), indent=4, ensure_ascii=False))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(json.dumps(self.dialogue.llm_dialogue, indent=4, ensure_ascii=False))
         return True
     
     def interrupt_playback(self):
-        """中断当前的语音播放"""
+        """
+        中断当前的语音播放：取消本轮还未合成和正在合成的TTS分段，播放器在一个缓冲块内停止输出，
+        并记录从打断到停止出声的耗时
+        """
         logger.info("Interrupting current playback.")
-        self.player.stop()
+        turn_id = self.turn_id
+        cancel_token = self._cancel_token(turn_id)
+        cancel_token.cancel("interrupt")
+        cancelled = self.tts_scheduler.cancel_turn(turn_id)
+        # 引擎中断的是共享的模型，其他会话也有分段在合成时不中断，本会话的分段合成完后丢弃
+        if cancelled["running"] > 0 and self.tts_scheduler.owns_engine(self.tts_engine):
+            self.tts.cancel()
+        self.player.stop(turn_id)
+        self.cancel_metrics.add("turns_cancelled")
+        self.cancel_metrics.add("tts_pending_dropped", cancelled["pending"])
+        self.cancel_metrics.add("tts_running_cancelled", cancelled["running"])
+        self.tracer.mark(turn_id, "cancelled", reason=cancel_token.reason, **cancelled)
+        # 等待输出真正停止只用于统计，放到线程池中，不阻塞调用线程处理后续的语音
+        self.executor.submit(self._log_interrupt, turn_id, cancelled)
+
+    def _log_interrupt(self, turn_id, cancelled):
+        stop_latency_ms = self.player.wait_stopped()
+        stop_latency = f"{stop_latency_ms:.1f}ms" if stop_latency_ms is not None else "超时"
+        logger.info(f"打断第{turn_id}轮: 取消未合成分段 {cancelled['pending']} 个, "
+                    f"合成中分段 {cancelled['running']} 个, 停止出声耗时 {stop_latency}")
+        logger.info(f"打断避免的工作量: {self.get_cancel_stats()}")
+
+    def _new_turn(self, source="voice"):
+        """分配轮次id并立即开始该轮回复（文本输入），返回轮次id"""
+        turn_id = self._next_turn_id(source)
+        self._begin_turn(turn_id)
+        return turn_id
+
+    def _next_turn_id(self, source="voice"):
+        """
+        分配轮次id并开始追踪（语音输入在VAD开始时）。只用于追踪，不影响正在合成和播放的回复：
+        咳嗽、噪音或识别结果为空时不会打断上一轮
+        """
+        with self.turn_lock:
+            self.turn_seq += 1
+            turn_id = self.turn_seq
+        self.tracer.start_turn(turn_id, source, keep=self.turn_id)
+        return turn_id
+
+    def _begin_turn(self, turn_id):
+        """真正开始一轮回复（ASR得到非空文本或文本输入时）：取消上一轮，丢弃其还未播放的分段"""
+        with self.turn_lock:
+            previous = self.cancel_tokens.get(self.turn_id)
+            self.turn_id = turn_id
+            self.cancel_tokens[turn_id] = CancelToken(turn_id)
+            # 只保留最近几轮的取消标记
+            for old_turn in [t for t in self.cancel_tokens if t <= turn_id - 8]:
+                del self.cancel_tokens[old_turn]
+        # 新一轮开始，上一轮还没结束的工作不再需要
+        if previous is not None:
+            previous.cancel("new_turn")
+        self.tts_scheduler.begin_turn(turn_id)
+        self._refresh_prompt()
+
+    def _build_prompt(self):
+        memory_text = self.memory.get_memory()
+        if not memory_text:
+            # 没有摘要（retrieval 模式或还没有历史）时去掉摘要一节，缩短系统提示词
+            return sys_prompt.replace("#以下是历史对话摘要:\n{memory}\n", "").strip()
+        return sys_prompt.replace("{memory}", memory_text).strip()
+
+    def _llm_dialogue(self, query):
+        """发送给LLM的消息：对话历史，加上与本轮输入相关的长期记忆（只用于本次请求，不写入对话历史）"""
+        dialogue = self.dialogue.get_llm_dialogue()
+        context = self.memory.recall(query)
+        if context:
+            # 放在最后一条用户消息之前：工具调用递归时末尾是 assistant(tool_calls) 和 tool 回复，两者之间不能插入其他消息
+            last_user = next((i for i in range(len(dialogue) - 1, -1, -1) if dialogue[i].get("role") == "user"), len(dialogue))
+            dialogue.insert(last_user, {"role": "system", "content": context})
+        return dialogue
+
+    def _refresh_prompt(self):
+        """后台摘要有更新时，在轮次开始处替换系统提示词，不影响正在进行的请求"""
+        version = self.memory.version
+        if version == self.memory_version:
+            return
+        self.memory_version = version
+        self.prompt = self._build_prompt()
+        self.dialogue.update_system(self.prompt)
+        logger.info(f"历史对话摘要已更新（第{version}版），替换系统提示词")
+
+    def _cancel_token(self, turn_id=None):
+        """取某一轮的取消标记，已经清理掉的旧轮次视为已取消"""
+        with self.turn_lock:
+            if turn_id is None:
+                turn_id = self.turn_id
+            cancel_token = self.cancel_tokens.get(turn_id)
+        if cancel_token is None:
+            cancel_token = CancelToken(turn_id)
+            cancel_token.cancel("expired")
+        return cancel_token
+
+    def _speak_stream(self, function_name, result, turn_id, cancel_token):
+        """流式工具的回复：result.result 为检索到的上下文等，result.response 逐段生成回复，按句提交TTS"""
+        if isinstance(result.result, list):
+            sources = [getattr(doc, "metadata", {}).get("source") for doc in result.result]
+            self.tracer.mark(turn_id, "tool_context", tool=function_name, items=len(sources))
+            logger.info(f"{function_name} 检索到 {len(sources)} 个片段，来源: {sources}")
+        return self._segment_and_submit(result.response, turn_id, cancel_token)
+
+    def _segment_and_submit(self, tokens, turn_id, cancel_token, start_time=None):
+        """逐个读取流式回复的token，按句提交TTS，轮次取消时关闭流；返回收到的全部token"""
+        segmenter = Segmenter()
+        for content in tokens:
+            if cancel_token.cancelled:
+                self._stop_llm_stream(tokens)
+                break
+            self.tracer.mark(turn_id, "llm_first_token", once=True)
+            if start_time is not None:
+                logger.debug(f"大模型返回时间时间: {time.time() - start_time} 秒, 生成token={content}")
+            segment_text = segmenter.feed(content)
+            if segment_text is not None:
+                self._submit_tts(segment_text, turn_id)
+        segment_text = segmenter.flush()
+        if segment_text is not None and not cancel_token.cancelled:
+            self._submit_tts(segment_text, turn_id)
+        return segmenter.tokens
+
+    def _stop_llm_stream(self, llm_responses):
+        """轮次已取消，关闭LLM流不再接收后续token"""
+        close = getattr(llm_responses, "close", None)
+        if close is not None:
+            close()
+        self.cancel_metrics.add("llm_streams_stopped")
+
+    def get_cancel_stats(self):
+        """打断避免的工作量统计"""
+        stats = self.cancel_metrics.snapshot()
+        stats["tool_futures_cancelled"] = self.task_manager.cancelled_tasks
+        return stats
+
+    def _submit_tts(self, text, turn_id=None):
+        """提交TTS任务到调度器，按提交顺序交付播放"""
+        if turn_id is None:
+            turn_id = self.turn_id
+        cancel_token = self._cancel_token(turn_id)
+        if cancel_token.cancelled:
+            self.cancel_metrics.add("segments_skipped")
+            logger.debug(f"第{turn_id}轮已取消，跳过分段：{text}")
+            return
+        self.tracer.mark(turn_id, "first_segment", once=True)
+        # 预渲染过的固定话术直接播放，不再合成
+        filler = self.filler.get(text)
+        if filler is not None:
+            self.tts_scheduler.submit(turn_id, "Filler", lambda t, job: filler, text)
+        elif self.tts_stream:
+            self.tts_scheduler.submit(turn_id, self.tts_engine, self.speak_stream, text)
+        else:
+            self.tts_scheduler.submit(turn_id, self.tts_engine,
+                                      lambda t, job: self.speak_and_play(t, cancel_token), text)
+
+    def _play_filler(self, category, turn_id=None):
+        """播放一条预渲染的填充语音，没有渲染好时跳过"""
+        if self._cancel_token(turn_id).cancelled:
+            return False
+        filler = self.filler.pick(category)
+        if filler is None:
+            return False
+        if turn_id is None:
+            turn_id = self.turn_id
+        requested = time.time()
+        filler.on_start = lambda at: self.tracer.mark(turn_id, "filler_start", at=at, category=category,
+                                                      latency_ms=round((at - requested) * 1000, 1))
+        # 预渲染的语音直接交给播放器，不经过TTS调度器，不会排在等待合成名额的分段后面
+        self.player.play_stream(filler, turn_id)
+        return True
+
+    def _on_tts_done(self, job):
+        self.tracer.mark(job.turn_id, "tts_done", seq=job.seq,
+                         queue_ms=round(job.queue_ms, 1), synth_ms=round(job.synth_ms, 1))
+
+    def _on_audio_start(self, turn_id, timestamp):
+        self.tracer.mark(turn_id, "first_audio", at=timestamp, once=True)
+
+    def _on_tts_ready(self, job, result):
+        """调度器按顺序交付的TTS结果，交给播放器"""
+        if job.engine == "Filler":
+            logger.debug(f"填充语音交付耗时 {(time.time() - job.submit_time) * 1000:.1f}ms：{job.text}")
+        if isinstance(result, PCMStream):
+            self.player.play_stream(result, job.turn_id)
+        else:
+            self.player.play(result, job.turn_id)
+
+    def speak_stream(self, text, job):
+        """
+        流式TTS，合成出的PCM块直接写入 PCMStream。stream 在合成开始时就交付给播放器，
+        首个块到达即开始播放（流式模式下不生成数字人视频）
+        """
+        if text is None or len(text) <= 0:
+            logger.info(f"无需tts转换，query为空，{text}")
+            return None
+        stream = PCMStream(self.tts.sample_rate, text)
+        job.publish(stream)
+        try:
+            for chunk in self.tts.to_tts_stream(text):
+                if job.dropped:
+                    break
+                stream.write(chunk)
+        except Exception as e:
+            logger.error(f"流式tts转换失败，{text}: {e}")
+        finally:
+            stream.close()
+        return stream
 
-    def speak_and_play(self, text):
+    def speak_and_play(self, text, cancel_token=None):
         if text is None or len(text)<=0:
             logger.info(f"无需tts转换，query为空，{text}")
             return None
@@ -299,6 +539,10 @@ class Robot(ABC):
         if tts_file is None:
             logger.error(f"tts转换失败，{text}")
             return None
+        if cancel_token is not None and cancel_token.cancelled:
+            # 轮次已取消，不再生成数字人视频，结果也不会播放
+            self.cancel_metrics.add("thg_skipped")
+            return None
         logger.debug(f"TTS 文件生成完毕{self.chat_lock}")
         # 调用THG生成数字人视频
         try:
@@ -328,8 +572,7 @@ class Robot(ABC):
         if not self.task_queue.empty() and  not self.vad_start and vad_status is None \
                 and not self.player.get_playing_status() and self.chat_lock is False:
             result = self.task_queue.get()
-            future = self.executor.submit(self.speak_and_play, result.response)
-            self.tts_queue.put(future)
+            self._submit_tts(result.response)
 
         """ 语音唤醒
         if time.time() - self.start_time>=60:
@@ -345,20 +588,25 @@ class Robot(ABC):
                 if self.INTERRUPT:
                     self.chat_lock = False
                     self.interrupt_playback()
+                    self.speech_turn = self._next_turn_id()
                     self.vad_start = True
                     self.speech.append(data)
                 else:
                     return
             else:  # 没有播放，正常
+                self.speech_turn = self._next_turn_id()
                 self.vad_start = True
                 self.speech.append(data)
         elif "end" in vad_status and len(self.speech) > 0:
+            turn_id = self.speech_turn
+            self.tracer.mark(turn_id, "vad_end")
             try:
                 logger.debug(f"语音包的长度：{len(self.speech)}")
                 self.vad_start = False
                 voice_data = [d["voice"] for d in self.speech]
                 text, tmpfile = self.asr.recognizer(voice_data)
                 self.speech = []
+                self.tracer.mark(turn_id, "asr_done")
             except Exception as e:
                 self.vad_start = False
                 self.speech = []
@@ -371,35 +619,17 @@ class Robot(ABC):
             logger.debug(f"ASR识别结果: {text}")
             if self.callback:
                 self.callback({"role": "user", "content": str(text)})
-            self.executor.submit(self.chat, text)
+            self._begin_turn(turn_id)
+            self.executor.submit(self.chat, text, turn_id)
         return True
 
-    def _tts_priority(self):
-        def priority_thread():
-            while not self.stop_event.is_set():
-                try:
-                    future = self.tts_queue.get()
-                    try:
-                        tts_file = future.result(timeout=1000)
-                    except TimeoutError:
-                        logger.error("TTS 任务超时")
-                        continue
-                    except Exception as e:
-                        logger.error(f"TTS 任务出错: {e}")
-                        continue
-                    if tts_file is None:
-                        continue
-                    self.player.play(tts_file)
-                except Exception as e:
-                    logger.error(f"tts_priority priority_thread: {e}")
-        tts_priority = threading.Thread(target=priority_thread, daemon=True)
-        tts_priority.start()
-
     def _stream_vad(self):
         def vad_thread():
             while not self.stop_event.is_set():
                 try:
                     data = self.audio_queue.get()
+                    if data is None:
+                        continue
                     vad_statue = self.vad.is_vad(data)
                     self.vad_queue.put({"voice": data, "vad_statue": vad_statue})
                 except Exception as e:
@@ -407,23 +637,34 @@ class Robot(ABC):
         consumer_audio = threading.Thread(target=vad_thread, daemon=True)
         consumer_audio.start()
 
+    def feed_audio(self, data):
+        """送入一帧 16kHz 16bit 单声道音频（多会话时由网络连接送入，代替本地录音）"""
+        self.audio_queue.put(data)
+
     def start_recording_and_vad(self):
         # 开始监听语音流
-        self.recorder.start_recording(self.audio_queue)
-        logger.info("Started recording.")
+        if self.recorder is not None:
+            self.recorder.start_recording(self.audio_queue)
+            logger.info("Started recording.")
         # vad 实时识别
         self._stream_vad()
-        # tts优先级队列
-        self._tts_priority()
 
     def run(self):
+        start_time, start_cpu = time.time(), time.process_time()
         try:
-            self.start_recording_and_vad()  # 监听语音流
-            while not self.stop_event.is_set():
-                self._duplex()  # 双工处理
+            if self.engine == "asyncio":
+                AsyncEngine(self, self.async_engine_config).run()
+            else:
+                self.start_recording_and_vad()  # 监听语音流
+                while not self.stop_event.is_set():
+                    self._duplex()  # 双工处理
         except KeyboardInterrupt:
             logger.info("Received KeyboardInterrupt. Exiting...")
         finally:
+            wall_time = max(time.time() - start_time, 1e-6)
+            cpu_time = time.process_time() - start_cpu
+            logger.info(f"{self.engine} 引擎运行 {wall_time:.0f} 秒, CPU 时间 {cpu_time:.1f} 秒, "
+                        f"平均占用 {cpu_time / wall_time * 100:.1f}%")
             self.shutdown()
 
 if __name__ == "__main__":
@@ -0,0 +1,82 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src import (
+    asr,
+    llm,
+    tts,
+    thg,
+    vad,
+    rag,
+    embedding,
+    tts_scheduler
+)
+from src.filler import FillerLibrary
+from src.store import ConversationStore
+
+logger = logging.getLogger(__name__)
+
+
+class SharedRuntime:
+    """
+    进程内共享的重量级资源：ASR、LLM、TTS、THG 模型，VAD 模型原型，RAG 向量库，预渲染的填充语音，
+    以及 TTS、对话、工具调用的线程池和各引擎的并发限制。单用户的 Robot 自己创建一份，多会话时由 SessionManager 创建一份，
+    所有会话共用。
+    """
+
+    def __init__(self, config):
+        start_time = time.time()
+        selected = config["selected_module"]
+
+        self.vad = vad.create_instance(selected["VAD"], config["VAD"][selected["VAD"]])
+        self.asr = asr.create_instance(selected["ASR"], config["ASR"][selected["ASR"]])
+        self.llm = llm.create_instance(selected["LLM"], config["LLM"][selected["LLM"]])
+        self.tts_engine = selected["TTS"]
+        self.tts = tts.create_instance(self.tts_engine, config["TTS"][self.tts_engine])
+        self.thg = thg.create_instance(selected["THG"], config["THG"][selected["THG"]])
+
+        # TTS线程池和各引擎的并发限制在所有会话之间共享
+        self.tts_scheduler_config = tts_scheduler.scheduler_config(config.get("TTSScheduler"), self.tts_engine,
+                                                                   self.tts.batch_size)
+        scheduler_config = self.tts_scheduler_config
+        self.tts_executor = ThreadPoolExecutor(max_workers=scheduler_config.get("max_workers", 4),
+                                               thread_name_prefix="tts")
+        self.tts_gates = {}
+
+        # 对话和工具调用的线程池，会话不再各自创建
+        session_config = config.get("Session") or {}
+        self.chat_executor = ThreadPoolExecutor(max_workers=session_config.get("chat_workers", 10),
+                                                thread_name_prefix="chat")
+        self.task_executor = ThreadPoolExecutor(max_workers=session_config.get("task_workers", 10),
+                                                thread_name_prefix="task")
+
+        # 预渲染的应答/填充语音
+        filler_config = config.get("Filler") or {}
+        self.filler = FillerLibrary(filler_config, self.tts,
+                                    FillerLibrary.voice_key(self.tts_engine, config["TTS"][self.tts_engine]),
+                                    gate=tts_scheduler.engine_gate(self.tts_gates, scheduler_config, self.tts_engine))
+
+        # 对话存储（SQLite），所有会话共用一个数据库，未配置时对话写json文件
+        memory_config = config.get("Memory") or {}
+        db_path = memory_config.get("db_path")
+        self.conversation_store = ConversationStore(db_path, memory_config.get("dialogue_history_path")) \
+            if db_path else None
+
+        # 嵌入服务（带向量缓存），RAG 和长期记忆共用
+        self.embedding = embedding.get_service(config.get("Embedding") or {"emb_model": config["Rag"]["emb_model"]})
+
+        # 初始化单例
+        self.rag = rag.Rag(config["Rag"], self.embedding)  # 第一次初始化
+
+        logger.info(f"共享模型加载完成，耗时 {time.time() - start_time:.2f} 秒")
+
+    def shutdown(self):
+        self.tts_executor.shutdown(wait=False)
+        self.chat_executor.shutdown(wait=False)
+        self.task_executor.shutdown(wait=False)
+        self.rag.stop()
+        logger.info(f"嵌入服务统计: {self.embedding.stats()}")
+        self.embedding.close()
+        if self.conversation_store is not None:
+            self.conversation_store.close()
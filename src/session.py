@@ -0,0 +1,135 @@
+import logging
+import threading
+import time
+import uuid
+
+from src.robot import Robot
+from src.runtime import SharedRuntime
+from src.utils import read_config
+
+logger = logging.getLogger(__name__)
+
+
+class SessionManager:
+    """
+    多会话管理：一个进程内承载多个相互独立的对话。
+    ASR、LLM、TTS、THG、向量库等模型只加载一次（SharedRuntime），每个会话是一个轻量的 Robot，
+    只持有自己的 VAD 状态、对话、记忆、语音缓冲和队列，音频通过 feed_audio 送入。
+    """
+
+    def __init__(self, config_file, player_factory=None):
+        """
+        :param config_file: 配置文件
+        :param player_factory: player_factory(session_id) 创建会话的播放器（如推送到网页端），为空时按配置创建
+        """
+        self.config_file = config_file
+        config = read_config(config_file)
+        session_config = config.get("Session") or {}
+        self.max_sessions = session_config.get("max_sessions", 16)
+        self.idle_timeout = session_config.get("idle_timeout", 600)
+        self.runtime = SharedRuntime(config)
+        self.player_factory = player_factory
+        self.lock = threading.Lock()
+        self.sessions = {}
+        self.last_active = {}
+        # 会话的运行线程，关闭时等待其退出（退出时执行 Robot.shutdown）
+        self.threads = {}
+        # 正在创建的会话：占用会话数名额，同一会话id的其他创建者等待创建完成
+        self.creating = {}
+
+    def create(self, session_id=None, callback=None) -> Robot:
+        """创建并启动一个会话，已存在时直接返回"""
+        session_id = session_id or uuid.uuid4().hex
+        with self.lock:
+            if session_id in self.sessions:
+                return self.sessions[session_id]
+            created = self.creating.get(session_id)
+            if created is None:
+                # 在锁内占用名额，并发创建时不会超过上限
+                if len(self.sessions) + len(self.creating) >= self.max_sessions:
+                    raise RuntimeError(f"会话数已达上限 {self.max_sessions}")
+                created = self.creating[session_id] = threading.Event()
+                owner = True
+            else:
+                owner = False
+        if not owner:
+            created.wait()
+            session = self.get(session_id)
+            if session is None:
+                raise RuntimeError(f"会话创建失败: {session_id}")
+            return session
+        try:
+            audio_player = self.player_factory(session_id) if self.player_factory else None
+            session = Robot(self.config_file, runtime=self.runtime, session_id=session_id, audio_player=audio_player)
+            if callback:
+                session.listen_dialogue(callback)
+            thread = threading.Thread(target=session.run, name=f"session-{session_id}", daemon=True)
+            thread.start()
+            with self.lock:
+                self.sessions[session_id] = session
+                self.threads[session_id] = thread
+                self.last_active[session_id] = time.time()
+                count = len(self.sessions)
+        finally:
+            with self.lock:
+                self.creating.pop(session_id, None)
+            created.set()
+        logger.info(f"创建会话 {session_id}，当前会话数 {count}")
+        return session
+
+    def get(self, session_id):
+        with self.lock:
+            return self.sessions.get(session_id)
+
+    def _touch(self, session_id):
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is not None:
+                self.last_active[session_id] = time.time()
+        if session is None:
+            raise KeyError(f"会话不存在: {session_id}")
+        return session
+
+    def feed_audio(self, session_id, data):
+        """送入会话的一帧 16kHz 16bit 单声道音频"""
+        self._touch(session_id).feed_audio(data)
+
+    def chat(self, session_id, text):
+        """文本输入，在会话的线程池中处理"""
+        session = self._touch(session_id)
+        return session.executor.submit(session.chat, text)
+
+    def close(self, session_id, timeout=10):
+        """通知会话退出，并等待运行线程执行完 Robot.shutdown（保存对话、停止记忆和TTS调度器）"""
+        with self.lock:
+            session = self.sessions.pop(session_id, None)
+            thread = self.threads.pop(session_id, None)
+            self.last_active.pop(session_id, None)
+        if session is None:
+            return False
+        session.stop()
+        if thread is not None:
+            thread.join(timeout)
+            if thread.is_alive():
+                logger.warning(f"会话 {session_id} 在 {timeout} 秒内没有退出")
+        logger.info(f"关闭会话 {session_id}")
+        return True
+
+    def close_idle(self):
+        """关闭超过 idle_timeout 秒没有输入的会话，返回关闭的会话id"""
+        now = time.time()
+        with self.lock:
+            idle = [sid for sid, t in self.last_active.items() if now - t > self.idle_timeout]
+        for session_id in idle:
+            self.close(session_id)
+        return idle
+
+    def shutdown(self):
+        with self.lock:
+            sessions = dict(self.sessions)
+        # 先通知所有会话退出，再逐个等待；共享资源在所有会话退出后才关闭
+        for session in sessions.values():
+            session.stop()
+        for session_id in sessions:
+            self.close(session_id)
+        self.runtime.shutdown()
@@ -0,0 +1,181 @@
+import argparse
+import glob
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL DEFAULT '',
+    session TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT,
+    tool_calls TEXT,
+    tool_call_id TEXT,
+    uniq_id TEXT UNIQUE
+);
+CREATE INDEX IF NOT EXISTS idx_messages_session ON messages (user_id, session, id);
+CREATE INDEX IF NOT EXISTS idx_messages_time ON messages (created_at);
+CREATE INDEX IF NOT EXISTS idx_messages_role ON messages (role, created_at);
+"""
+
+_COLUMNS = ("user_id", "session", "created_at", "role", "content", "tool_calls", "tool_call_id", "uniq_id")
+
+
+class ConversationStore:
+    """
+    SQLite（WAL 模式）对话存储，只追加写入。
+    每轮对话只写入新增的消息，不再重写整个对话文件；按用户、会话、时间、角色建索引，
+    记忆模块按会话顺序读取，不再遍历和解析所有 json 文件。
+    """
+
+    def __init__(self, db_path, import_dir=None):
+        """
+        :param import_dir: 旧的 dialogue-*.json 所在目录，数据库第一次创建时自动导入，之前的对话记忆不会丢失
+        """
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        created = not os.path.exists(db_path)
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=5)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+        self.conn.commit()
+        if created and import_dir:
+            self.import_json_files(import_dir)
+
+    @staticmethod
+    def _row(message, user_id, session, created_at):
+        tool_calls = message.get("tool_calls")
+        return (user_id, session, message.get("created_at", created_at), message["role"], message.get("content"),
+                json.dumps(tool_calls, ensure_ascii=False) if tool_calls is not None else None,
+                message.get("tool_call_id"), message.get("uniq_id"))
+
+    def append_many(self, session, messages, user_id=""):
+        """在一个事务中追加多条消息，uniq_id 重复的消息忽略（重复导入时不会重复写入）"""
+        if not messages:
+            return 0
+        now = time.time()
+        rows = [self._row(m, user_id, session, now) for m in messages]
+        with self.lock, self.conn:
+            cursor = self.conn.executemany(
+                f"INSERT OR IGNORE INTO messages ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})",
+                rows)
+        return cursor.rowcount
+
+    def append(self, session, message, user_id=""):
+        return self.append_many(session, [message], user_id)
+
+    def sessions(self, user_id=""):
+        """按开始时间排序的会话列表 [(session, 开始时间, 消息数)]"""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT session, MIN(created_at), COUNT(*) FROM messages WHERE user_id = ? "
+                "GROUP BY session ORDER BY MIN(created_at)", (user_id,)).fetchall()
+
+    def messages(self, session, user_id="", roles=None):
+        """某个会话的消息，按写入顺序"""
+        sql = "SELECT role, content, tool_calls, tool_call_id FROM messages WHERE user_id = ? AND session = ?"
+        params = [user_id, session]
+        if roles:
+            sql += f" AND role IN ({', '.join('?' * len(roles))})"
+            params.extend(roles)
+        with self.lock:
+            rows = self.conn.execute(sql + " ORDER BY id", params).fetchall()
+        messages = []
+        for role, content, tool_calls, tool_call_id in rows:
+            message = {"role": role}
+            if content is not None:
+                message["content"] = content
+            if tool_calls is not None:
+                message["tool_calls"] = json.loads(tool_calls)
+            if tool_call_id is not None:
+                message["tool_call_id"] = tool_call_id
+            messages.append(message)
+        return messages
+
+    def export(self, output_file, user_id=None, since=None, batch_size=1000):
+        """批量导出为 JSONL，每行一条消息，分批读取不会一次性加载全部数据，返回导出条数"""
+        sql = f"SELECT {', '.join(_COLUMNS)} FROM messages WHERE 1 = 1"
+        params = []
+        if user_id is not None:
+            sql += " AND user_id = ?"
+            params.append(user_id)
+        if since is not None:
+            sql += " AND created_at >= ?"
+            params.append(since)
+        # 导出使用独立的只读连接，WAL 模式下不阻塞写入
+        conn = sqlite3.connect(self.db_path)
+        count = 0
+        try:
+            cursor = conn.execute(sql + " ORDER BY id", params)
+            with open(output_file, "w", encoding="utf-8") as f:
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    for row in rows:
+                        record = dict(zip(_COLUMNS, row))
+                        if record["tool_calls"] is not None:
+                            record["tool_calls"] = json.loads(record["tool_calls"])
+                        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    count += len(rows)
+        finally:
+            conn.close()
+        return count
+
+    def import_json_files(self, directory, user_id=""):
+        """
+        迁移旧的 dialogue-*.json 对话文件，每个文件作为一个会话（会话名为去掉扩展名的文件名），
+        已经导入过的会话跳过，返回导入的消息数
+        """
+        existing = {session for session, _, _ in self.sessions(user_id)}
+        imported = 0
+        for file_path in sorted(glob.glob(os.path.join(directory, "dialogue-*-*-*.json"))):
+            session = os.path.splitext(os.path.basename(file_path))[0]
+            if session in existing:
+                continue
+            try:
+                with open(file_path, "r", encoding="utf-8") as f:
+                    dialogues = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                logger.error(f"读取对话文件失败 {file_path}: {e}")
+                continue
+            match = re.search(r'(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})', session)
+            created_at = datetime.strptime(match.group(1), '%Y-%m-%d %H:%M:%S').timestamp() \
+                if match else os.path.getmtime(file_path)
+            # 旧文件没有每条消息的时间，用会话开始时间加序号保持顺序
+            messages = [dict(m, created_at=created_at + i * 1e-3) for i, m in enumerate(dialogues or [])]
+            imported += self.append_many(session, messages, user_id)
+        logger.info(f"从 {directory} 导入对话消息 {imported} 条")
+        return imported
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="对话存储：导入旧的json对话文件，导出为jsonl")
+    parser.add_argument("command", choices=["import", "export"])
+    parser.add_argument("path", type=str, help="import 时为对话文件目录，export 时为输出文件")
+    parser.add_argument("--db", type=str, default="tmp/conversations.db")
+    parser.add_argument("--user_id", type=str, default=None)
+    args = parser.parse_args()
+
+    store = ConversationStore(args.db)
+    if args.command == "import":
+        print(f"导入 {store.import_json_files(args.path, args.user_id or '')} 条消息")
+    else:
+        print(f"导出 {store.export(args.path, args.user_id)} 条消息")
+    store.close()
@@ -12,6 +12,8 @@ class AbstractTHG(ABC):
         pass
 
 class SadTalker(AbstractTHG):
+    requires = ("modelscope",)
+
     def __init__(self, config):
         """
         初始化 THG（Talking Head Generation）模块。
@@ -0,0 +1,164 @@
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# 一轮对话经过的各个阶段，按先后顺序
+STAGES = [
+    "vad_start",        # VAD 检测到开始说话
+    "vad_end",          # VAD 检测到说话结束
+    "asr_done",         # ASR 识别完成
+    "llm_first_token",  # LLM 返回第一个token
+    "first_segment",    # 第一个分段提交TTS
+    "filler_start",     # 填充语音开始播放（latency_ms 为请求到开始播放的时延）
+    "tts_done",         # 每个分段TTS完成（可能有多个）
+    "first_audio",      # 第一个采样点开始播放
+    "turn_end",         # LLM 回复结束
+]
+
+
+class Tracer:
+    """
+    每轮对话的端到端时延追踪。
+    VAD开始时创建轮次，各阶段调用 mark 记录时间点，轮次结束后以一行 JSON 追加到 trace_file。
+    TTS 和播放在回复结束后还会继续，所以轮次在下一轮开始（或 flush）时才写出。
+    """
+
+    def __init__(self, config=None, session_id=None):
+        config = config or {}
+        self.session_id = session_id
+        self.enabled = config.get("enabled", False)
+        self.trace_file = config.get("trace_file", "tmp/traces.jsonl")
+        self.target_ms = config.get("target_ms", 800)
+        self.lock = threading.Lock()
+        self.turns = {}
+
+    def start_turn(self, turn_id, source="voice", keep=None):
+        """:param keep: 还在回复中的轮次，不写出（用户只是咳嗽或噪音时，上一轮的播放还在继续）"""
+        if not self.enabled:
+            return
+        now = time.time()
+        with self.lock:
+            # 上一轮的TTS和播放到这时已经结束，写出
+            stale = [t for t in self.turns.values() if t["turn_id"] not in (turn_id, keep)]
+            for t in stale:
+                del self.turns[t["turn_id"]]
+            self.turns[turn_id] = {"turn_id": turn_id, "source": source, "start": now, "spans": []}
+            if self.session_id is not None:
+                self.turns[turn_id]["session_id"] = self.session_id
+        self._export(stale)
+        if source == "voice":
+            self.mark(turn_id, "vad_start", at=now)
+
+    def mark(self, turn_id, stage, at=None, once=False, **attrs):
+        """
+        记录某个阶段的时间点，at 为 time.time() 时间戳，默认当前时间；
+        once=True 时只记录该阶段第一次出现的时间点
+        """
+        if not self.enabled:
+            return
+        at = at if at is not None else time.time()
+        with self.lock:
+            turn = self.turns.get(turn_id)
+            if turn is None:
+                return
+            if once and any(span["stage"] == stage for span in turn["spans"]):
+                return
+            span = {"stage": stage, "t": round((at - turn["start"]) * 1000, 1)}
+            if attrs:
+                span.update(attrs)
+            turn["spans"].append(span)
+
+    def flush(self):
+        """写出所有未写出的轮次（退出时调用）"""
+        if not self.enabled:
+            return
+        with self.lock:
+            turns = list(self.turns.values())
+            self.turns.clear()
+        self._export(turns)
+
+    def _export(self, turns):
+        if not turns:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.trace_file) or ".", exist_ok=True)
+            with open(self.trace_file, "a", encoding="utf-8") as f:
+                for turn in turns:
+                    f.write(json.dumps(turn, ensure_ascii=False) + "\n")
+        except Exception as e:
+            logger.error(f"写入trace失败: {e}")
+            return
+        for turn in turns:
+            latency = end_to_end_ms(turn)
+            if latency is not None:
+                logger.info(f"第{turn['turn_id']}轮 端到端时延 {latency:.0f}ms（目标 {self.target_ms}ms）")
+
+
+def _first(turn, stage):
+    for span in turn["spans"]:
+        if span["stage"] == stage:
+            return span["t"]
+    return None
+
+
+def end_to_end_ms(turn):
+    """用户说完（VAD结束，文本输入时为轮次开始）到第一个音频出声的时延"""
+    first_audio = _first(turn, "first_audio")
+    if first_audio is None:
+        return None
+    return first_audio - (_first(turn, "vad_end") or 0)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    if not values:
+        return None
+    index = min(len(values) - 1, max(0, int(round(q / 100 * (len(values) - 1)))))
+    return values[index]
+
+
+def summarize(trace_file):
+    """
+    读取 trace 文件，统计各阶段相对用户说完（vad_end）的时间点的 p50/p95，以及端到端时延
+    """
+    offsets = {stage: [] for stage in STAGES if stage not in ("vad_start", "vad_end")}
+    e2e = []
+    with open(trace_file, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            turn = json.loads(line)
+            origin = _first(turn, "vad_end") or 0
+            for stage in offsets:
+                t = _first(turn, stage)
+                if t is not None:
+                    offsets[stage].append(t - origin)
+            latency = end_to_end_ms(turn)
+            if latency is not None:
+                e2e.append(latency)
+    summary = {stage: {"count": len(values), "p50_ms": percentile(values, 50), "p95_ms": percentile(values, 95)}
+               for stage, values in offsets.items()}
+    summary["end_to_end"] = {"count": len(e2e), "p50_ms": percentile(e2e, 50), "p95_ms": percentile(e2e, 95)}
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="统计每轮对话各阶段时延")
+    parser.add_argument('trace_file', type=str, nargs="?", default="tmp/traces.jsonl")
+    parser.add_argument('--target_ms', type=float, default=800)
+    args = parser.parse_args()
+
+    summary = summarize(args.trace_file)
+    print(f"{'阶段(相对vad_end)':<20} {'count':>6} {'p50_ms':>10} {'p95_ms':>10}")
+    for stage, s in summary.items():
+        p50 = f"{s['p50_ms']:.0f}" if s['p50_ms'] is not None else "-"
+        p95 = f"{s['p95_ms']:.0f}" if s['p95_ms'] is not None else "-"
+        print(f"{stage:<20} {s['count']:>6} {p50:>10} {p95:>10}")
+    p95 = summary["end_to_end"]["p95_ms"]
+    if p95 is not None:
+        print(f"端到端 p95 {p95:.0f}ms，目标 {args.target_ms:.0f}ms：{'达标' if p95 <= args.target_ms else '未达标'}")
@@ -1,18 +1,20 @@
 import asyncio
 import logging
 import os
+import queue
 import subprocess
+import threading
 import time
 import uuid
+import wave
 from abc import ABC, ABCMeta, abstractmethod
+from concurrent.futures import Future
 from datetime import datetime
 
-import ChatTTS
-import edge_tts
-import soundfile as sf
-import torch
-import torchaudio
-from gtts import gTTS
+import numpy as np
+
+from src.pcm import float_to_pcm16
+from src.utils import read_json_file, write_json_file
 
 logger = logging.getLogger(__name__)
 
@@ -20,12 +22,89 @@ logger = logging.getLogger(__name__)
 class AbstractTTS(ABC):
     __metaclass__ = ABCMeta
 
+    # 实现依赖的第三方包，只在创建实例时导入
+    requires = ()
+    # 是否支持流式输出PCM，以及流式输出的采样率
+    supports_stream = False
+    sample_rate = 24000
+    # 批量推理时单批最多的分段数，调度器据此放宽该引擎的并发数
+    batch_size = 1
+
     @abstractmethod
     def to_tts(self, text):
         pass
 
+    def to_tts_stream(self, text):
+        """
+        流式TTS：边合成边产出 16bit 单声道 PCM 字节块，采样率为 self.sample_rate。
+        不支持流式的引擎不需要实现。
+        """
+        raise NotImplementedError(f"{self.__class__.__name__} 不支持流式TTS")
+
+    def cancel(self):
+        """中断正在进行的合成（打断时调用），不支持中断的引擎忽略"""
+        pass
+
+
+class TTSBatcher:
+    """
+    批量TTS前端：把短时间窗口内排队的多个分段合并成一次批量推理。
+    每个分段拿到自己的 Future，结果与提交的文本一一对应，调用方按提交顺序取结果即可保证顺序。
+    """
+
+    def __init__(self, infer_batch, window_ms=50, max_batch_size=8):
+        """
+        :param infer_batch: 批量推理函数，输入文本列表，返回等长的结果列表
+        :param window_ms: 收集分段的时间窗口（毫秒）
+        :param max_batch_size: 单批最多的分段数
+        """
+        self.infer_batch = infer_batch
+        self.window = window_ms / 1000
+        self.max_batch_size = max(1, max_batch_size)
+        self.pending = queue.Queue()
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    def submit(self, text) -> Future:
+        future = Future()
+        self.pending.put((text, future))
+        return future
+
+    def _collect(self):
+        batch = [self.pending.get()]
+        deadline = time.time() + self.window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.pending.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            texts = [text for text, _ in batch]
+            logger.debug(f"TTS批量推理，分段数: {len(texts)}")
+            try:
+                results = list(self.infer_batch(texts))
+                # 结果数量不一致时无法对应到分段，整批按失败处理，保证每个 Future 都有结果
+                if len(results) != len(batch):
+                    raise ValueError(f"批量推理返回 {len(results)} 个结果，分段数为 {len(batch)}")
+            except Exception as e:
+                logger.error(f"TTS批量推理出错: {e}")
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
 
 class GTTS(AbstractTTS):
+    requires = ("gtts",)
+
     def __init__(self, config):
         self.output_file = config.get("output_file")
         self.lang = config.get("lang")
@@ -41,6 +120,7 @@ class GTTS(AbstractTTS):
     def to_tts(self, text):
         tmpfile = self._generate_filename(".aiff")
         try:
+            from gtts import gTTS
             start_time = time.time()
             tts = gTTS(text=text, lang=self.lang)
             tts.save(tmpfile)
@@ -92,28 +172,82 @@ class MacTTS(AbstractTTS):
 
 
 class EdgeTTS(AbstractTTS):
+    """
+    edge-tts 在线TTS。
+    所有请求运行在同一个常驻的后台事件循环上，不再每个分段 asyncio.run 新建/销毁事件循环；
+    多个分段可以并发提交，音频字节边接收边写文件。
+    edge-tts 协议每次合成使用一条 websocket（服务端在 turn.end 后关闭），
+    可复用的只有事件循环和线程，max_concurrency 限制同时在途的连接数。
+    """
+
+    requires = ("edge_tts",)
+
     def __init__(self, config):
+        import edge_tts
+        self.edge_tts = edge_tts
         self.output_file = config.get("output_file", "tmp/")
         self.voice = config.get("voice")
-
-    def _generate_filename(self, extension=".wav"):
+        # 用于压测：指向本地mock服务，如 ws://127.0.0.1:8765/edge?TrustedClientToken=x
+        wss_url = config.get("wss_url")
+        if wss_url:
+            self.edge_tts.communicate.WSS_URL = wss_url
+        self.max_concurrency = config.get("max_concurrency", 4)
+
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.loop_thread.start()
+        self.semaphore = asyncio.run_coroutine_threadsafe(self._create_semaphore(), self.loop).result()
+
+    async def _create_semaphore(self):
+        # Semaphore 需要在后台事件循环内创建
+        return asyncio.Semaphore(self.max_concurrency)
+
+    def _generate_filename(self, extension=".mp3"):
         return os.path.join(self.output_file, f"tts-{datetime.now().date()}@{uuid.uuid4().hex}{extension}")
 
-    def _log_execution_time(self, start_time):
+    def _log_execution_time(self, start_time, first_chunk_time=None):
         end_time = time.time()
         execution_time = end_time - start_time
-        logger.debug(f"Execution Time: {execution_time:.2f} seconds")
+        if first_chunk_time is not None:
+            logger.debug(f"Execution Time: {execution_time:.2f} seconds, first chunk: {first_chunk_time - start_time:.3f} seconds")
+        else:
+            logger.debug(f"Execution Time: {execution_time:.2f} seconds")
 
-    async def text_to_speak(self, text, output_file):
-        communicate = edge_tts.Communicate(text, voice=self.voice)  # Use your preferred voice
-        await communicate.save(output_file)
+    async def _stream_to_queue(self, text, chunks: queue.Queue):
+        try:
+            async with self.semaphore:
+                communicate = self.edge_tts.Communicate(text, voice=self.voice)
+                async for chunk in communicate.stream():
+                    if chunk["type"] == "audio":
+                        chunks.put(chunk["data"])
+        except Exception as e:
+            chunks.put(e)
+        finally:
+            chunks.put(None)
+
+    def stream(self, text):
+        """在后台事件循环上合成，按到达顺序产出 mp3 音频字节"""
+        chunks = queue.Queue()
+        asyncio.run_coroutine_threadsafe(self._stream_to_queue(text, chunks), self.loop)
+        while True:
+            chunk = chunks.get()
+            if chunk is None:
+                return
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
 
     def to_tts(self, text):
-        tmpfile = self._generate_filename(".wav")
+        tmpfile = self._generate_filename(".mp3")
         start_time = time.time()
+        first_chunk_time = None
         try:
-            asyncio.run(self.text_to_speak(text, tmpfile))
-            self._log_execution_time(start_time)
+            with open(tmpfile, "wb") as f:
+                for data in self.stream(text):
+                    if first_chunk_time is None:
+                        first_chunk_time = time.time()
+                    f.write(data)
+            self._log_execution_time(start_time, first_chunk_time)
             return tmpfile
         except Exception as e:
             logger.info(f"Failed to generate TTS file: {e}")
@@ -121,11 +255,36 @@ class EdgeTTS(AbstractTTS):
 
 
 class CHATTTS(AbstractTTS):
+    requires = ("ChatTTS", "torch", "torchaudio")
+    supports_stream = True
+    sample_rate = 24000
+
     def __init__(self, config):
+        import ChatTTS
         self.output_file = config.get("output_file", ".")
         self.chat = ChatTTS.Chat()
-        self.chat.load(compile=False)  # Set to True for better performance
-        self.rand_spk = self.chat.sample_random_speaker()
+        start_time = time.time()
+        self.chat.load(compile=config.get("compile", False))  # compile=True 推理更快，但首次加载更慢
+        logger.info(f"ChatTTS 模型加载耗时: {time.time() - start_time:.2f} 秒")
+
+        # 音色（spk_emb 和文本润色参数）持久化，保证重启后音色不变；采样参数每次从配置读取，修改配置即可生效
+        self.speaker_file = config.get("speaker_file")
+        self.rand_spk, params_refine_text = self._load_speaker(config)
+        self.params = {
+            "temperature": config.get("temperature", .3),
+            "top_P": config.get("top_P", 0.7),
+            "top_K": config.get("top_K", 20),
+            "refine_prompt": params_refine_text["prompt"],
+        }
+
+        if config.get("warmup", True):
+            self.warmup()
+        # 批量推理：batch_window_ms 大于0时，窗口内并发提交的分段合并为一次 infer
+        batch_window_ms = config.get("batch_window_ms", 0)
+        self.batcher = None
+        if batch_window_ms and batch_window_ms > 0:
+            self.batcher = TTSBatcher(self.to_tts_batch, batch_window_ms, config.get("max_batch_size", 8))
+            self.batch_size = self.batcher.max_batch_size
 
     def _generate_filename(self, extension=".wav"):
         return os.path.join(self.output_file, f"tts-{datetime.now().date()}@{uuid.uuid4().hex}{extension}")
@@ -135,43 +294,120 @@ class CHATTTS(AbstractTTS):
         execution_time = end_time - start_time
         logger.debug(f"Execution Time: {execution_time:.2f} seconds")
 
-    def to_tts(self, text):
+    def _load_speaker(self, config):
+        """
+        读取持久化的音色，没有时随机生成；返回 (spk_emb, params_refine_text)。
+        润色参数与 spk_emb 一起保存：配置中写了 refine_prompt 时以配置为准并更新文件，没写时沿用文件中的值
+        """
+        saved = {}
+        if self.speaker_file and os.path.isfile(self.speaker_file):
+            saved = read_json_file(self.speaker_file) or {}
+        spk_emb = saved.get("spk_emb")
+        if spk_emb:
+            logger.info(f"ChatTTS 加载持久化音色: {self.speaker_file}")
+        else:
+            spk_emb = self.chat.sample_random_speaker()
+        params_refine_text = dict(saved.get("params_refine_text") or {})
+        if "refine_prompt" in saved:  # 旧版文件把推理参数平铺保存
+            params_refine_text.setdefault("prompt", saved["refine_prompt"])
+        if "refine_prompt" in config or "prompt" not in params_refine_text:
+            params_refine_text["prompt"] = config.get("refine_prompt", '[oral_2][laugh_0][break_6]')
+        if self.speaker_file and saved != {"spk_emb": spk_emb, "params_refine_text": params_refine_text}:
+            os.makedirs(os.path.dirname(self.speaker_file) or ".", exist_ok=True)
+            write_json_file(self.speaker_file, {"spk_emb": spk_emb, "params_refine_text": params_refine_text})
+            logger.info(f"ChatTTS 音色已保存到: {self.speaker_file}")
+        return spk_emb, params_refine_text
+
+    def warmup(self, text="你好，很高兴认识你。"):
+        """启动时先跑一次推理，避免第一句回复承担模型预热（及 compile）的开销"""
+        start_time = time.time()
+        try:
+            params_infer_code, params_refine_text = self._infer_params()
+            self.chat.infer([text], params_refine_text=params_refine_text, params_infer_code=params_infer_code)
+            logger.info(f"ChatTTS 预热耗时: {time.time() - start_time:.2f} 秒")
+        except Exception as e:
+            logger.error(f"ChatTTS 预热失败: {e}")
+
+    def _infer_params(self):
+        params_infer_code = self.chat.InferCodeParams(
+            spk_emb=self.rand_spk,  # 持久化的音色
+            temperature=self.params["temperature"],
+            top_P=self.params["top_P"],
+            top_K=self.params["top_K"],
+        )
+        params_refine_text = self.chat.RefineTextParams(
+            prompt=self.params["refine_prompt"],
+        )
+        return params_infer_code, params_refine_text
+
+    def cancel(self):
+        # ChatTTS 在推理循环中检查该标记，提前结束当前的 infer
+        self.chat.interrupt()
+
+    def _save_wav(self, wav):
+        import torch
+        import torchaudio
         tmpfile = self._generate_filename(".wav")
+        try:
+            torchaudio.save(tmpfile, torch.from_numpy(wav).unsqueeze(0), 24000)
+        except:
+            torchaudio.save(tmpfile, torch.from_numpy(wav), 24000)
+        return tmpfile
+
+    def to_tts_batch(self, texts):
+        """一次 infer 合成多个分段，返回与 texts 顺序一致的文件路径列表"""
         start_time = time.time()
+        params_infer_code, params_refine_text = self._infer_params()
+        wavs = self.chat.infer(
+            texts,
+            params_refine_text=params_refine_text,
+            params_infer_code=params_infer_code,
+        )
+        tmpfiles = [self._save_wav(wav) for wav in wavs]
+        self._log_execution_time(start_time)
+        return tmpfiles
+
+    def to_tts(self, text):
         try:
-            params_infer_code = ChatTTS.Chat.InferCodeParams(
-                spk_emb=self.rand_spk,  # add sampled speaker
-                temperature=.3,  # using custom temperature
-                top_P=0.7,  # top P decode
-                top_K=20,  # top K decode
-            )
-            params_refine_text = ChatTTS.Chat.RefineTextParams(
-                prompt='[oral_2][laugh_0][break_6]',
-            )
-            wavs = self.chat.infer(
-                [text],
-                params_refine_text=params_refine_text,
-                params_infer_code=params_infer_code,
-            )
-            try:
-                torchaudio.save(tmpfile, torch.from_numpy(wavs[0]).unsqueeze(0), 24000)
-            except:
-                torchaudio.save(tmpfile, torch.from_numpy(wavs[0]), 24000)
-            self._log_execution_time(start_time)
-            return tmpfile
+            if self.batcher is not None:
+                return self.batcher.submit(text).result()
+            return self.to_tts_batch([text])[0]
         except Exception as e:
             logger.error(f"Failed to generate TTS file: {e}")
             return None
 
+    def to_tts_stream(self, text):
+        start_time = time.time()
+        params_infer_code, params_refine_text = self._infer_params()
+        # stream 模式下每次返回新增的音频片段，shape 为 (batch, samples)
+        for wavs in self.chat.infer(
+                [text],
+                stream=True,
+                params_refine_text=params_refine_text,
+                params_infer_code=params_infer_code,
+        ):
+            wav = wavs[0] if wavs is not None and len(wavs) > 0 else None
+            if wav is None or wav.size == 0:
+                continue
+            yield float_to_pcm16(wav)
+        self._log_execution_time(start_time)
 
 
 class KOKOROTTS(AbstractTTS):
+    requires = ("kokoro", "soundfile")
+    supports_stream = True
+    sample_rate = 24000
+
     def __init__(self, config):
         from kokoro import KPipeline
         self.output_file = config.get("output_file", ".")
         self.lang = config.get("lang", "z")
         self.pipeline = KPipeline(lang_code=self.lang)  # <= make sure lang_code matches voice
         self.voice = config.get("voice", "zm_yunyang")
+        self.speed = config.get("speed", 1)
+        self.split_pattern = config.get("split_pattern", r'\n+')
+        # 预分配缓冲区时每个字估算的采样点数（24kHz 下中文约 0.25 秒一个字）
+        self.samples_per_char = int(self.sample_rate * 0.25)
 
     def _generate_filename(self, extension=".wav"):
         return os.path.join(self.output_file, f"tts-{datetime.now().date()}@{uuid.uuid4().hex}{extension}")
@@ -181,23 +417,80 @@ class KOKOROTTS(AbstractTTS):
         execution_time = end_time - start_time
         logger.debug(f"Execution Time: {execution_time:.2f} seconds")
 
+    def _generate(self, text):
+        """逐块产出 float32 音频，KPipeline 本身就是生成器，每块合成完即可使用"""
+        generator = self.pipeline(
+            text, voice=self.voice,  # <= change voice here
+            speed=self.speed, split_pattern=self.split_pattern
+        )
+        for i, (gs, ps, audio) in enumerate(generator):
+            logger.debug(f"KOKOROTTS: i: {i}, gs：{gs}, ps：{ps}")  # i => index
+            if audio is None:
+                continue
+            if hasattr(audio, "detach"):  # torch.Tensor
+                audio = audio.detach().cpu().numpy()
+            yield np.asarray(audio, dtype=np.float32).reshape(-1)
+
     def to_tts(self, text):
         tmpfile = self._generate_filename(".wav")
         start_time = time.time()
         try:
-            generator = self.pipeline(
-                text, voice=self.voice,  # <= change voice here
-                speed=1, split_pattern=r'\n+'
-            )
-            for i, (gs, ps, audio) in enumerate(generator):
-                logger.debug(f"KOKOROTTS: i: {i}, gs：{gs}, ps：{ps}")  # i => index
-                sf.write(tmpfile, audio, 24000)  # save each audio file
+            # 按文本长度预分配缓冲区，所有分块依次拼接后一次写入文件
+            buffer = np.empty(max(len(text), 1) * self.samples_per_char, dtype=np.float32)
+            length = 0
+            for audio in self._generate(text):
+                if length + len(audio) > len(buffer):
+                    buffer = np.resize(buffer, max(len(buffer) * 2, length + len(audio)))
+                buffer[length:length + len(audio)] = audio
+                length += len(audio)
+            if length == 0:
+                logger.error(f"KOKOROTTS 没有生成音频: {text}")
+                return None
+            import soundfile as sf
+            sf.write(tmpfile, buffer[:length], self.sample_rate)
             self._log_execution_time(start_time)
             return tmpfile
         except Exception as e:
             logger.error(f"Failed to generate TTS file: {e}")
             return None
 
+    def to_tts_stream(self, text):
+        start_time = time.time()
+        for audio in self._generate(text):
+            yield float_to_pcm16(audio)
+        self._log_execution_time(start_time)
+
+
+class NullTTS(AbstractTTS):
+    """
+    不依赖模型和系统语音的桩TTS：按字数生成静音，可模拟每个字的合成耗时，用于压测和没有TTS引擎的环境（跨平台、不需要网络）
+    """
+    supports_stream = True
+    sample_rate = 16000
+
+    def __init__(self, config):
+        self.output_file = config.get("output_file", ".")
+        self.char_ms = config.get("char_ms", 200)  # 每个字的音频时长
+        self.synth_ms_per_char = config.get("synth_ms_per_char", 0)  # 每个字模拟的合成耗时
+
+    def _generate_filename(self, extension=".wav"):
+        return os.path.join(self.output_file, f"tts-{datetime.now().date()}@{uuid.uuid4().hex}{extension}")
+
+    def to_tts_stream(self, text):
+        samples_per_char = self.sample_rate * self.char_ms // 1000
+        for _ in text:
+            time.sleep(self.synth_ms_per_char / 1000)
+            yield bytes(samples_per_char * 2)
+
+    def to_tts(self, text):
+        tmpfile = self._generate_filename(".wav")
+        os.makedirs(os.path.dirname(tmpfile) or ".", exist_ok=True)
+        with wave.open(tmpfile, "wb") as wf:
+            wf.setnchannels(1)
+            wf.setsampwidth(2)
+            wf.setframerate(self.sample_rate)
+            wf.writeframes(b"".join(self.to_tts_stream(text)))
+        return tmpfile
 
 
 def create_instance(class_name, *args, **kwargs):
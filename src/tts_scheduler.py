@@ -0,0 +1,313 @@
+import collections
+import contextlib
+import logging
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+def scheduler_config(config, engine, batch_size=1):
+    """
+    返回调度器配置：引擎开启批量推理时，并发数至少为单批分段数，否则凑不成批；
+    未开启时按配置（同一模型并发推理会互相争抢，CHATTTS 默认为1）
+    """
+    config = dict(config or {})
+    if batch_size > 1:
+        engine_concurrency = dict(config.get("engine_concurrency") or {})
+        limit = engine_concurrency.get(engine, config.get("default_concurrency", 2))
+        engine_concurrency[engine] = max(limit, batch_size)
+        config["engine_concurrency"] = engine_concurrency
+    return config
+
+
+def engine_gate(gates, config, engine):
+    """取引擎的并发限制，没有时按配置创建；多会话和填充语音预渲染共用同一个 gates"""
+    gate = gates.get(engine)
+    if gate is None:
+        config = config or {}
+        limit = (config.get("engine_concurrency") or {}).get(engine, config.get("default_concurrency", 2))
+        # setdefault 是原子的，多个调度器同时创建也只会保留一个
+        gate = gates.setdefault(engine, EngineGate(limit))
+    return gate
+
+
+class EngineGate:
+    """
+    一个TTS引擎的并发限制。分段先在这里排队，拿到名额后才提交到线程池，
+    等待中的分段不占用线程，慢引擎的积压不会占满线程池、拖住其他引擎。
+    多会话共享时按会话轮流分配名额，一个会话积压的分段不会让其他会话一直等待。
+    """
+
+    def __init__(self, limit):
+        self.limit = max(1, limit)
+        self.cond = threading.Condition()
+        # 已经拿到名额的分段（提交到线程池或正在合成）
+        self.running = set()
+        # 各会话等待名额的 (分段, 开始函数)，按会话轮流取出
+        self.pending = collections.OrderedDict()
+        # 低优先级占用的名额（填充语音预渲染）
+        self.reserved = 0
+
+    def dispatch(self, job, start):
+        """有空闲名额时立即调用 start(job)（提交到线程池），否则排队"""
+        with self.cond:
+            self.pending.setdefault(job.owner, collections.deque()).append((job, start))
+            ready = self._take_ready()
+        for job, start in ready:
+            start(job)
+
+    def release(self, job):
+        """分段合成结束或被丢弃，名额交给下一个排队的分段"""
+        with self.cond:
+            self.running.discard(job)
+            ready = self._take_ready()
+            self.cond.notify_all()
+        for job, start in ready:
+            start(job)
+
+    def _take_ready(self):
+        ready = []
+        while self.pending and len(self.running) + self.reserved < self.limit:
+            owner, queue = next(iter(self.pending.items()))
+            job, start = queue.popleft()
+            # 取出一个后该会话排到最后
+            del self.pending[owner]
+            if queue:
+                self.pending[owner] = queue
+            if job.dropped:
+                continue
+            self.running.add(job)
+            ready.append((job, start))
+        return ready
+
+    @contextlib.contextmanager
+    def idle_slot(self):
+        """低优先级占用一个名额：引擎没有分段在合成或排队时才拿到"""
+        with self.cond:
+            while self.running or self.pending or self.reserved >= self.limit:
+                self.cond.wait(timeout=1)
+            self.reserved += 1
+        try:
+            yield
+        finally:
+            with self.cond:
+                self.reserved -= 1
+                ready = self._take_ready()
+                self.cond.notify_all()
+            for job, start in ready:
+                start(job)
+
+    def busy(self):
+        with self.cond:
+            return bool(self.running or self.pending)
+
+
+class TTSJob:
+    """一个待合成的分段，记录排队时间和合成时间"""
+
+    def __init__(self, turn_id, seq, engine, text, owner=None):
+        self.turn_id = turn_id
+        self.seq = seq
+        self.engine = engine
+        self.text = text
+        # 提交分段的调度器（会话）
+        self.owner = owner
+        self.submit_time = time.time()
+        self.start_time = None
+        self.end_time = None
+        self.result = None
+        self.dropped = False
+        self.ready = threading.Event()
+
+    def publish(self, result):
+        """
+        交付结果给播放线程。合成函数可以在合成结束前提前调用（如流式TTS交付PCMStream），
+        否则由调度器在合成结束后调用。
+        """
+        if not self.ready.is_set():
+            self.result = result
+            self.ready.set()
+
+    def drop(self):
+        self.dropped = True
+        self.ready.set()
+
+    @property
+    def queue_ms(self):
+        if self.start_time is None:
+            return None
+        return (self.start_time - self.submit_time) * 1000
+
+    @property
+    def synth_ms(self):
+        if self.start_time is None or self.end_time is None:
+            return None
+        return (self.end_time - self.start_time) * 1000
+
+
+class TTSScheduler:
+    """
+    TTS专用调度器：
+    - 独立的线程池，不与 chat 等任务共用；
+    - 按引擎限制并发数（如 CHATTTS 同一模型并发推理会互相争抢），分段拿到名额后才占用线程；
+    - 按提交顺序交付，交付线程只等待队首分段，不再逐个 future.result 阻塞；
+    - 新一轮对话开始时丢弃旧轮次尚未播放的分段。
+    """
+
+    def __init__(self, config, on_ready, on_done=None, executor=None, gates=None):
+        """
+        :param config: 配置，max_workers 线程数，engine_concurrency 各引擎的并发上限
+        :param on_ready: 交付回调 on_ready(job, result)，按提交顺序调用
+        :param on_done: 分段合成结束回调 on_done(job)，在合成线程中调用
+        :param executor: 多会话共享的线程池，为空时自己创建
+        :param gates: 多会话共享的各引擎并发限制（EngineGate），为空时自己创建
+        """
+        config = config or {}
+        self.own_executor = executor is None
+        self.executor = executor or ThreadPoolExecutor(max_workers=config.get("max_workers", 4),
+                                                       thread_name_prefix="tts")
+        self.config = config
+        self.gates = gates if gates is not None else {}
+        self.on_ready = on_ready
+        self.on_done = on_done
+
+        self.lock = threading.Lock()
+        self.jobs = collections.deque()
+        self.has_jobs = threading.Condition(self.lock)
+        self.seq = 0
+        self.current_turn = None
+        # 被打断的轮次，之后提交的分段直接丢弃
+        self.cancelled_turns = set()
+        # 正在合成的分段（包括已经提前交付的流式分段）
+        self.active = set()
+
+        # 最近的排队/合成耗时，用于统计
+        self.queue_ms = collections.deque(maxlen=200)
+        self.synth_ms = collections.deque(maxlen=200)
+
+        self._stop_event = threading.Event()
+        self.delivery_thread = threading.Thread(target=self._deliver, daemon=True)
+        self.delivery_thread.start()
+
+    def _gate(self, engine):
+        return engine_gate(self.gates, self.config, engine)
+
+    def begin_turn(self, turn_id):
+        """开始新一轮对话，丢弃旧轮次还未交付的分段"""
+        with self.lock:
+            self.current_turn = turn_id
+            # 旧轮次提交的分段已经按轮次丢弃，不再需要记录它们是否被打断
+            self.cancelled_turns = {t for t in self.cancelled_turns if t >= turn_id}
+            dropped = 0
+            for job in self.jobs:
+                if job.turn_id != turn_id and not job.dropped:
+                    job.drop()
+                    dropped += 1
+        if dropped:
+            logger.info(f"新一轮对话 {turn_id}，丢弃旧轮次分段 {dropped} 个")
+
+    def cancel_turn(self, turn_id):
+        """
+        打断某轮对话：丢弃该轮未开始的分段，并标记正在合成的分段（合成函数检查 job.dropped 提前结束，
+        结果不再交付）。返回 {"pending": 未开始的数量, "running": 合成中的数量}
+        """
+        pending = running = 0
+        with self.lock:
+            self.cancelled_turns.add(turn_id)
+            for job in list(self.jobs) + list(self.active):
+                if job.turn_id != turn_id or job.dropped:
+                    continue
+                if job in self.active:
+                    running += 1
+                else:
+                    pending += 1
+                job.drop()
+        return {"pending": pending, "running": running}
+
+    def owns_engine(self, engine):
+        """引擎正在合成的分段是否都属于本调度器（会话），是时才能中断共享的模型，不影响其他会话"""
+        gate = self._gate(engine)
+        with gate.cond:
+            running = list(gate.running)
+        return all(job.owner is self for job in running)
+
+    def submit(self, turn_id, engine, fn, text) -> TTSJob:
+        """
+        提交分段。fn(text, job) 执行合成并返回交付给播放器的结果。
+        """
+        with self.lock:
+            self.seq += 1
+            job = TTSJob(turn_id, self.seq, engine, text, owner=self)
+            if turn_id in self.cancelled_turns or \
+                    (self.current_turn is not None and turn_id != self.current_turn):
+                job.drop()
+            self.jobs.append(job)
+            self.has_jobs.notify()
+        if not job.dropped:
+            self._gate(engine).dispatch(job, lambda job: self.executor.submit(self._run, job, fn))
+        return job
+
+    def _run(self, job: TTSJob, fn):
+        gate = self._gate(job.engine)
+        if job.dropped:
+            gate.release(job)
+            return
+        job.start_time = time.time()
+        with self.lock:
+            self.active.add(job)
+        result = None
+        try:
+            result = fn(job.text, job)
+        except Exception as e:
+            logger.error(f"TTS 任务出错: {e}")
+        finally:
+            job.end_time = time.time()
+            with self.lock:
+                self.active.discard(job)
+            gate.release(job)
+            job.publish(result)
+        self.queue_ms.append(job.queue_ms)
+        self.synth_ms.append(job.synth_ms)
+        logger.debug(f"TTS[{job.engine}] 排队 {job.queue_ms:.0f}ms，合成 {job.synth_ms:.0f}ms：{job.text}")
+        if self.on_done is not None:
+            self.on_done(job)
+
+    def _deliver(self):
+        while not self._stop_event.is_set():
+            with self.lock:
+                while not self.jobs and not self._stop_event.is_set():
+                    self.has_jobs.wait(timeout=1)
+                if self._stop_event.is_set():
+                    return
+                job = self.jobs[0]
+            job.ready.wait()
+            with self.lock:
+                self.jobs.popleft()
+            if job.dropped or job.result is None:
+                continue
+            try:
+                self.on_ready(job, job.result)
+            except Exception as e:
+                logger.error(f"TTS 交付出错: {e}")
+
+    def stats(self):
+        """最近分段的排队和合成耗时中位数（毫秒）"""
+        queue_ms = [v for v in self.queue_ms if v is not None]
+        synth_ms = [v for v in self.synth_ms if v is not None]
+        return {
+            "queue_ms_p50": statistics.median(queue_ms) if queue_ms else None,
+            "synth_ms_p50": statistics.median(synth_ms) if synth_ms else None,
+            "pending": len(self.jobs),
+        }
+
+    def shutdown(self):
+        self._stop_event.set()
+        with self.lock:
+            for job in self.jobs:
+                job.drop()
+            self.has_jobs.notify_all()
+        if self.own_executor:
+            self.executor.shutdown(wait=False)
@@ -3,7 +3,6 @@ import json
 import os
 import re
 import subprocess
-import cv2
 import time
 from pathlib import Path
 from datetime import datetime
@@ -43,6 +42,34 @@ def is_segment(tokens):
     else:
         return False
 
+class Segmenter:
+    """
+    流式回复按句切分：每个token调用 feed，凑成一句时返回该句，否则返回 None；结束时 flush 取剩余部分。
+    tokens 为已经收到的全部token
+    """
+
+    def __init__(self):
+        self.tokens = []
+        self.start = 0
+
+    def feed(self, token):
+        self.tokens.append(token)
+        if not is_segment(self.tokens):
+            return None
+        segment_text = "".join(self.tokens[self.start:])
+        # 为了保证语音的连贯，至少2个字才转tts
+        if len(segment_text) <= max(2, self.start):
+            return None
+        self.start = len(self.tokens)
+        return segment_text
+
+    def flush(self):
+        if self.start >= len(self.tokens):
+            return None
+        segment_text = "".join(self.tokens[self.start:])
+        self.start = len(self.tokens)
+        return segment_text
+
 def is_interrupt(query: str):
     for interrupt_word in ("停一下", "听我说", "不要说了", "stop", "hold on", "excuse me"):
         if query.lower().find(interrupt_word)>=0:
@@ -83,6 +110,7 @@ def merge_frames_with_audio(audio_path, fps=25):
 
 
 def get_video_duration(video_path):
+    import cv2
     print(cv2.__version__)
     cap = cv2.VideoCapture(video_path)
     fps = cap.get(cv2.CAP_PROP_FPS)
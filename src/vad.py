@@ -1,3 +1,4 @@
+import copy
 import os
 import uuid
 import wave
@@ -6,8 +7,6 @@ import logging
 from datetime import datetime
 
 import numpy as np
-import torch
-from silero_vad import load_silero_vad, VADIterator
 
 logger = logging.getLogger(__name__)
 
@@ -20,20 +19,49 @@ class VAD(ABC):
     def reset_states(self):
         pass
 
+    def new_session(self):
+        """返回一个状态独立的实例给新会话使用，无状态的实现直接返回自身"""
+        return self
+
 
 class SileroVAD(VAD):
+    requires = ("torch", "silero_vad")
+
     def __init__(self, config):
         print("SileroVAD", config)
-        self.model = load_silero_vad()
+        import torch
+        from silero_vad import load_silero_vad, VADIterator
+        self.torch = torch
+        self.VADIterator = VADIterator
+        # ONNX 版本的循环状态保存在 Python 对象中，推理会话可以在会话之间共享
+        self.onnx = bool(config.get("onnx", False))
+        self.model = load_silero_vad(onnx=self.onnx)
         self.sampling_rate = config.get("sampling_rate")
         self.threshold = config.get("threshold")
         self.min_silence_duration_ms = config.get("min_silence_duration_ms")
-        self.vad_iterator = VADIterator(self.model,
-                            threshold=self.threshold,
-                            sampling_rate=self.sampling_rate,
-                            min_silence_duration_ms=self.min_silence_duration_ms)
+        self.vad_iterator = self.VADIterator(self.model,
+                                             threshold=self.threshold,
+                                             sampling_rate=self.sampling_rate,
+                                             min_silence_duration_ms=self.min_silence_duration_ms)
         logger.debug(f"VAD Iterator initialized with model {self.model}")
 
+    def new_session(self):
+        """
+        Silero 模型保存了循环状态，不能在会话之间直接共享：
+        ONNX 版本只复制状态（几KB），共用推理会话；JIT 版本的状态在模型内部，每个会话复制一份模型（约2MB）
+        """
+        session = copy.copy(self)
+        if self.onnx:
+            session.model = copy.copy(self.model)
+            session.model.reset_states()
+        else:
+            session.model = copy.deepcopy(self.model)
+        session.vad_iterator = self.VADIterator(session.model,
+                                                threshold=self.threshold,
+                                                sampling_rate=self.sampling_rate,
+                                                min_silence_duration_ms=self.min_silence_duration_ms)
+        return session
+
     @staticmethod
     def int2float(sound):
         """
@@ -46,7 +74,7 @@ class SileroVAD(VAD):
         try:
             audio_int16 = np.frombuffer(data, dtype=np.int16)
             audio_float32 = self.int2float(audio_int16)
-            vad_output = self.vad_iterator(torch.from_numpy(audio_float32))
+            vad_output = self.vad_iterator(self.torch.from_numpy(audio_float32))
             if vad_output is not None:
                 logger.debug(f"VAD output: {vad_output}")
             return vad_output
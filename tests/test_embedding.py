@@ -0,0 +1,50 @@
+import sqlite3
+
+import numpy as np
+import pytest
+
+from src import embedding
+
+
+class FakeModel:
+    """按字符计数的确定性向量，记录每次计算的文本"""
+
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, texts, **kwargs):
+        self.calls.append(list(texts))
+        vectors = np.zeros((len(texts), 8), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for char in text:
+                vectors[row, ord(char) % 8] += 1
+        return vectors
+
+
+def _rows(cache_file):
+    with sqlite3.connect(cache_file) as conn:
+        return conn.execute("SELECT COUNT(*) FROM vectors").fetchone()[0]
+
+
+def test_queries_are_not_persisted(tmp_path):
+    cache_file = str(tmp_path / "cache.db")
+    service = embedding.EmbeddingService({"cache_file": cache_file})
+    service.model = FakeModel()
+    service.embed_documents(["大额存单", "国债"])
+    service.embed_query("国债可以提前赎回吗")
+    service.embed_query("国债可以提前赎回吗")
+    assert _rows(cache_file) == 2
+    # 重复的查询命中内存缓存，只计算一次
+    assert service.model.calls == [["大额存单", "国债"], [service.query_instruction + "国债可以提前赎回吗"]]
+    service.close()
+
+
+def test_shared_service_rejects_conflicting_options(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding, "_services", {})
+    config = {"emb_model": "fake", "cache_file": str(tmp_path / "cache.db"), "batch_size": 32}
+    service = embedding.get_service(config)
+    assert embedding.get_service({"emb_model": "fake"}) is service
+    assert embedding.get_service(dict(config)) is service
+    with pytest.raises(ValueError):
+        embedding.get_service({"emb_model": "fake", "batch_size": 8})
+    service.close()
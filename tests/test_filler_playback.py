@@ -0,0 +1,40 @@
+import threading
+import time
+
+from src.pcm import PCMStream
+from src.player import NullPlayer
+from src.tts_scheduler import TTSScheduler
+
+
+def test_filler_plays_ahead_of_segments_waiting_for_the_engine():
+    """填充语音直接交给播放器，不等待被占满的引擎名额，且先于排队的分段播放"""
+    player = NullPlayer()
+    played = []
+    release = threading.Event()
+
+    def on_ready(job, result):
+        result.on_start = lambda at: played.append(result.text)
+        player.play_stream(result, job.turn_id)
+
+    scheduler = TTSScheduler({"max_workers": 2, "engine_concurrency": {"CHATTTS": 1}}, on_ready)
+    for i in range(3):
+        scheduler.submit(1, "CHATTTS", lambda t, job: (release.wait(2), PCMStream.from_pcm(b"\0" * 320, 16000, t))[1],
+                         f"segment{i}")
+
+    requested = time.time()
+    started = []
+    filler = PCMStream.from_pcm(b"\0" * 320, 16000, "filler")
+    filler.on_start = lambda at: (started.append(at - requested), played.append("filler"))
+    player.play_stream(filler, 1)
+
+    deadline = time.time() + 1
+    while not started and time.time() < deadline:
+        time.sleep(0.001)
+    assert started and started[0] < 0.05
+    release.set()
+    deadline = time.time() + 2
+    while len(played) < 4 and time.time() < deadline:
+        time.sleep(0.005)
+    assert played == ["filler", "segment0", "segment1", "segment2"]
+    scheduler.shutdown()
+    player.shutdown()
@@ -0,0 +1,32 @@
+import numpy as np
+
+from src.long_memory import LongTermMemory
+
+
+class FakeEmbeddingService:
+    """按字符计数的确定性向量，归一化后与 EmbeddingService 的接口一致"""
+
+    def _vector(self, text):
+        vector = np.zeros(16, dtype=np.float32)
+        for char in text:
+            vector[ord(char) % 16] += 1
+        return vector / (np.linalg.norm(vector) or 1)
+
+    def encode(self, texts, query=False):
+        return np.stack([self._vector(text) for text in texts])
+
+    def embed_query(self, text):
+        return self._vector(text).tolist()
+
+
+def test_add_then_search(tmp_path):
+    config = {"index_dir": str(tmp_path), "min_score": 0.1}
+    memory = LongTermMemory(config, FakeEmbeddingService())
+    assert memory.add("dialogue-1", ["用户喜欢低风险理财", "用户在准备雅思考试"]) == 2
+    assert memory.search("低风险理财")[0] == "用户喜欢低风险理财"
+
+    # 重新加载后仍能检索，同一会话再次写入时替换旧的事实
+    reloaded = LongTermMemory(config, FakeEmbeddingService())
+    assert len(reloaded.facts) == 2
+    assert reloaded.add("dialogue-1", ["用户在准备雅思考试"]) == 1
+    assert reloaded.search("雅思") == ["用户在准备雅思考试"]
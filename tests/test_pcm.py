@@ -0,0 +1,48 @@
+import math
+import struct
+
+import numpy as np
+
+from src.pcm import load_pcm
+
+
+def _extended(value):
+    """80 位扩展精度浮点数（只处理正数）"""
+    exponent = math.frexp(value)[1] - 1
+    mantissa = int(value * 2 ** (63 - exponent))
+    return struct.pack(">HQ", exponent + 16383, mantissa)
+
+
+def _chunk(chunk_id, body):
+    return chunk_id + struct.pack(">I", len(body)) + body + (b"\0" if len(body) & 1 else b"")
+
+
+def write_aiff(file_path, samples, sample_rate, comptype=None):
+    """写 16bit 单声道 AIFF；comptype 为 b"sowt" 时写小端序的 AIFC"""
+    comm = struct.pack(">hIh", 1, len(samples), 16) + _extended(sample_rate)
+    if comptype is None:
+        form, pcm = b"AIFF", samples.astype(">i2").tobytes()
+    else:
+        form, pcm = b"AIFC", samples.astype("<i2").tobytes()
+        comm += comptype + b"\x0bnot compressed"  # 名称为 pascal 字符串，补齐到偶数长度
+    chunks = _chunk(b"COMM", comm) + _chunk(b"SSND", struct.pack(">II", 0, 0) + pcm)
+    with open(file_path, "wb") as f:
+        f.write(b"FORM" + struct.pack(">I", 4 + len(chunks)) + form + chunks)
+
+
+def test_load_big_endian_aiff(tmp_path):
+    samples = np.array([0, 1, -1, 1000, -32768, 32767], dtype=np.int16)
+    file_path = str(tmp_path / "say.aiff")
+    write_aiff(file_path, samples, 22050)
+    pcm, sample_rate = load_pcm(file_path)
+    assert sample_rate == 22050
+    assert np.array_equal(np.frombuffer(pcm, dtype=np.int16), samples)
+
+
+def test_load_little_endian_aifc(tmp_path):
+    samples = np.arange(-5, 5, dtype=np.int16) * 300
+    file_path = str(tmp_path / "say.aif")
+    write_aiff(file_path, samples, 16000, comptype=b"sowt")
+    pcm, sample_rate = load_pcm(file_path)
+    assert sample_rate == 16000
+    assert np.array_equal(np.frombuffer(pcm, dtype=np.int16), samples)
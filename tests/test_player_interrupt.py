@@ -0,0 +1,57 @@
+import time
+
+from src.pcm import PCMStream
+from src.player import NullPlayer
+
+
+class RecordingPlayer(NullPlayer):
+    """每个缓冲块模拟 5ms 的实时播放，记录播放过的块"""
+
+    def __init__(self):
+        self.frames = []
+        super().__init__()
+
+    def do_playing_stream(self, stream: PCMStream):
+        for data in self._iter_frames(stream, frames=1):
+            self.frames.append((stream.text, data))
+            time.sleep(0.005)
+
+
+def wait_idle(player, timeout=2):
+    deadline = time.time() + timeout
+    while player.get_playing_status() and time.time() < deadline:
+        time.sleep(0.005)
+
+
+def test_late_segment_of_interrupted_turn_is_dropped():
+    player = RecordingPlayer()
+    player.play_stream(PCMStream.from_pcm(b"\1\0" * 50, 16000, "old"), 1)
+    time.sleep(0.02)
+    player.stop(1)
+    # 打断后才到达的同一轮分段不再播放，也不会让打断失效；新一轮正常播放
+    player.play_stream(PCMStream.from_pcm(b"\2\0" * 5, 16000, "late"), 1)
+    player.play_stream(PCMStream.from_pcm(b"\3\0" * 5, 16000, "next"), 2)
+    wait_idle(player)
+    texts = [text for text, _ in player.frames]
+    assert "late" not in texts
+    assert texts.count("next") == 5
+    assert texts.count("old") < 50
+    player.shutdown()
+
+
+def test_stop_discards_chunks_buffered_in_the_stream():
+    player = RecordingPlayer()
+    stream = PCMStream(16000, "buffered")
+    for i in range(20):
+        stream.write(bytes([i, 0]))
+    player.play_stream(stream, 1)
+    time.sleep(0.012)
+    played_before = len(player.frames)
+    player.stop(1)
+    player.play_stream(PCMStream.from_pcm(b"\3\0" * 2, 16000, "next"), 2)
+    wait_idle(player)
+    buffered = [data for text, data in player.frames if text == "buffered"]
+    # 最多再输出打断时正在写的这一块
+    assert len(buffered) <= played_before + 1 < 20
+    assert [text for text, _ in player.frames].count("next") == 2
+    player.shutdown()
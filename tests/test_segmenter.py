@@ -0,0 +1,18 @@
+from src.utils import Segmenter
+
+
+def test_segments_at_punctuation_and_flushes_rest():
+    segmenter = Segmenter()
+    segments = [segmenter.feed(token) for token in ["你好", "，", "我是", "阿雅", "。", "有什么", "问题"]]
+    assert [s for s in segments if s is not None] == ["你好，", "我是阿雅。"]
+    assert segmenter.flush() == "有什么问题"
+    assert segmenter.flush() is None
+    assert "".join(segmenter.tokens) == "你好，我是阿雅。有什么问题"
+
+
+def test_short_segment_waits_for_more_text():
+    segmenter = Segmenter()
+    assert segmenter.feed("好") is None
+    assert segmenter.feed("。") is None
+    assert segmenter.feed("没问题") is None
+    assert segmenter.feed("。") == "好。没问题。"
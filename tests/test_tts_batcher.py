@@ -0,0 +1,17 @@
+import pytest
+
+from src.tts import TTSBatcher
+
+
+def test_short_result_fails_every_future():
+    batcher = TTSBatcher(lambda texts: texts[:-1], window_ms=200, max_batch_size=2)
+    futures = [batcher.submit("一"), batcher.submit("二")]
+    for future in futures:
+        with pytest.raises(ValueError):
+            future.result(timeout=2)
+
+
+def test_results_follow_submit_order():
+    batcher = TTSBatcher(lambda texts: [f"{text}.wav" for text in texts], window_ms=200, max_batch_size=2)
+    futures = [batcher.submit("一"), batcher.submit("二")]
+    assert [future.result(timeout=2) for future in futures] == ["一.wav", "二.wav"]
@@ -0,0 +1,122 @@
+import threading
+import time
+
+from src.tts_scheduler import TTSScheduler
+
+
+class Recorder:
+    """收集按顺序交付的结果"""
+
+    def __init__(self):
+        self.results = []
+        self.lock = threading.Lock()
+
+    def on_ready(self, job, result):
+        with self.lock:
+            self.results.append(result)
+
+    def wait_for(self, count, timeout=2):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            with self.lock:
+                if len(self.results) >= count:
+                    return list(self.results)
+            time.sleep(0.005)
+        return list(self.results)
+
+
+def test_delivers_in_submit_order():
+    recorder = Recorder()
+    scheduler = TTSScheduler({"default_concurrency": 3}, recorder.on_ready)
+    delays = {"一": 0.15, "二": 0.05, "三": 0.0}
+    for text, delay in delays.items():
+        scheduler.submit(1, "X", lambda t, job: (time.sleep(delays[t]), t)[1], text)
+    assert recorder.wait_for(3) == ["一", "二", "三"]
+    scheduler.shutdown()
+
+
+def test_engine_concurrency_limit():
+    recorder = Recorder()
+    scheduler = TTSScheduler({"max_workers": 8, "engine_concurrency": {"X": 2}}, recorder.on_ready)
+    lock = threading.Lock()
+    state = {"running": 0, "peak": 0}
+
+    def synth(text, job):
+        with lock:
+            state["running"] += 1
+            state["peak"] = max(state["peak"], state["running"])
+        time.sleep(0.03)
+        with lock:
+            state["running"] -= 1
+        return text
+
+    for i in range(6):
+        scheduler.submit(1, "X", synth, str(i))
+    assert len(recorder.wait_for(6)) == 6
+    assert state["peak"] == 2
+    scheduler.shutdown()
+
+
+def test_slow_engine_does_not_hold_the_pool():
+    """慢引擎排队的分段不占用线程，其他引擎的分段照常合成"""
+    recorder = Recorder()
+    scheduler = TTSScheduler({"max_workers": 2, "engine_concurrency": {"Slow": 1, "Fast": 1}}, lambda job, r: None)
+    release = threading.Event()
+    for i in range(4):
+        scheduler.submit(1, "Slow", lambda t, job: (release.wait(2), t)[1], f"slow{i}")
+    done = threading.Event()
+    scheduler.submit(1, "Fast", lambda t, job: (done.set(), t)[1], "fast")
+    assert done.wait(1)
+    release.set()
+    scheduler.shutdown()
+
+
+def test_cancel_turn_drops_pending_and_running():
+    recorder = Recorder()
+    scheduler = TTSScheduler({"engine_concurrency": {"X": 1}}, recorder.on_ready)
+    started = threading.Event()
+
+    def synth(text, job):
+        started.set()
+        while not job.dropped:
+            time.sleep(0.005)
+        return text
+
+    scheduler.submit(1, "X", synth, "running")
+    scheduler.submit(1, "X", synth, "pending")
+    assert started.wait(1)
+    assert scheduler.cancel_turn(1) == {"pending": 1, "running": 1}
+    # 被打断轮次之后提交的分段直接丢弃，新一轮正常交付
+    assert scheduler.submit(1, "X", synth, "late").dropped
+    scheduler.begin_turn(2)
+    scheduler.submit(2, "X", lambda t, job: t, "next")
+    assert recorder.wait_for(1) == ["next"]
+    time.sleep(0.05)
+    assert recorder.results == ["next"]
+    scheduler.shutdown()
+
+
+def test_sessions_share_engine_slots_in_turn():
+    """两个会话共用一个引擎：先积压的会话不会让另一个会话排到它的全部分段之后"""
+    gates = {}
+    order = []
+    release = threading.Event()
+    config = {"engine_concurrency": {"X": 1}}
+
+    def synth(text, job):
+        release.wait(2)
+        order.append(text)
+        return text
+
+    first = TTSScheduler(config, lambda job, r: None, gates=gates)
+    second = TTSScheduler(config, lambda job, r: None, gates=gates)
+    for i in range(4):
+        first.submit(1, "X", synth, f"a{i}")
+    second.submit(1, "X", synth, "b0")
+    release.set()
+    deadline = time.time() + 2
+    while len(order) < 5 and time.time() < deadline:
+        time.sleep(0.005)
+    assert order.index("b0") <= 2
+    first.shutdown()
+    second.shutdown()